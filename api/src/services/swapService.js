@@ -33,6 +33,11 @@ function sleep(ms) {
 }
 
 function shouldRetrySwapRequest(err) {
+  const status = err?.response?.status;
+  if (status === 503 || status === 429) {
+    // Inference is at capacity; retryDelayMs() honours its Retry-After.
+    return true;
+  }
   const code = String(err?.code || "").toUpperCase();
   const message = String(err?.message || "").toLowerCase();
 
@@ -45,6 +50,14 @@ function shouldRetrySwapRequest(err) {
   return false;
 }
 
+function retryDelayMs(err) {
+  const retryAfter = Number(err?.response?.headers?.["retry-after"]);
+  if (Number.isFinite(retryAfter) && retryAfter > 0) {
+    return Math.max(SWAP_RETRY_DELAY_MS, retryAfter * 1000);
+  }
+  return SWAP_RETRY_DELAY_MS;
+}
+
 async function runSwapRemote(
   modelBytes,
   imageBytes,
@@ -99,8 +112,9 @@ async function runSwapRemote(
         `[WARN] POST /swap upstream request failed (attempt ${attempt + 1}/${SWAP_MAX_RETRIES + 1}): ${err?.message || err
         }`
       );
-      if (SWAP_RETRY_DELAY_MS > 0) {
-        await sleep(SWAP_RETRY_DELAY_MS);
+      const delayMs = retryDelayMs(err);
+      if (delayMs > 0) {
+        await sleep(delayMs);
       }
     }
   }
@@ -200,6 +214,10 @@ export async function triggerVideoSwap({
   if (callbackToken) {
     form.append("callback_token", callbackToken);
   }
+  if (generatedVideoId) {
+    // Lets inference resume from its last checkpoint when this job is retried.
+    form.append("idempotency_key", `generated-video:${generatedVideoId}`);
+  }
   form.append("storage_key", storageKey);
   form.append("storage_repo", HF_STORAGE_REPO);
   form.append("storage_repo_type", HF_STORAGE_REPO_TYPE);
@@ -0,0 +1,215 @@
+"""Time the video swap driver across executors, worker counts and batch sizes.
+
+Runs `swap_video_frames` in-process over the first frames of one clip for
+every (executor, workers, batch size) combination and prints frames per
+second plus the speedup over the first cell (thread executor, 1 worker, batch
+size 1 by default) - the same grid as the `MAX_AUTO_WORKERS` comment in
+service/video_swap.py, with one row per batch size and one grid per executor.
+Detection runs in its own stage as it does in the API. Output frames are
+discarded, so encoding cost is not included.
+
+Usage:
+
+    python -m eval.bench_video --video clip.mp4 --source face.jpg \
+                               [--executors thread process] \
+                               [--workers 1 2 4] [--batch-sizes 1 2 4] \
+                               [--frames 120] [--restore] [--swap-model hyperswap_256]
+
+The process executor starts its worker pool, and loads models in it, before
+each timed run; only the swap itself is timed.
+
+Run it on an otherwise idle machine; concurrent load skews the numbers.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from functools import partial
+from pathlib import Path
+from time import perf_counter
+from typing import List
+
+import cv2
+from PIL import Image
+
+# Allow both `python -m eval.bench_video` from inference/ and a direct path run.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from service.face_swap import (  # noqa: E402
+    SWAP_MODEL_INSWAPPER,
+    VALID_SWAP_MODELS,
+    FaceSwapService,
+)
+from service.model_registry import get_model_registry  # noqa: E402
+from service.video_process_pool import (  # noqa: E402
+    VIDEO_EXECUTOR_PROCESS,
+    VIDEO_EXECUTOR_THREAD,
+    get_process_swap_pool,
+    shutdown_process_swap_pool,
+)
+from service.video_swap import resolve_detect_worker_count, swap_video_frames  # noqa: E402
+
+
+class FrameLimitedCapture:
+    """`cv2.VideoCapture` that stops after `limit` frames."""
+
+    def __init__(self, path: Path, limit: int):
+        self._cap = cv2.VideoCapture(str(path))
+        self._remaining = limit
+
+    def read(self):
+        if self._remaining <= 0:
+            return False, None
+        self._remaining -= 1
+        return self._cap.read()
+
+    def release(self) -> None:
+        self._cap.release()
+
+
+class NullWriter:
+    def write(self, frame) -> None:
+        pass
+
+
+def time_run(
+    args,
+    service: FaceSwapService,
+    embedding,
+    gender,
+    workers: int,
+    batch_size: int,
+    executor: str = VIDEO_EXECUTOR_THREAD,
+) -> float:
+    """Frames per second for one configuration."""
+    if executor == VIDEO_EXECUTOR_PROCESS:
+        return _time_process_run(args, service, embedding, gender, workers, batch_size)
+
+    def swap_one(frame, faces=None):
+        return service.swap_frame_with_embedding(
+            frame,
+            embedding,
+            enable_restore=args.restore,
+            source_gender=gender,
+            swap_model=args.swap_model,
+            faces=faces,
+        )
+
+    def swap_many(frames, faces_per_frame):
+        return service.swap_frames_with_embedding(
+            frames,
+            embedding,
+            enable_restore=args.restore,
+            source_gender=gender,
+            swap_model=args.swap_model,
+            faces_per_frame=faces_per_frame,
+        )
+
+    analyze_frame = partial(service.detect_faces, source_gender=gender)
+    return _timed_swap(args, analyze_frame, swap_one, swap_many, workers, batch_size, args.frames)
+
+
+def _time_process_run(args, service: FaceSwapService, embedding, gender, workers: int, batch_size: int) -> float:
+    pool = get_process_swap_pool(workers)
+    params = {
+        "source_embedding": embedding,
+        "enable_restore": args.restore,
+        "source_gender": gender,
+        "swap_model": args.swap_model,
+    }
+    analyze_frame = partial(service.detect_faces, source_gender=gender)
+    with pool.session(args.frame_shape, workers * batch_size, params) as session:
+        # Untimed pass so every worker has loaded and warmed its models.
+        warm_frames = min(args.frames, 2 * workers * batch_size)
+        _timed_swap(args, analyze_frame, session.swap_frame, session.swap_batch, workers, batch_size, warm_frames)
+        return _timed_swap(
+            args, analyze_frame, session.swap_frame, session.swap_batch, workers, batch_size, args.frames
+        )
+
+
+def _timed_swap(args, analyze_frame, swap_one, swap_many, workers: int, batch_size: int, frames: int) -> float:
+    cap = FrameLimitedCapture(args.video, frames)
+    try:
+        start = perf_counter()
+        count = swap_video_frames(
+            cap,
+            NullWriter(),
+            swap_one,
+            worker_count=workers,
+            analyze_frame=analyze_frame,
+            analyze_workers=resolve_detect_worker_count(0, workers),
+            swap_batch=swap_many,
+            batch_size=batch_size,
+        )
+        elapsed = perf_counter() - start
+    finally:
+        cap.release()
+    return count / elapsed if elapsed > 0 else float("nan")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--video", type=Path, required=True)
+    parser.add_argument("--source", type=Path, required=True, help="image with the source face")
+    parser.add_argument(
+        "--executors",
+        nargs="+",
+        default=[VIDEO_EXECUTOR_THREAD],
+        choices=[VIDEO_EXECUTOR_THREAD, VIDEO_EXECUTOR_PROCESS],
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--frames", type=int, default=120, help="frames per run")
+    parser.add_argument("--restore", action="store_true", help="enable face restoration")
+    parser.add_argument("--swap-model", default=SWAP_MODEL_INSWAPPER, choices=sorted(VALID_SWAP_MODELS))
+    args = parser.parse_args()
+
+    service = FaceSwapService()
+    embedding, gender = service.extract_face_features(Image.open(args.source).convert("RGB"))
+    if embedding is None:
+        parser.error(f"no face in source {args.source}")
+
+    probe = cv2.VideoCapture(str(args.video))
+    ok, frame = probe.read()
+    probe.release()
+    if not ok:
+        parser.error(f"cannot read frames from {args.video}")
+    args.frame_shape = frame.shape
+    get_model_registry().warmup_for_frames(
+        frame.shape,
+        restore=args.restore,
+        hyperswap=args.swap_model != SWAP_MODEL_INSWAPPER,
+    )
+
+    # One throwaway run so the first timed configuration doesn't also pay for
+    # ONNX Runtime's first-call setup.
+    time_run(args, service, embedding, gender, 1, 1)
+
+    grids: List[List[List[float]]] = []
+    try:
+        for executor in args.executors:
+            results: List[List[float]] = []
+            for batch_size in args.batch_sizes:
+                row = []
+                for workers in args.workers:
+                    fps = time_run(args, service, embedding, gender, workers, batch_size, executor)
+                    print(f"{executor} workers={workers} batch={batch_size}: {fps:.2f} fps")
+                    row.append(fps)
+                results.append(row)
+            grids.append(results)
+    finally:
+        shutdown_process_swap_pool()
+
+    baseline = grids[0][0][0]
+    print(f"\n{args.frames} frames of {args.video.name}, {frame.shape[1]}x{frame.shape[0]}")
+    for executor, results in zip(args.executors, grids):
+        print(f"\n{executor}")
+        print("batch \\ workers " + "".join(f"{w:>8}" for w in args.workers))
+        for batch_size, row in zip(args.batch_sizes, results):
+            print(f"{batch_size:>15} " + "".join(f"{fps / baseline:>7.2f}x" for fps in row))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -21,10 +21,15 @@ three metrics per pair:
                surrounding pixels; on anything but a tight portrait that ring
                is mostly background and the metric doesn't discriminate.)
 
+Each row also records `swap_ms`, the wall time of the swap call. With
+`--precisions fp32,int8` every pair is swapped once per MODEL_PRECISION mode
+and a per-mode summary shows what the faster models cost in quality.
+
 Usage:
 
     python -m eval.run_eval --sources fixtures/sources --targets fixtures/targets \
-                            --out out/baseline [--restore] [--swap-model hyperswap_256]
+                            --out out/baseline [--restore] [--swap-model hyperswap_256] \
+                            [--precisions fp32,int8]
 
 Run it once before a pipeline change and once after, then diff the CSVs.
 """
@@ -33,8 +38,10 @@ from __future__ import annotations
 
 import argparse
 import csv
+import dataclasses
 import sys
 from pathlib import Path
+from time import perf_counter
 from typing import List, Optional, Tuple
 
 import cv2
@@ -45,10 +52,14 @@ from PIL import Image
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
 from service.face_swap import (  # noqa: E402
+    ANALYSIS_PROFILE_FULL,
     SWAP_MODEL_INSWAPPER,
     VALID_SWAP_MODELS,
     FaceSwapService,
 )
+from service.model_precision import VALID_MODEL_PRECISIONS  # noqa: E402
+from service.model_registry import ModelRegistry  # noqa: E402
+from service.settings import get_settings  # noqa: E402
 
 IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
 
@@ -105,8 +116,7 @@ def tone_delta(result_bgr: np.ndarray, result_bbox, target_bgr: np.ndarray, targ
 
 def primary_face(service: FaceSwapService, img_bgr: np.ndarray):
     """Largest detected face, or None."""
-    service._registry.prepare_face_analyzer_for_image(img_bgr.shape)
-    faces = service._registry.get_face_analyzer().get(img_bgr)
+    faces = service.detect_faces(img_bgr, profile=ANALYSIS_PROFILE_FULL)
     if not faces:
         return None
     return max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
@@ -127,30 +137,21 @@ def contact_sheet(rows: List[Tuple[np.ndarray, np.ndarray, np.ndarray]], cell: i
     return np.vstack([np.hstack([fit(i) for i in row]) for row in rows])
 
 
-def main() -> int:
-    parser = argparse.ArgumentParser(description=__doc__)
-    parser.add_argument("--sources", type=Path, required=True)
-    parser.add_argument("--targets", type=Path, required=True)
-    parser.add_argument("--out", type=Path, required=True)
-    parser.add_argument("--restore", action="store_true", help="enable face restoration")
-    parser.add_argument("--swap-model", default=SWAP_MODEL_INSWAPPER, choices=sorted(VALID_SWAP_MODELS))
-    parser.add_argument("--limit", type=int, default=0, help="cap on pairs, 0 for all")
-    args = parser.parse_args()
-
-    source_paths = list_images(args.sources)
-    target_paths = list_images(args.targets)
-    if not source_paths or not target_paths:
-        parser.error("both --sources and --targets must contain images")
-
-    args.out.mkdir(parents=True, exist_ok=True)
-    service = FaceSwapService()
+def evaluate_precision(
+    args, precision: str, pairs: List[Tuple[Path, Path]], out_dir: Path
+) -> List[dict]:
+    """Swap every pair with the models loaded at `precision`."""
+    settings = dataclasses.replace(get_settings(), model_precision=precision)
+    registry = ModelRegistry(settings)
+    service = FaceSwapService(registry)
+    # Load every model the swap touches before timing anything.
+    registry.warmup_for_frames(
+        (64, 64), restore=args.restore, hyperswap=args.swap_model != SWAP_MODEL_INSWAPPER
+    )
+    out_dir.mkdir(parents=True, exist_ok=True)
 
     rows = []
     sheet_rows = []
-    pairs = [(s, t) for s in source_paths for t in target_paths]
-    if args.limit:
-        pairs = pairs[: args.limit]
-
     for source_path, target_path in pairs:
         source_pil = Image.open(source_path).convert("RGB")
         embedding, gender = service.extract_face_features(source_pil)
@@ -167,6 +168,7 @@ def main() -> int:
 
         before_sharp = sharpness(target_bgr, target_face.bbox)
 
+        started = perf_counter()
         result_pil = service.swap_with_embedding(
             target_pil,
             embedding,
@@ -174,6 +176,7 @@ def main() -> int:
             source_gender=gender,
             swap_model=args.swap_model,
         )
+        swap_ms = (perf_counter() - started) * 1000
         result_bgr = cv2.cvtColor(np.array(result_pil), cv2.COLOR_RGB2BGR)
 
         result_face = primary_face(service, result_bgr)
@@ -189,10 +192,11 @@ def main() -> int:
             )
 
         stem = f"{source_path.stem}__{target_path.stem}"
-        cv2.imwrite(str(args.out / f"{stem}.png"), result_bgr)
+        cv2.imwrite(str(out_dir / f"{stem}.png"), result_bgr)
 
         rows.append(
             {
+                "precision": precision,
                 "source": source_path.name,
                 "target": target_path.name,
                 "identity": round(identity, 4),
@@ -200,6 +204,7 @@ def main() -> int:
                 if before_sharp
                 else float("nan"),
                 "tone_delta": round(after_tone, 4),
+                "swap_ms": round(swap_ms, 1),
             }
         )
         sheet_rows.append(
@@ -209,7 +214,53 @@ def main() -> int:
                 result_bgr,
             )
         )
-        print(f"{stem}: identity={identity:.3f} tone_delta={after_tone:.1f}")
+        print(f"[{precision}] {stem}: identity={identity:.3f} tone_delta={after_tone:.1f} swap_ms={swap_ms:.0f}")
+
+    if sheet_rows:
+        cv2.imwrite(str(out_dir / "contact_sheet.png"), contact_sheet(sheet_rows))
+    return rows
+
+
+def _mean(rows: List[dict], key: str) -> float:
+    values = [r[key] for r in rows if not np.isnan(r[key])]
+    return float(np.mean(values)) if values else float("nan")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sources", type=Path, required=True)
+    parser.add_argument("--targets", type=Path, required=True)
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--restore", action="store_true", help="enable face restoration")
+    parser.add_argument("--swap-model", default=SWAP_MODEL_INSWAPPER, choices=sorted(VALID_SWAP_MODELS))
+    parser.add_argument("--limit", type=int, default=0, help="cap on pairs, 0 for all")
+    parser.add_argument(
+        "--precisions",
+        default=get_settings().model_precision,
+        help="comma-separated MODEL_PRECISION modes to compare, e.g. fp32,int8",
+    )
+    args = parser.parse_args()
+
+    precisions = [p.strip() for p in args.precisions.split(",") if p.strip()]
+    unknown = [p for p in precisions if p not in VALID_MODEL_PRECISIONS]
+    if not precisions or unknown:
+        parser.error(f"--precisions must name modes from {sorted(VALID_MODEL_PRECISIONS)}")
+
+    source_paths = list_images(args.sources)
+    target_paths = list_images(args.targets)
+    if not source_paths or not target_paths:
+        parser.error("both --sources and --targets must contain images")
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    pairs = [(s, t) for s in source_paths for t in target_paths]
+    if args.limit:
+        pairs = pairs[: args.limit]
+
+    rows = []
+    for precision in precisions:
+        # One mode keeps the original layout; several get a directory each.
+        out_dir = args.out / precision if len(precisions) > 1 else args.out
+        rows.extend(evaluate_precision(args, precision, pairs, out_dir))
 
     if not rows:
         print("no usable pairs")
@@ -221,15 +272,19 @@ def main() -> int:
         writer.writeheader()
         writer.writerows(rows)
 
-    cv2.imwrite(str(args.out / "contact_sheet.png"), contact_sheet(sheet_rows))
-
-    identities = [r["identity"] for r in rows if not np.isnan(r["identity"])]
-    tones = [r["tone_delta"] for r in rows if not np.isnan(r["tone_delta"])]
-    print(f"\n{len(rows)} pairs -> {csv_path}")
-    if identities:
-        print(f"mean identity   : {np.mean(identities):.4f}")
-    if tones:
-        print(f"mean tone_delta : {np.mean(tones):.2f}")
+    print(f"\n{len(rows)} rows -> {csv_path}")
+    print(f"{'precision':<10} {'pairs':>5} {'identity':>9} {'sharpness':>9} {'tone':>7} {'swap_ms':>8}")
+    for precision in precisions:
+        mode_rows = [r for r in rows if r["precision"] == precision]
+        if not mode_rows:
+            continue
+        print(
+            f"{precision:<10} {len(mode_rows):>5} "
+            f"{_mean(mode_rows, 'identity'):>9.4f} "
+            f"{_mean(mode_rows, 'sharpness_ratio'):>9.3f} "
+            f"{_mean(mode_rows, 'tone_delta'):>7.2f} "
+            f"{_mean(mode_rows, 'swap_ms'):>8.0f}"
+        )
     return 0
 
 
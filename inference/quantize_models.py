@@ -0,0 +1,33 @@
+"""Write INT8 copies of the swap, restore and occluder models.
+
+    python quantize_models.py [--models inswapper gpen ...] [--force]
+
+Originals come from the model cache (and are downloaded if missing); copies go
+to `QUANTIZED_MODEL_DIR`, where `MODEL_PRECISION=int8` picks them up. Existing
+copies are kept unless `--force` is given.
+"""
+
+import argparse
+
+from service.model_precision import quantizable_models
+from service.model_registry import get_model_registry
+from service.settings import get_settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        choices=sorted(quantizable_models(get_settings())),
+        help="models to quantize, default all",
+    )
+    parser.add_argument("--force", action="store_true", help="overwrite existing copies")
+    args = parser.parse_args()
+
+    for path in get_model_registry().quantize_models(args.models, force=args.force):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""Production entrypoint: load the models once, then fork HTTP workers.
+
+`app.py` is the single-process development server; see service/prefork.py.
+"""
+
+from service.observability import configure_logging
+from service.prefork import PreforkServer
+from service.settings import get_settings
+
+
+def main():
+    configure_logging()
+    PreforkServer(get_settings()).serve()
+
+
+if __name__ == "__main__":
+    main()
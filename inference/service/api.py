@@ -1,26 +1,41 @@
 import io
 import os
 import shutil
-import subprocess
 import tempfile
 import uuid
+from contextlib import asynccontextmanager
 from time import perf_counter
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Sequence
 
 import numpy as np
-import cv2
 import requests
 from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
-from fastapi.responses import Response, JSONResponse
+from fastapi.responses import FileResponse, Response, JSONResponse
 from PIL import Image
 from safetensors.numpy import load as load_safetensor, save as save_safetensor
-
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .cache_dir import remove_quietly
+from .cpu_budget import get_cpu_budget
+from .face_cache import FaceAnalysisCache
 from .face_swap import FaceSwapService, GENDER_FEMALE, GENDER_MALE, SWAP_MODEL_INSWAPPER, VALID_SWAP_MODELS
+from .inference_gate import GateFull, InferenceGate
+from .micro_batcher import ModelBatcher
 from .model_registry import get_model_registry
-from .observability import configure_logging, get_logger, timed_log
+from .observability import configure_logging, get_logger, process_uptime_ms, timed_log
+from .ort_sessions import session_benchmarks
 from .settings import get_settings
 from .output_storage import upload_output
-from .video_swap import resolve_worker_count, swap_video_frames
+from .result_cache import ResultCache, hash_file, swap_cache_key
+from .video_checkpoint import CheckpointBusy
+from .video_job import VideoInputError, VideoSwapParams, swap_video_file
+from .video_jobs import JOB_QUEUED, TERMINAL_STATES, JobQueueFull, VideoJobManager, job_view
+from .video_progress import ProgressReporter, progress_stats
+from .video_swap import VideoCancelled
+from .video_shards import PROCESSED_FRAMES_HEADER, parse_shard_workers, swap_video_sharded
 
 
 def _parse_form_bool(value: str) -> bool:
@@ -60,51 +75,6 @@ def _gender_from_tensor(tensors: dict) -> Optional[str]:
     return GENDER_MALE if val > 0.5 else GENDER_FEMALE
 
 
-def _transcode_to_h264_mp4(raw_input_path: str, output_path: str, logger) -> None:
-    ffmpeg_bin = shutil.which("ffmpeg")
-    if not ffmpeg_bin:
-        shutil.copyfile(raw_input_path, output_path)
-        logger.warning(
-            "ffmpeg_not_found",
-            extra={"event": "ffmpeg_not_found", "fallback": "raw_copy"},
-        )
-        return
-
-    command = [
-        ffmpeg_bin,
-        "-y",
-        "-i",
-        raw_input_path,
-        "-c:v",
-        "libx264",
-        "-pix_fmt",
-        "yuv420p",
-        "-movflags",
-        "+faststart",
-        "-an",
-        output_path,
-    ]
-    completed = subprocess.run(
-        command,
-        capture_output=True,
-        text=True,
-        check=False,
-    )
-    if completed.returncode == 0 and os.path.exists(output_path):
-        return
-
-    logger.warning(
-        "ffmpeg_transcode_failed",
-        extra={
-            "event": "ffmpeg_transcode_failed",
-            "return_code": completed.returncode,
-            "stderr_tail": (completed.stderr or "")[-500:],
-            "fallback": "raw_copy",
-        },
-    )
-    shutil.copyfile(raw_input_path, output_path)
-
-
 def _post_generated_video(
     callback_url: str,
     output_bytes: bytes,
@@ -158,6 +128,17 @@ def _post_generated_video(
         )
 
 
+def _image_output_payload(output_key: str, mime_type: str, size: int) -> dict:
+    return {
+        "status": "completed",
+        "storage_provider": "huggingface",
+        "storage_key": output_key,
+        "filename": output_key.rsplit("/", 1)[-1],
+        "mime_type": mime_type,
+        "size": size,
+    }
+
+
 def _storage_fields(
     storage_key: Optional[str],
     storage_repo: Optional[str],
@@ -175,60 +156,271 @@ def _storage_fields(
     return key, repo, repo_type, branch
 
 
-def _post_video_progress(
-    progress_url: str,
-    processed_frames: int,
-    total_frames: Optional[int],
-    callback_token: Optional[str],
-    logger,
-) -> None:
-    if not progress_url:
-        return
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# A model file holds one embedding and a gender scalar; this is generous.
+MODEL_FILE_MAX_BYTES = 16 * 1024 * 1024
+# Allowance for the model file and plain form fields when a request body is
+# checked against the cap on its target upload.
+UPLOAD_FORM_OVERHEAD_BYTES = MODEL_FILE_MAX_BYTES + 1024 * 1024
 
-    headers = {}
-    if callback_token:
-        headers["x-inference-token"] = callback_token
 
-    progress_percent = None
-    if total_frames and total_frames > 0:
-        progress_percent = min(100, round((processed_frames / total_frames) * 100))
+def _upload_too_large(field: str, max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"{field} is larger than {max_bytes // (1024 * 1024)} MB",
+    )
 
-    data = {
-        "processed_frames": str(processed_frames),
-    }
-    if total_frames is not None:
-        data["total_frames"] = str(total_frames)
-    if progress_percent is not None:
-        data["progress_percent"] = str(progress_percent)
 
+def _check_upload_size(upload: UploadFile, max_bytes: int, field: str) -> None:
+    """413 if an upload that has already been received is over `max_bytes`."""
+    if upload.size is not None and upload.size > max_bytes:
+        raise _upload_too_large(field, max_bytes)
+
+
+async def _read_upload(upload: UploadFile, max_bytes: int, field: str) -> bytes:
+    """Read a small upload into memory, refusing anything over `max_bytes`."""
+    _check_upload_size(upload, max_bytes, field)
+    data = await upload.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise _upload_too_large(field, max_bytes)
+    return data
+
+
+async def _spool_upload(upload: UploadFile, dest_path: str, max_bytes: int, field: str) -> int:
+    """Copy an upload to `dest_path` a chunk at a time and return its size.
+
+    Starlette has already spooled any upload over 1 MB to a temporary file,
+    so the video never sits in memory whole. 400 if empty, 413 if over
+    `max_bytes`. Only for a copy that must outlive the request; otherwise
+    see `_upload_on_disk`.
+    """
+    _check_upload_size(upload, max_bytes, field)
+    size = 0
+    with open(dest_path, "wb") as file_obj:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise _upload_too_large(field, max_bytes)
+            file_obj.write(chunk)
+    if size == 0:
+        raise HTTPException(status_code=400, detail=f"Empty {field}")
+    return size
+
+
+@asynccontextmanager
+async def _upload_on_disk(
+    upload: UploadFile, max_bytes: int, field: str, suffix: str = ""
+) -> AsyncIterator[str]:
+    """A path to an upload's contents for the length of the block.
+
+    Starlette spools an upload to an unnamed temporary file; where /proc
+    exposes it, the path opens that file and the video is not copied again.
+    Otherwise it is copied to a temporary file that the block owns. 400 if
+    empty, 413 if over `max_bytes`.
+    """
+    _check_upload_size(upload, max_bytes, field)
+    if upload.size is not None and os.path.isdir(f"/proc/{os.getpid()}/fd"):
+        if upload.size == 0:
+            raise HTTPException(status_code=400, detail=f"Empty {field}")
+        # fileno() moves an upload still held in memory to its file, and the
+        # flush makes every byte visible through the path.
+        fd = await run_in_threadpool(upload.file.fileno)
+        await run_in_threadpool(upload.file.flush)
+        # By pid rather than /proc/self, so ffmpeg subprocesses can open it.
+        yield f"/proc/{os.getpid()}/fd/{fd}"
+        return
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as file_obj:
+        path = file_obj.name
     try:
-        response = requests.post(
-            progress_url,
-            headers=headers,
-            data=data,
-            timeout=30,
-        )
-        if response.status_code >= 400:
-            logger.warning(
-                "progress_post_failed",
-                extra={
-                    "event": "progress_post_failed",
-                    "status_code": response.status_code,
-                    "response_tail": (response.text or "")[-500:],
-                },
+        await _spool_upload(upload, path, max_bytes, field)
+        yield path
+    finally:
+        remove_quietly(path)
+
+
+class UploadLimitMiddleware:
+    """413 for a request body over its route's upload limit.
+
+    A Content-Length over the limit is refused before any of the body is
+    read. Otherwise - chunked uploads included - the body is counted as it
+    is received and the request is cut off once it passes the limit, rather
+    than after it has been spooled whole. Single files are checked against
+    their own caps once parsed.
+    """
+
+    def __init__(self, app: ASGIApp, limits: Dict[str, int], logger):
+        self.app = app
+        self._limits = limits
+        self._logger = logger
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limit = self._limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        max_body = limit + UPLOAD_FORM_OVERHEAD_BYTES
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > max_body:
+            self._reject(scope, int(content_length), limit)
+            response = JSONResponse(
+                status_code=413,
+                content={"detail": _upload_too_large("Upload", limit).detail},
             )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body:
+                    self._reject(scope, received, limit)
+                    # Raised from the body parser, and answered like any
+                    # other HTTPException.
+                    raise _upload_too_large("Upload", limit)
+            return message
+
+        await self.app(scope, counting_receive, send)
+
+    def _reject(self, scope: Scope, size: int, limit: int) -> None:
+        self._logger.warning(
+            "upload_rejected",
+            extra={
+                "event": "upload_rejected",
+                "path": scope["path"],
+                "content_length": size,
+                "limit_bytes": limit,
+            },
+        )
+
+
+def _parse_video_params(
+    model_bytes: bytes,
+    enable_restore: str,
+    manual_gender: Optional[str],
+    swap_model: Optional[str],
+    logger,
+) -> VideoSwapParams:
+    """Validate a video request's source model and options (400 on error)."""
+    if not model_bytes:
+        raise HTTPException(status_code=400, detail="Empty model_file")
+    try:
+        with timed_log(logger, "parse_model_file_video"):
+            tensors = load_safetensor(model_bytes)
+            source_embedding = tensors.get("embedding")
+            source_gender = _gender_from_tensor(tensors)
     except Exception as exc:
         logger.warning(
-            "progress_post_error",
-            extra={"event": "progress_post_error", "error": str(exc)},
+            "invalid_model_file_video",
+            extra={"event": "invalid_model_file_video", "error": str(exc)},
         )
+        raise HTTPException(status_code=400, detail=f"Invalid model_file: {exc}")
+    if source_embedding is None:
+        raise HTTPException(status_code=400, detail="Model file missing 'embedding'")
+
+    # Manual gender override takes priority over auto-detected gender in safetensors
+    effective_gender = source_gender
+    if manual_gender and manual_gender.strip().upper() in ("M", "F"):
+        effective_gender = manual_gender.strip().upper()
+
+    effective_swap_model = SWAP_MODEL_INSWAPPER
+    if swap_model and swap_model.strip().lower() in VALID_SWAP_MODELS:
+        effective_swap_model = swap_model.strip().lower()
+
+    return VideoSwapParams(
+        source_embedding=source_embedding,
+        source_gender=effective_gender,
+        restore=_parse_form_bool(enable_restore),
+        swap_model=effective_swap_model,
+    )
+
 
+def create_app(
+    job_owner: str = "", live_job_owners: Optional[Sequence[str]] = None
+) -> FastAPI:
+    """The service app.
 
-def create_app() -> FastAPI:
+    `job_owner` is the prefork worker slot (see serve.py) whose video jobs
+    this app recovers and runs. `live_job_owners`, given to one worker, lists
+    every slot; that worker also recovers the jobs of any other owner.
+    """
     configure_logging()
     logger = get_logger("inference.api")
-    app = FastAPI()
-    swap_service = FaceSwapService()
+    settings = get_settings()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Models load behind the server rather than before it: the port is
+        # served at once and /ready reports when the models are in.
+        logger.info(
+            "app_startup",
+            extra={"event": "app_startup", "uptime_ms": process_uptime_ms()},
+        )
+        # A prefork worker (job_owner set) inherits the models its master
+        # loaded and primed; preloading again would re-prime every one of
+        # them on each recycle and dirty the pages it shares copy-on-write.
+        if settings.model_preload_on_start and not job_owner:
+            get_model_registry().start_background_preload()
+        get_model_registry().start_idle_eviction()
+        yield
+        if job_owner:
+            # A prefork worker exits with os._exit once uvicorn returns, which
+            # would kill its job threads mid-segment; give them the drain
+            # timeout to finish. A single process keeps its old behaviour:
+            # the interpreter waits for running jobs at exit.
+            await run_in_threadpool(video_jobs.drain, settings.prefork_drain_timeout_s)
+
+    app = FastAPI(lifespan=lifespan)
+    face_cache = None
+    if settings.face_cache_entries > 0:
+        face_cache = FaceAnalysisCache(
+            settings.face_cache_entries,
+            disk_dir=settings.face_cache_dir,
+            disk_max_bytes=settings.face_cache_disk_max_mb * 1024 * 1024,
+        )
+    swap_service = FaceSwapService(face_cache=face_cache)
+    # Image requests share model calls across concurrent requests when
+    # SWAP_BATCH_MAX_SIZE > 1. Video jobs batch their own frames and keep
+    # the unbatched service.
+    swap_batcher = None
+    image_swap_service = swap_service
+    if settings.swap_batch_max_size > 1:
+        swap_batcher = ModelBatcher(settings.swap_batch_max_size, settings.swap_batch_wait_ms)
+        get_model_registry().add_eviction_listener(swap_batcher.forget_session)
+        image_swap_service = FaceSwapService(batcher=swap_batcher, face_cache=face_cache)
+    image_upload_max_bytes = settings.image_upload_max_mb * 1024 * 1024
+    video_upload_max_bytes = settings.video_upload_max_mb * 1024 * 1024
+    result_cache = None
+    if settings.result_cache_max_mb > 0:
+        result_cache = ResultCache(
+            settings.result_cache_dir,
+            settings.result_cache_max_mb * 1024 * 1024,
+            ttl_s=settings.result_cache_ttl_hours * 3600,
+        )
+    # Blocking inference runs on these pools rather than the event loop, so
+    # /health and job polling keep answering while swaps run.
+    image_gate = InferenceGate(
+        "image", settings.inference_concurrency, settings.inference_queue_max
+    )
+    video_gate = InferenceGate(
+        "video", settings.video_request_concurrency, settings.video_request_queue_max
+    )
+    upload_limits = {
+        "/swap-remote": image_upload_max_bytes,
+        "/swap-remote-video": video_upload_max_bytes,
+        "/jobs/video": video_upload_max_bytes,
+        "/swap-video-segment": video_upload_max_bytes,
+    }
+
+    # Registered before the timing middleware, so it runs inside it and
+    # rejected requests are still logged.
+    app.add_middleware(UploadLimitMiddleware, limits=upload_limits, logger=logger)
 
     @app.middleware("http")
     async def request_timing_middleware(request: Request, call_next):
@@ -265,20 +457,60 @@ def create_app() -> FastAPI:
         )
         return response
 
+    @app.exception_handler(GateFull)
+    async def gate_full_handler(request: Request, exc: GateFull):
+        return JSONResponse(
+            status_code=503,
+            content={"detail": str(exc)},
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
     @app.get("/health")
     async def health():
         # Reports reachability and whether the core models are already loaded.
         # Does NOT trigger a load, so it stays cheap; merely hitting this route is
-        # enough to wake a sleeping Hugging Face Space.
+        # enough to wake a sleeping Hugging Face Space. Queue depths let a
+        # caller see how busy the node is before sending more work.
         registry = get_model_registry()
         models_loaded = registry._models is not None
-        return {"status": "ok", "models_loaded": models_loaded}
+        return {
+            "status": "ok",
+            "models_loaded": models_loaded,
+            "ready": registry.is_ready(),
+            "inference": {"image": image_gate.stats(), "video": video_gate.stats()},
+            "swap_batching": swap_batcher.stats() if swap_batcher else None,
+            "result_cache": result_cache.stats() if result_cache else None,
+            "face_cache": face_cache.stats() if face_cache else None,
+            "cpu_budget": get_cpu_budget().stats(),
+            "model_sessions": session_benchmarks(),
+            "model_memory": registry.resident_memory(),
+            "video_jobs": video_jobs.stats(),
+            "video_progress": progress_stats(),
+        }
+
+    @app.get("/ready")
+    async def ready():
+        # 200 once every model a swap always uses has loaded, 503 until then;
+        # the body lists each model's load state either way. Never triggers a
+        # load.
+        load_states = get_model_registry().load_states()
+        return JSONResponse(
+            status_code=200 if load_states["ready"] else 503,
+            content=load_states,
+        )
 
     @app.post("/warmup")
     async def warmup():
-        # Forces model initialization so the first real swap isn't slow.
-        get_model_registry().get_models()
-        return {"status": "ok", "models_loaded": True}
+        # Forces model initialization so the first real swap isn't slow, and
+        # with MODEL_PRIMING runs every loaded model once so that its first
+        # run is not a real request either.
+        registry = get_model_registry()
+        await run_in_threadpool(registry.get_models)
+        await run_in_threadpool(registry.get_occluder_session)
+        prime_ms = {}
+        if settings.model_priming:
+            prime_ms = await run_in_threadpool(registry.prime_models)
+        return {"status": "ok", "models_loaded": True, "prime_ms": prime_ms}
 
     @app.post("/swap-remote")
     async def swap_remote(
@@ -308,12 +540,12 @@ def create_app() -> FastAPI:
         effective_swap_model = SWAP_MODEL_INSWAPPER
         if swap_model and swap_model.strip().lower() in VALID_SWAP_MODELS:
             effective_swap_model = swap_model.strip().lower()
-        model_bytes = await model_file.read()
-        target_bytes = await target_image.read()
+        model_bytes = await _read_upload(model_file, MODEL_FILE_MAX_BYTES, "model_file")
+        _check_upload_size(target_image, image_upload_max_bytes, "target_image")
 
         if not model_bytes:
             raise HTTPException(status_code=400, detail="Empty model_file")
-        if not target_bytes:
+        if not target_image.size:
             raise HTTPException(status_code=400, detail="Empty target_image")
 
         try:
@@ -331,16 +563,6 @@ def create_app() -> FastAPI:
         if source_embedding is None:
             raise HTTPException(status_code=400, detail="Model file missing 'embedding'")
 
-        try:
-            with timed_log(logger, "decode_target_image"):
-                target_pil = Image.open(io.BytesIO(target_bytes)).convert("RGB")
-        except Exception as exc:
-            logger.warning(
-                "invalid_target_image",
-                extra={"event": "invalid_target_image", "error": str(exc)},
-            )
-            raise HTTPException(status_code=400, detail=f"Invalid target_image: {exc}")
-
         # Manual gender override takes priority over auto-detected gender in safetensors
         effective_gender = source_gender
         if manual_gender and manual_gender.strip().upper() in ("M", "F"):
@@ -357,16 +579,29 @@ def create_app() -> FastAPI:
             },
         )
 
-        with timed_log(logger, "swap_remote_inference", restore_enabled=restore_enabled):
-            output_image = swap_service.swap_with_embedding(
-                target_pil,
-                source_embedding,
-                enable_restore=restore_enabled,
-                source_gender=effective_gender,
-                swap_model=effective_swap_model,
-            )
-        with timed_log(logger, "encode_output_image"):
-            output_bytes, mime_type = _encode_output_image(output_image, output_format)
+        def swap_and_encode() -> tuple[bytes, str]:
+            # Decoding is CPU work too: it runs behind the gate with the swap,
+            # never on the event loop.
+            try:
+                with timed_log(logger, "decode_target_image"):
+                    # Decoded straight from the spooled upload, without a copy.
+                    target_pil = Image.open(target_image.file).convert("RGB")
+            except Exception as exc:
+                logger.warning(
+                    "invalid_target_image",
+                    extra={"event": "invalid_target_image", "error": str(exc)},
+                )
+                raise HTTPException(status_code=400, detail=f"Invalid target_image: {exc}")
+            with timed_log(logger, "swap_remote_inference", restore_enabled=restore_enabled):
+                output_image = image_swap_service.swap_with_embedding(
+                    target_pil,
+                    source_embedding,
+                    enable_restore=restore_enabled,
+                    source_gender=effective_gender,
+                    swap_model=effective_swap_model,
+                )
+            with timed_log(logger, "encode_output_image"):
+                return _encode_output_image(output_image, output_format)
 
         output_key, repo_id, repo_type, branch = _storage_fields(
             storage_key,
@@ -374,13 +609,54 @@ def create_app() -> FastAPI:
             storage_repo_type,
             storage_branch,
         )
+        location = [repo_type, repo_id, branch, output_key]
+
+        cache_key = None
+        cached = None
+        if result_cache is not None:
+            with timed_log(logger, "result_cache_lookup"):
+                target_hash = await run_in_threadpool(hash_file, target_image.file)
+                cache_key = swap_cache_key(
+                    source_embedding,
+                    target_hash,
+                    settings,
+                    swap_model=effective_swap_model,
+                    enable_restore=restore_enabled,
+                    source_gender=effective_gender,
+                    output_format="png" if (output_format or "").strip().lower() == "png" else "jpeg",
+                )
+                cached = await run_in_threadpool(result_cache.get, cache_key)
+            if cached is not None and location in cached.uploads:
+                # A retry of a request that already completed: the output is
+                # in storage, only the response never arrived.
+                result_cache.count_upload_hit()
+                logger.info(
+                    "result_cache_hit",
+                    extra={"event": "result_cache_hit", "upload_skipped": True},
+                )
+                return JSONResponse(
+                    content=_image_output_payload(output_key, cached.mime_type, len(cached.data))
+                )
+
+        if cached is not None:
+            logger.info(
+                "result_cache_hit",
+                extra={"event": "result_cache_hit", "upload_skipped": False},
+            )
+            output_bytes, mime_type = cached.data, cached.mime_type
+        else:
+            output_bytes, mime_type = await image_gate.run(swap_and_encode)
+            if cache_key is not None:
+                await run_in_threadpool(result_cache.put, cache_key, output_bytes, mime_type)
+
         suffix = ".png" if mime_type == "image/png" else ".jpg"
         with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as output_file:
             output_file.write(output_bytes)
             local_output_path = output_file.name
         try:
             with timed_log(logger, "upload_output_image"):
-                output_size = upload_output(
+                output_size = await run_in_threadpool(
+                    upload_output,
                     local_output_path,
                     output_key,
                     repo_id,
@@ -398,41 +674,39 @@ def create_app() -> FastAPI:
             if os.path.exists(local_output_path):
                 os.remove(local_output_path)
 
-        return JSONResponse(
-            content={
-                "status": "completed",
-                "storage_provider": "huggingface",
-                "storage_key": output_key,
-                "filename": output_key.rsplit("/", 1)[-1],
-                "mime_type": mime_type,
-                "size": output_size,
-            }
-        )
+        if cache_key is not None:
+            await run_in_threadpool(result_cache.record_upload, cache_key, location)
+        return JSONResponse(content=_image_output_payload(output_key, mime_type, output_size))
 
     @app.post("/embedding")
     async def create_embedding(files: List[UploadFile] = File(..., alias="file")):
         if not files:
             raise HTTPException(status_code=400, detail="No files provided")
 
-        embeddings = []
-        detected_genders = []
-
-        with timed_log(logger, "embedding_batch", file_count=len(files)):
-            for upload in files:
-                data = await upload.read()
-                if not data:
-                    continue
+        uploads = []
+        for upload in files:
+            data = await _read_upload(upload, image_upload_max_bytes, "file")
+            if data:
+                uploads.append(data)
 
+        def extract_all():
+            # Decoded behind the gate, with the analysis, off the event loop.
+            images = []
+            for data in uploads:
                 try:
-                    image = Image.open(io.BytesIO(data)).convert("RGB")
+                    images.append(Image.open(io.BytesIO(data)).convert("RGB"))
                 except Exception:
                     continue
+            with timed_log(logger, "embedding_batch", file_count=len(files)):
+                return [swap_service.extract_face_features(image) for image in images]
 
-                embedding, gender = swap_service.extract_face_features(image)
-                if embedding is not None:
-                    embeddings.append(embedding)
-                    if gender is not None:
-                        detected_genders.append(gender)
+        embeddings = []
+        detected_genders = []
+        for embedding, gender in await image_gate.run(extract_all):
+            if embedding is not None:
+                embeddings.append(embedding)
+                if gender is not None:
+                    detected_genders.append(gender)
 
         if not embeddings:
             raise HTTPException(status_code=400, detail="No faces found in uploaded images")
@@ -464,6 +738,91 @@ def create_app() -> FastAPI:
         tensor_bytes = save_safetensor(tensors)
         return Response(content=tensor_bytes, media_type="application/octet-stream")
 
+    def run_video_swap(
+        input_path: str,
+        params: VideoSwapParams,
+        model_bytes: bytes,
+        storage: tuple[str, str, str, str],
+        on_progress=None,
+        cancel_event=None,
+        checkpoint_key: Optional[str] = None,
+    ) -> dict:
+        """Swap a spooled video and upload the result.
+
+        Shared by the synchronous route and background jobs. Returns the
+        completed-video payload. `checkpoint_key` makes the swap resumable;
+        sharded jobs are not checkpointed.
+        """
+        settings = get_settings()
+        shard_workers = parse_shard_workers(settings.video_shard_workers)
+        output_path = ""
+        try:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as output_file:
+                output_path = output_file.name
+
+            if shard_workers:
+                result = swap_video_sharded(
+                    swap_service,
+                    input_path,
+                    output_path,
+                    params,
+                    model_bytes=model_bytes,
+                    workers=shard_workers,
+                    segment_seconds=settings.video_shard_segment_seconds,
+                    request_timeout=settings.video_shard_timeout_seconds,
+                    on_progress=on_progress,
+                    cancel_event=cancel_event,
+                )
+            else:
+                result = swap_video_file(
+                    swap_service,
+                    input_path,
+                    output_path,
+                    params,
+                    on_progress=on_progress,
+                    cancel_event=cancel_event,
+                    checkpoint_key=checkpoint_key,
+                )
+            frame_count = result.frame_count
+
+            # Uploaded from the file; the encoded video is never read into memory.
+            logger.info(
+                "video_encoded",
+                extra={
+                    "event": "video_encoded",
+                    "output_path": output_path,
+                    "output_size": os.path.getsize(output_path),
+                    "frame_count": frame_count,
+                },
+            )
+            # A cancel that came in after the last frame still stops the upload.
+            if cancel_event is not None and cancel_event.is_set():
+                raise VideoCancelled()
+            output_key, repo_id, repo_type, branch = storage
+            with timed_log(logger, "upload_output_video", frame_count=frame_count):
+                output_size = upload_output(
+                    output_path,
+                    output_key,
+                    repo_id,
+                    repo_type,
+                    branch,
+                    commit_message=f"Store generated video {output_key}",
+                )
+            return {
+                "status": "completed",
+                "storage_provider": "huggingface",
+                "storage_key": output_key,
+                "filename": output_key.rsplit("/", 1)[-1],
+                "mime_type": "video/mp4",
+                "size": output_size,
+                "total_frames": result.total_frames or 0,
+                "processed_frames": frame_count,
+                "progress_percent": 100,
+            }
+        finally:
+            if output_path and os.path.exists(output_path):
+                os.remove(output_path)
+
     @app.post("/swap-remote-video")
     async def swap_remote_video(
         model_id: str = Form(...),
@@ -480,6 +839,7 @@ def create_app() -> FastAPI:
         storage_repo: Optional[str] = Form(None),
         storage_repo_type: Optional[str] = Form(None),
         storage_branch: Optional[str] = Form(None),
+        idempotency_key: Optional[str] = Form(None),
         model_file: UploadFile = File(...),
         target_video: UploadFile = File(...),
     ):
@@ -487,211 +847,214 @@ def create_app() -> FastAPI:
         # for compatibility and ignored.
         del model_id, preserve_expression, preserve_target_expression
         del target_expression_strength, apply_hair
-        restore_enabled = _parse_form_bool(enable_restore)
-        effective_swap_model = SWAP_MODEL_INSWAPPER
-        if swap_model and swap_model.strip().lower() in VALID_SWAP_MODELS:
-            effective_swap_model = swap_model.strip().lower()
-        model_bytes = await model_file.read()
-        target_bytes = await target_video.read()
-
-        if not model_bytes:
-            raise HTTPException(status_code=400, detail="Empty model_file")
-        if not target_bytes:
-            raise HTTPException(status_code=400, detail="Empty target_video")
+        model_bytes = await _read_upload(model_file, MODEL_FILE_MAX_BYTES, "model_file")
+        params = _parse_video_params(model_bytes, enable_restore, manual_gender, swap_model, logger)
 
+        input_suffix = os.path.splitext(target_video.filename or "video.mp4")[1] or ".mp4"
+        reporter = ProgressReporter(progress_url, callback_token) if progress_url else None
         try:
-            with timed_log(logger, "parse_model_file_video"):
-                tensors = load_safetensor(model_bytes)
-                source_embedding = tensors.get("embedding")
-                source_gender = _gender_from_tensor(tensors)
+            storage = _storage_fields(storage_key, storage_repo, storage_repo_type, storage_branch)
+            async with _upload_on_disk(
+                target_video, video_upload_max_bytes, "target_video", input_suffix
+            ) as input_path:
+                content = await video_gate.run(
+                    run_video_swap,
+                    input_path,
+                    params,
+                    model_bytes,
+                    storage,
+                    on_progress=reporter.report if reporter else None,
+                    checkpoint_key=(idempotency_key or "").strip() or None,
+                )
+            return JSONResponse(content=content)
+        except (HTTPException, GateFull):
+            raise
+        except VideoInputError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        except CheckpointBusy as exc:
+            # A retry of a request that is still running; it can retry again.
+            raise HTTPException(status_code=409, detail=str(exc))
         except Exception as exc:
-            logger.warning(
-                "invalid_model_file_video",
-                extra={"event": "invalid_model_file_video", "error": str(exc)},
+            logger.exception(
+                "swap_remote_video_failed",
+                extra={"event": "swap_remote_video_failed", "error": str(exc)},
             )
-            raise HTTPException(status_code=400, detail=f"Invalid model_file: {exc}")
-
-        # Manual gender override takes priority over auto-detected gender in safetensors
-        effective_gender = source_gender
-        if manual_gender and manual_gender.strip().upper() in ("M", "F"):
-            effective_gender = manual_gender.strip().upper()
-
-        if source_embedding is None:
-            raise HTTPException(status_code=400, detail="Model file missing 'embedding'")
+            raise HTTPException(status_code=500, detail=f"Video swap failed: {exc}")
+        finally:
+            if reporter is not None:
+                reporter.close()
+
+    def run_video_job(job_id, spec, job_dir, on_progress, cancel_event) -> dict:
+        with open(os.path.join(job_dir, spec["model_filename"]), "rb") as file_obj:
+            model_bytes = file_obj.read()
+        params = _parse_video_params(
+            model_bytes,
+            spec["enable_restore"],
+            spec["manual_gender"],
+            spec["swap_model"],
+            logger,
+        )
+        reporter = None
+        if spec["progress_url"]:
+            reporter = ProgressReporter(spec["progress_url"], spec["callback_token"])
 
-        input_suffix = os.path.splitext(target_video.filename or "video.mp4")[1] or ".mp4"
-        input_path = ""
-        raw_output_path = ""
-        output_path = ""
-        cap = None
-        writer = None
+        def report_progress(processed: int, total_frames: Optional[int]) -> None:
+            on_progress(processed, total_frames)
+            if reporter is not None:
+                reporter.report(processed, total_frames)
 
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=input_suffix) as input_file:
-                input_file.write(target_bytes)
-                input_path = input_file.name
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as raw_output_file:
-                raw_output_path = raw_output_file.name
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as output_file:
-                output_path = output_file.name
-
-            with timed_log(logger, "decode_target_video"):
-                cap = cv2.VideoCapture(input_path)
-
-            if not cap.isOpened():
-                raise HTTPException(status_code=400, detail="Invalid target_video")
-
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
-            if total_frames <= 0:
-                total_frames = None
-
-            if width <= 0 or height <= 0:
-                raise HTTPException(status_code=400, detail="Unable to read video dimensions")
-
-            if not fps or fps <= 0:
-                fps = 25.0
-
-            writer = cv2.VideoWriter(
-                raw_output_path,
-                cv2.VideoWriter_fourcc(*"mp4v"),
-                fps,
-                (width, height),
-            )
-
-            if not writer.isOpened():
-                raise HTTPException(status_code=500, detail="Failed to initialize video writer")
-
-            report_every = 30
-            if total_frames:
-                report_every = max(1, int(total_frames * 0.02))
-            if progress_url:
-                _post_video_progress(
-                    progress_url=progress_url,
-                    processed_frames=0,
-                    total_frames=total_frames,
-                    callback_token=callback_token,
-                    logger=logger,
+            with timed_log(logger, "video_job_run", job_id=job_id):
+                return run_video_swap(
+                    os.path.join(job_dir, spec["input_filename"]),
+                    params,
+                    model_bytes,
+                    tuple(spec["storage"]),
+                    on_progress=report_progress,
+                    cancel_event=cancel_event,
+                    # A job requeued after a restart resumes from its checkpoint.
+                    checkpoint_key=spec.get("idempotency_key") or f"job:{job_id}",
                 )
+        finally:
+            if reporter is not None:
+                reporter.close()
+
+    video_jobs = VideoJobManager(
+        settings.video_job_dir,
+        run_video_job,
+        max_workers=settings.video_job_workers,
+        max_queued=settings.video_job_max_queued,
+        owner=job_owner,
+        live_owners=live_job_owners,
+    )
 
-            def report_progress(processed: int) -> None:
-                if not progress_url:
-                    return
-                _post_video_progress(
-                    progress_url=progress_url,
-                    processed_frames=processed,
-                    total_frames=total_frames,
-                    callback_token=callback_token,
-                    logger=logger,
-                )
-
-            def swap_one(frame):
-                return swap_service.swap_frame_with_embedding(
-                    frame,
-                    source_embedding,
-                    enable_restore=restore_enabled,
-                    source_gender=effective_gender,
-                    swap_model=effective_swap_model,
-                )
-
-            # Every frame is the same size, so the detector only needs
-            # configuring once - do it before the workers start rather than
-            # from inside them.
-            with timed_log(logger, "warmup_video_models"):
-                get_model_registry().warmup_for_frames(
-                    (height, width),
-                    restore=restore_enabled,
-                    hyperswap=effective_swap_model != SWAP_MODEL_INSWAPPER,
-                )
-
-            worker_count = resolve_worker_count(get_settings().video_worker_count)
-            cpu_total = os.cpu_count() or 1
-            with timed_log(
-                logger,
-                "swap_remote_video_inference",
-                restore_enabled=restore_enabled,
-                worker_count=worker_count,
-                cpu_total=cpu_total,
-            ):
-                frame_count = swap_video_frames(
-                    cap,
-                    writer,
-                    swap_one,
-                    worker_count=worker_count,
-                    on_progress=report_progress if progress_url else None,
-                    progress_every=report_every,
-                )
-
-            if frame_count == 0:
-                raise HTTPException(status_code=400, detail="Video has no readable frames")
-
-            writer.release()
-            writer = None
-
-            with timed_log(logger, "transcode_output_video", frame_count=frame_count):
-                _transcode_to_h264_mp4(raw_output_path, output_path, logger)
+    @app.post("/jobs/video", status_code=202)
+    async def submit_video_job(
+        enable_restore: str = Form("0"),
+        manual_gender: Optional[str] = Form(None),
+        swap_model: Optional[str] = Form(None),
+        progress_url: Optional[str] = Form(None),
+        callback_token: Optional[str] = Form(None),
+        storage_key: Optional[str] = Form(None),
+        storage_repo: Optional[str] = Form(None),
+        storage_repo_type: Optional[str] = Form(None),
+        storage_branch: Optional[str] = Form(None),
+        idempotency_key: Optional[str] = Form(None),
+        model_file: UploadFile = File(...),
+        target_video: UploadFile = File(...),
+    ):
+        """Queue a video swap and return its job id without waiting for it.
 
-            with timed_log(logger, "encode_output_video", frame_count=frame_count):
-                with open(output_path, "rb") as file_obj:
-                    output_bytes = file_obj.read()
+        Takes the same fields as /swap-remote-video (minus the ignored
+        compatibility ones) and validates them up front, so a job that is
+        accepted can only fail on the video itself.
+        """
+        model_bytes = await _read_upload(model_file, MODEL_FILE_MAX_BYTES, "model_file")
+        _parse_video_params(model_bytes, enable_restore, manual_gender, swap_model, logger)
+        storage = _storage_fields(storage_key, storage_repo, storage_repo_type, storage_branch)
 
-            logger.info(
-                "video_encoded",
-                extra={
-                    "event": "video_encoded",
-                    "output_path": output_path,
-                    "frame_count": frame_count,
-                },
+        input_suffix = os.path.splitext(target_video.filename or "video.mp4")[1] or ".mp4"
+        job_id = video_jobs.new_job_id()
+        job_dir = video_jobs.job_path(job_id)
+        spec = {
+            "input_filename": f"input{input_suffix}",
+            "model_filename": "model.safetensors",
+            "enable_restore": enable_restore,
+            "manual_gender": manual_gender,
+            "swap_model": swap_model,
+            "progress_url": progress_url,
+            "callback_token": callback_token,
+            "storage": list(storage),
+            "idempotency_key": (idempotency_key or "").strip() or None,
+        }
+        try:
+            await _spool_upload(
+                target_video,
+                os.path.join(job_dir, spec["input_filename"]),
+                video_upload_max_bytes,
+                "target_video",
             )
-            output_key, repo_id, repo_type, branch = _storage_fields(
-                storage_key,
-                storage_repo,
-                storage_repo_type,
-                storage_branch,
+            with open(os.path.join(job_dir, spec["model_filename"]), "wb") as file_obj:
+                file_obj.write(model_bytes)
+            video_jobs.submit(job_id, spec)
+        except JobQueueFull as exc:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise HTTPException(
+                status_code=429,
+                detail=str(exc),
+                headers={"Retry-After": str(exc.retry_after)},
             )
-            with timed_log(logger, "upload_output_video", frame_count=frame_count):
-                output_size = upload_output(
-                    output_path,
-                    output_key,
-                    repo_id,
-                    repo_type,
-                    branch,
-                    commit_message=f"Store generated video {output_key}",
-                )
-            return JSONResponse(
-                content={
-                    "status": "completed",
-                    "storage_provider": "huggingface",
-                    "storage_key": output_key,
-                    "filename": output_key.rsplit("/", 1)[-1],
-                    "mime_type": "video/mp4",
-                    "size": output_size,
-                    "total_frames": total_frames or 0,
-                    "processed_frames": frame_count,
-                    "progress_percent": 100,
-                }
+        except BaseException:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        return JSONResponse(status_code=202, content={"job_id": job_id, "status": JOB_QUEUED})
+
+    @app.get("/jobs/{job_id}")
+    async def get_video_job(job_id: str):
+        job = video_jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job_view(job)
+
+    @app.delete("/jobs/{job_id}")
+    async def cancel_video_job(job_id: str):
+        job = video_jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job["status"] in TERMINAL_STATES:
+            raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+        return job_view(video_jobs.cancel(job_id))
+
+    @app.post("/swap-video-segment")
+    async def swap_video_segment(
+        enable_restore: str = Form("0"),
+        manual_gender: Optional[str] = Form(None),
+        swap_model: Optional[str] = Form(None),
+        model_file: UploadFile = File(...),
+        target_video: UploadFile = File(...),
+    ):
+        """Swap one segment of a sharded job and return it as H.264 MP4.
+
+        Called by a coordinator (see video_shards.py), not by the API. The
+        segment is swapped exactly like a whole video, minus progress and
+        storage; the frame count comes back in a response header.
+        """
+        model_bytes = await _read_upload(model_file, MODEL_FILE_MAX_BYTES, "model_file")
+        params = _parse_video_params(model_bytes, enable_restore, manual_gender, swap_model, logger)
+
+        output_path = ""
+        sent = False
+        try:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as output_file:
+                output_path = output_file.name
+            async with _upload_on_disk(
+                target_video, video_upload_max_bytes, "target_video", ".mp4"
+            ) as input_path:
+                with timed_log(logger, "swap_video_segment"):
+                    result = await video_gate.run(
+                        swap_video_file, swap_service, input_path, output_path, params
+                    )
+            # Streamed from disk; the file is removed once it has been sent.
+            response = FileResponse(
+                output_path,
+                media_type="video/mp4",
+                headers={PROCESSED_FRAMES_HEADER: str(result.frame_count)},
+                background=BackgroundTask(os.remove, output_path),
             )
-        except HTTPException:
+            sent = True
+            return response
+        except (HTTPException, GateFull):
             raise
+        except VideoInputError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
         except Exception as exc:
             logger.exception(
-                "swap_remote_video_failed",
-                extra={"event": "swap_remote_video_failed", "error": str(exc)},
+                "swap_video_segment_failed",
+                extra={"event": "swap_video_segment_failed", "error": str(exc)},
             )
-            raise HTTPException(status_code=500, detail=f"Video swap failed: {exc}")
+            raise HTTPException(status_code=500, detail=f"Segment swap failed: {exc}")
         finally:
-            if cap is not None:
-                cap.release()
-            if writer is not None:
-                writer.release()
-            if input_path and os.path.exists(input_path):
-                os.remove(input_path)
-            if raw_output_path and os.path.exists(raw_output_path):
-                os.remove(raw_output_path)
-            if output_path and os.path.exists(output_path):
+            if not sent and output_path and os.path.exists(output_path):
                 os.remove(output_path)
 
     return app
@@ -0,0 +1,76 @@
+"""Cache directories shared by several processes.
+
+The result and face-analysis caches keep their entries as files, and under
+the prefork server (serve.py) every worker uses the same directory. So no
+worker may treat what it finds there as its own:
+
+- A `.tmp` file, or a data file whose companion is not written yet, may be
+  another worker's write in progress; only ones older than `STALE_AGE_S`
+  are left over from a crash and removed.
+- Another worker may remove any file at any moment, so removals tolerate
+  one that is already gone.
+- The byte budget covers the whole directory. A cache re-reads the
+  directory under `lock_path`'s lock before evicting (`scan_entries`), and
+  file mtimes order the entries across workers. Writes and hits set them
+  with `touch`: the filesystem's own timestamps can be too coarse to order
+  a hit against the write just after it.
+"""
+
+import os
+import time
+from typing import List, Optional, Tuple
+
+STALE_AGE_S = 3600
+# How long a cache trusts its own view of the directory's size before
+# re-reading it; writes by other workers in between can overshoot the budget
+# by that much.
+RESCAN_INTERVAL_S = 5.0
+
+
+def lock_path(root: str) -> str:
+    return os.path.join(root, ".lock")
+
+
+def touch(path: str) -> None:
+    """Mark `path` as used now, to the nanosecond."""
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+def remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def scan_entries(
+    root: str, suffix: str, companion_suffix: Optional[str] = None
+) -> List[Tuple[int, str, int]]:
+    """(mtime in ns, key, size) of every `<key><suffix>` file in `root`, oldest first.
+
+    With `companion_suffix`, a file counts only once `<key><companion_suffix>`
+    exists too. Stale leftovers are removed on the way.
+    """
+    now = time.time()
+    found = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        stale = now - stat.st_mtime > STALE_AGE_S
+        if name.endswith(".tmp"):
+            if stale:
+                remove_quietly(path)
+            continue
+        if not name.endswith(suffix):
+            continue
+        key = name[: -len(suffix)]
+        if companion_suffix and not os.path.exists(os.path.join(root, key + companion_suffix)):
+            if stale:
+                remove_quietly(path)
+            continue
+        found.append((stat.st_mtime_ns, key, stat.st_size))
+    return sorted(found)
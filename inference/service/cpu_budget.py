@@ -0,0 +1,184 @@
+"""One CPU budget shared by ONNX Runtime sessions, video workers and requests.
+
+Every ONNX Runtime session used to size its intra-op pool to the whole
+machine, while the image gate ran several calls at once and each video job
+added its own workers on top - a dozen concurrent calls, each expecting every
+core. They oversubscribed the CPU and mostly slowed each other down (see the
+worker scaling table in video_swap.py).
+
+`CpuBudget` owns the cores instead. It splits them into *slots* of
+`threads_per_call` cores and sizes every session's intra-op pool to one slot,
+so N concurrent calls keep N slots busy. Image requests get a fixed share of
+slots, one per `INFERENCE_CONCURRENCY`; video jobs lease their worker count
+from the rest and hand it back when they finish. A job that finds every video
+slot taken still gets one worker, so it never waits on the budget - it just
+runs narrower.
+
+The budget is opt-in: it only splits the cores once `CPU_THREADS_PER_CALL`
+or `CPU_BUDGET_CORES` is set. Sized automatically it cost more than it saved
+on small machines - one thread per GPEN call on 8 cores, a single video worker
+on 4. Unset, sessions keep ONNX Runtime's own thread count and video jobs get
+the workers `VIDEO_WORKER_COUNT` asks for; leases are still counted in
+`/health`.
+
+With `CPU_PIN_WORKERS`, process-executor video workers are also pinned to
+disjoint slices of the video share, so their ONNX Runtime threads stay off
+the cores image requests use.
+"""
+
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from .observability import get_logger
+from .settings import Settings, get_settings
+from .video_swap import resolve_worker_count
+
+logger = get_logger("inference.cpu_budget")
+
+
+def available_cores() -> List[int]:
+    """Cores this process may run on, honouring any affinity it was started with."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+class VideoLease:
+    """Worker slots held by one video job. Release exactly once, or use `with`."""
+
+    def __init__(self, budget: "CpuBudget", workers: int):
+        self._budget = budget
+        self.workers = workers
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._budget._release_video(self.workers)
+
+    def __enter__(self) -> "VideoLease":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class CpuBudget:
+    """`threads_per_call` 0 leaves the cores unsplit (see above)."""
+
+    def __init__(self, cores: List[int], threads_per_call: int, image_slots: int):
+        self.cores = list(cores) or [0]
+        self.bounded = threads_per_call > 0
+        self.threads_per_call = max(0, min(threads_per_call, len(self.cores)))
+        self.slots = max(1, len(self.cores) // max(1, self.threads_per_call))
+        self.image_slots = max(0, min(image_slots, self.slots))
+        self.video_slots = max(1, self.slots - self.image_slots)
+        self._lock = threading.Lock()
+        self._video_in_use = 0
+        self._leases = 0
+        self._narrowed = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "CpuBudget":
+        cores = available_cores()
+        if settings.cpu_budget_cores <= 0 and settings.cpu_threads_per_call <= 0:
+            return cls(cores, threads_per_call=0, image_slots=settings.inference_concurrency)
+        if settings.cpu_budget_cores > 0:
+            cores = cores[: settings.cpu_budget_cores]
+        elif len(cores) > 1:
+            # One core stays out of the budget for the event loop, decoding,
+            # encoding and progress posts.
+            cores = cores[1:]
+        threads_per_call = settings.cpu_threads_per_call
+        if threads_per_call <= 0:
+            video_callers = settings.video_request_concurrency * resolve_worker_count(
+                settings.video_worker_count, cpu_count=len(cores) + 1
+            )
+            callers = max(1, settings.inference_concurrency + video_callers)
+            threads_per_call = max(1, len(cores) // callers)
+        return cls(cores, threads_per_call, image_slots=settings.inference_concurrency)
+
+    def lease_video_workers(self, requested: int) -> VideoLease:
+        """Grant up to `requested` workers from the free video slots, at least one.
+
+        Unbounded, every request is granted in full.
+        """
+        with self._lock:
+            free = self.video_slots - self._video_in_use
+            granted = max(1, min(requested, free)) if self.bounded else max(1, requested)
+            self._video_in_use += granted
+            self._leases += 1
+            if granted < requested:
+                self._narrowed += 1
+            in_use = self._video_in_use
+        logger.info(
+            "video_workers_leased",
+            extra={
+                "event": "video_workers_leased",
+                "requested": requested,
+                "granted": granted,
+                "video_slots_in_use": in_use,
+                "video_slots": self.video_slots,
+            },
+        )
+        return VideoLease(self, granted)
+
+    def worker_cpu_sets(self, worker_count: int) -> List[List[int]]:
+        """Disjoint core slices of the video share, one per process worker."""
+        video_cores = self.cores[self.image_slots * self.threads_per_call:] or self.cores
+        # Unbounded, the workers split the cores evenly.
+        width = self.threads_per_call or max(1, len(video_cores) // max(1, worker_count))
+        sets = []
+        for index in range(worker_count):
+            start = (index * width) % len(video_cores)
+            sets.append(
+                [
+                    video_cores[(start + offset) % len(video_cores)]
+                    for offset in range(min(width, len(video_cores)))
+                ]
+            )
+        return sets
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "bounded": self.bounded,
+                "cores": len(self.cores),
+                "threads_per_call": self.threads_per_call,
+                "slots": self.slots,
+                "image_slots": self.image_slots,
+                "video_slots": self.video_slots,
+                "video_slots_in_use": self._video_in_use,
+                "video_leases": self._leases,
+                "video_leases_narrowed": self._narrowed,
+            }
+
+    def _release_video(self, workers: int) -> None:
+        with self._lock:
+            self._video_in_use = max(0, self._video_in_use - workers)
+
+
+_BUDGET: Optional[CpuBudget] = None
+_BUDGET_LOCK = threading.Lock()
+
+
+def get_cpu_budget() -> CpuBudget:
+    global _BUDGET
+    if _BUDGET is None:
+        with _BUDGET_LOCK:
+            if _BUDGET is None:
+                _BUDGET = CpuBudget.from_settings(get_settings())
+                logger.info(
+                    "cpu_budget_configured",
+                    extra={"event": "cpu_budget_configured", **_BUDGET.stats()},
+                )
+    return _BUDGET
+
+
+def use_cpu_budget(budget: CpuBudget) -> None:
+    """Install `budget` for this process; process workers inherit their parent's."""
+    global _BUDGET
+    with _BUDGET_LOCK:
+        _BUDGET = budget
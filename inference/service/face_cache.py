@@ -0,0 +1,193 @@
+"""Cache of face analysis results for target images.
+
+Users try several source models on the same target photo, and every attempt
+used to run the full analyzer (detection, recognition, genderage, landmarks)
+on identical pixels. The analysis depends only on the image, the detection
+size and the analysis profile (for swaps, the gender filter too), never on
+the source embedding, so it is cached by a hash of the decoded pixels plus
+those.
+
+Each face is stored as its plain fields - bbox, kps, det_score,
+landmark_2d_106, gender, age, embedding - and rebuilt as an insightface
+`Face` on the way out. Entries live in a bounded in-memory LRU and, when
+`FACE_CACHE_DIR` is set, in `.npz` files there too, so a restart keeps them.
+The disk copy is trimmed to `FACE_CACHE_DISK_MAX_MB`, least recently used
+first. Prefork workers share the directory, its entries and its budget (see
+cache_dir.py).
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .cache_dir import RESCAN_INTERVAL_S, lock_path, remove_quietly, scan_entries, touch
+from .model_manifest import file_lock
+from .observability import get_logger
+
+logger = get_logger("inference.face_cache")
+
+FaceFields = Dict[str, Any]
+
+
+def image_key(img_bgr: np.ndarray, det_size: int, variant: str) -> str:
+    """`variant` names the analysis profile the faces were produced with."""
+    digest = hashlib.sha256()
+    digest.update(
+        f"{img_bgr.shape}|{img_bgr.dtype.str}|{det_size}|{variant}".encode("utf-8")
+    )
+    digest.update(np.ascontiguousarray(img_bgr).data)
+    return digest.hexdigest()
+
+
+def _to_fields(face) -> FaceFields:
+    return {name: value for name, value in dict(face).items() if value is not None}
+
+
+class FaceAnalysisCache:
+    """LRU of per-image face lists, optionally mirrored to disk."""
+
+    def __init__(self, max_entries: int, disk_dir: str = "", disk_max_bytes: int = 0):
+        self._max_entries = max(1, max_entries)
+        self._disk_dir = disk_dir
+        self._disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, List[FaceFields]]" = OrderedDict()
+        # key -> file size, least recently used first.
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._next_disk_scan = 0.0
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def get(self, key: str) -> Optional[List]:
+        # Imported on use, like every insightface import, to keep startup fast.
+        from insightface.app.common import Face
+
+        with self._lock:
+            fields = self._memory.get(key)
+            if fields is not None:
+                self._memory.move_to_end(key)
+                self._stats["hits"] += 1
+                return [Face(face) for face in fields]
+        # Looked up on disk even when not indexed: another worker may have
+        # written it.
+        if self._disk_dir:
+            fields = self._read_disk(key)
+            if fields is not None:
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                    self._remember(key, fields)
+                return [Face(face) for face in fields]
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key: str, faces: List) -> None:
+        fields = [_to_fields(face) for face in faces]
+        with self._lock:
+            self._remember(key, fields)
+        if self._disk_dir:
+            self._write_disk(key, fields)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._memory),
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def _remember(self, key: str, fields: List[FaceFields]) -> None:
+        self._memory[key] = fields
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._disk_dir, key + ".npz")
+
+    def _read_disk(self, key: str) -> Optional[List[FaceFields]]:
+        try:
+            with np.load(self._path(key), allow_pickle=False) as archive:
+                count = int(archive["count"])
+                fields: List[FaceFields] = [{} for _ in range(count)]
+                for name in archive.files:
+                    if name == "count":
+                        continue
+                    index, field = name.split(".", 1)
+                    value = archive[name]
+                    fields[int(index)][field] = value if value.ndim else value.item()
+            touch(self._path(key))
+            size = os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            # Never written, or evicted by another worker.
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(key, 0)
+            return None
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self._drop_disk(key)
+            return None
+        with self._lock:
+            if key not in self._disk:
+                self._disk[key] = size
+                self._disk_bytes += size
+            # Evicted least recently used, like the memory tier.
+            self._disk.move_to_end(key)
+        return fields
+
+    def _write_disk(self, key: str, fields: List[FaceFields]) -> None:
+        arrays = {"count": np.asarray(len(fields))}
+        for index, face in enumerate(fields):
+            for name, value in face.items():
+                arrays[f"{index}.{name}"] = np.asarray(value)
+        fd, tmp_path = tempfile.mkstemp(dir=self._disk_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file_obj:
+                np.savez(file_obj, **arrays)
+                size = file_obj.tell()
+            touch(tmp_path)
+            os.replace(tmp_path, self._path(key))
+        except OSError as exc:
+            remove_quietly(tmp_path)
+            logger.warning(
+                "face_cache_write_failed",
+                extra={"event": "face_cache_write_failed", "error": str(exc)},
+            )
+            return
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(key, 0)
+            self._disk[key] = size
+            self._disk_bytes += size
+            if (
+                self._disk_bytes <= self._disk_max_bytes
+                and time.monotonic() < self._next_disk_scan
+            ):
+                return
+            # Other workers write to the same directory: re-read it, then
+            # evict from the whole of it, one worker at a time.
+            with file_lock(lock_path(self._disk_dir)):
+                self._load_disk_index()
+                while self._disk_bytes > self._disk_max_bytes and self._disk:
+                    self._drop_disk(next(iter(self._disk)))
+
+    def _drop_disk(self, key: str) -> None:
+        self._disk_bytes -= self._disk.pop(key, 0)
+        remove_quietly(self._path(key))
+
+    def _load_disk_index(self) -> None:
+        self._disk.clear()
+        self._disk_bytes = 0
+        for _, key, size in scan_entries(self._disk_dir, ".npz"):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._next_disk_scan = time.monotonic() + RESCAN_INTERVAL_S
@@ -1,10 +1,10 @@
+from contextlib import ExitStack, contextmanager
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from typing import TYPE_CHECKING, List, Optional, Tuple
 
 import cv2
 import numpy as np
 from PIL import Image
-from insightface.utils.face_align import estimate_norm
 
 from .face_mask import (
     combine_masks,
@@ -15,10 +15,21 @@ from .face_mask import (
     match_color_lab,
     paste_back,
 )
-from .model_registry import ModelRegistry, get_model_registry
+from .face_cache import image_key
+from .model_registry import (
+    MODEL_GPEN,
+    MODEL_HYPERSWAP,
+    MODEL_OCCLUDER,
+    ModelRegistry,
+    get_model_registry,
+)
 from .observability import get_logger, timed_log
 from .settings import get_settings
 
+if TYPE_CHECKING:
+    from .face_cache import FaceAnalysisCache
+    from .micro_batcher import ModelBatcher
+
 SWAP_MODEL_INSWAPPER = "inswapper_128"
 SWAP_MODEL_HYPERSWAP = "hyperswap_256"
 VALID_SWAP_MODELS = {SWAP_MODEL_INSWAPPER, SWAP_MODEL_HYPERSWAP}
@@ -38,6 +49,19 @@ logger = get_logger("inference.face_swap")
 GENDER_FEMALE = "F"
 GENDER_MALE = "M"
 
+# Face analysis profiles. Detection always runs; each profile then runs only
+# the insightface modules its call site reads:
+#   swap      - genderage when a gender filter applies, then the 106-point
+#               landmarks the swap mask needs, on the faces that will be
+#               swapped only. The target's own embedding is never used.
+#   embedding - recognition and genderage, on the primary face only.
+#   full      - every module on every face, as FaceAnalysis.get does (eval).
+# Detection itself goes through the registry's per-size detector pool rather
+# than the analyzer's own, shared detector.
+ANALYSIS_PROFILE_SWAP = "swap"
+ANALYSIS_PROFILE_EMBEDDING = "embedding"
+ANALYSIS_PROFILE_FULL = "full"
+
 
 def _face_sex(face) -> Optional[str]:
     """Return 'M' or 'F' from face.sex, or None if not available."""
@@ -52,6 +76,36 @@ def _face_sex(face) -> Optional[str]:
     return None
 
 
+def _batchable(session) -> bool:
+    """True when every input of `session` has a free leading (batch) axis."""
+    for inp in session.get_inputs():
+        if not inp.shape:
+            return False
+        dim = inp.shape[0]
+        if isinstance(dim, int) and dim > 0:
+            return False
+    return True
+
+
+def run_batched(session, feeds: List[dict], output_name: str) -> List[np.ndarray]:
+    """Run `session` over several single-item feeds, as one call if possible.
+
+    Each feed holds batch-of-one arrays. When the model's batch axis is
+    dynamic they are concatenated into a single ONNX Runtime call - on CPU a
+    small batch gets noticeably more throughput per item than the same items
+    one at a time - and the output is split back into batch-of-one arrays in
+    feed order. Models exported with a fixed batch of 1 are run per feed.
+    """
+    if len(feeds) == 1 or not _batchable(session):
+        return [session.run([output_name], feed)[0] for feed in feeds]
+
+    names = list(feeds[0])
+    batch = {name: np.concatenate([feed[name] for feed in feeds], axis=0) for name in names}
+    with timed_log(logger, "batched_inference", batch_size=len(feeds)):
+        out = session.run([output_name], batch)[0]
+    return [out[i : i + 1] for i in range(len(feeds))]
+
+
 class FaceSwapService:
     """Swaps faces by working entirely in a high-resolution aligned crop.
 
@@ -63,34 +117,72 @@ class FaceSwapService:
     the face alone instead of a rectangle of hair and background.
     """
 
-    def __init__(self, registry: Optional[ModelRegistry] = None):
+    def __init__(
+        self,
+        registry: Optional[ModelRegistry] = None,
+        batcher: Optional["ModelBatcher"] = None,
+        face_cache: Optional["FaceAnalysisCache"] = None,
+    ):
         self._registry = registry or get_model_registry()
         self._settings = get_settings()
+        # When set, swap and restore calls are pooled with those of other
+        # concurrent requests (see micro_batcher.py).
+        self._batcher = batcher
+        # When set, analysis of uploaded images is reused across requests
+        # (see face_cache.py). Video frames never go through it.
+        self._face_cache = face_cache
+
+    @contextmanager
+    def _swap_sessions(self, use_hyperswap: bool, enable_restore: bool):
+        """(hyperswap, GPEN) sessions for a swap, None where not asked for.
+
+        Both are leased from the registry for the duration of the block, so
+        idle eviction cannot drop either while the swap uses it.
+        """
+        with ExitStack() as leases:
+            yield (
+                leases.enter_context(self._registry.lease(MODEL_HYPERSWAP))
+                if use_hyperswap
+                else None,
+                leases.enter_context(self._registry.lease(MODEL_GPEN)) if enable_restore else None,
+            )
 
-    @staticmethod
-    def _run_gpen_on_patch(patch_bgr: np.ndarray, gpen_session) -> np.ndarray:
+    def _run_model(self, session, feeds: List[dict], output_name: str) -> List[np.ndarray]:
+        if self._batcher is not None:
+            return self._batcher.run(session, feeds, output_name)
+        return run_batched(session, feeds, output_name)
+
+    def _run_gpen_on_patches(self, patches_bgr: List[np.ndarray], gpen_session) -> List[np.ndarray]:
+        """Restore a list of patches, in one batched call where the model allows."""
         gpen_input_name = gpen_session.get_inputs()[0].name
         gpen_output_name = gpen_session.get_outputs()[0].name
-        h, w = patch_bgr.shape[:2]
-
-        if (h, w) == (GPEN_INPUT_SIZE, GPEN_INPUT_SIZE):
-            patch_resized = patch_bgr
-        else:
-            patch_resized = cv2.resize(
-                patch_bgr,
-                (GPEN_INPUT_SIZE, GPEN_INPUT_SIZE),
-                interpolation=cv2.INTER_LINEAR,
-            )
-
-        blob = patch_resized.astype(np.float32) / 127.5 - 1.0
-        blob = np.transpose(blob, (2, 0, 1))[np.newaxis, :]
-        out = gpen_session.run([gpen_output_name], {gpen_input_name: blob})[0][0]
-        out = np.transpose(out, (1, 2, 0))
-        out = ((out + 1.0) * 127.5).clip(0, 255).astype(np.uint8)
 
-        if out.shape[:2] == (h, w):
-            return out
-        return cv2.resize(out, (w, h), interpolation=cv2.INTER_LINEAR)
+        feeds = []
+        for patch_bgr in patches_bgr:
+            if patch_bgr.shape[:2] == (GPEN_INPUT_SIZE, GPEN_INPUT_SIZE):
+                patch_resized = patch_bgr
+            else:
+                patch_resized = cv2.resize(
+                    patch_bgr,
+                    (GPEN_INPUT_SIZE, GPEN_INPUT_SIZE),
+                    interpolation=cv2.INTER_LINEAR,
+                )
+            blob = patch_resized.astype(np.float32) / 127.5 - 1.0
+            feeds.append({gpen_input_name: np.transpose(blob, (2, 0, 1))[np.newaxis, :]})
+
+        restored = []
+        outputs = self._run_model(gpen_session, feeds, gpen_output_name)
+        for patch_bgr, out in zip(patches_bgr, outputs):
+            out = np.transpose(out[0], (1, 2, 0))
+            out = ((out + 1.0) * 127.5).clip(0, 255).astype(np.uint8)
+            h, w = patch_bgr.shape[:2]
+            if out.shape[:2] != (h, w):
+                out = cv2.resize(out, (w, h), interpolation=cv2.INTER_LINEAR)
+            restored.append(out)
+        return restored
+
+    def _run_gpen_on_patch(self, patch_bgr: np.ndarray, gpen_session) -> np.ndarray:
+        return self._run_gpen_on_patches([patch_bgr], gpen_session)[0]
 
     def _build_swap_mask(
         self,
@@ -120,15 +212,15 @@ class FaceSwapService:
             region_mask = create_ellipse_mask(size)
 
         occlusion_mask = None
-        occluder_session = self._registry.get_occluder_session()
-        if occluder_session is not None:
-            try:
-                occlusion_mask = create_occlusion_mask(aligned_bgr, occluder_session)
-            except Exception as exc:
-                logger.warning(
-                    "occlusion_mask_failed",
-                    extra={"event": "occlusion_mask_failed", "error": str(exc)},
-                )
+        with self._registry.lease(MODEL_OCCLUDER) as occluder_session:
+            if occluder_session is not None:
+                try:
+                    occlusion_mask = create_occlusion_mask(aligned_bgr, occluder_session)
+                except Exception as exc:
+                    logger.warning(
+                        "occlusion_mask_failed",
+                        extra={"event": "occlusion_mask_failed", "error": str(exc)},
+                    )
 
         mask = combine_masks(box_mask, region_mask, occlusion_mask)
         return box_mask if mask is None else mask
@@ -179,16 +271,32 @@ class FaceSwapService:
     ) -> np.ndarray:
         """Restore, colour match and paste one swapped crop into the frame."""
         mask = self._build_swap_mask(aligned_target, face, matrix_hi)
-
         if gpen_session is not None:
-            with timed_log(logger, "restore_face", crop_size=crop.shape[0]):
-                restored = self._run_gpen_on_patch(crop, gpen_session)
-            blend = float(np.clip(self._settings.restore_blend, 0.0, 1.0))
-            if blend < 1.0:
-                crop = cv2.addWeighted(restored, blend, crop, 1.0 - blend, 0.0)
-            else:
-                crop = restored
+            crop = self._restore_crops([crop], gpen_session)[0]
+        return self._match_and_paste(img_bgr, crop, aligned_target, mask, matrix_hi)
+
+    def _restore_crops(self, crops: List[np.ndarray], gpen_session) -> List[np.ndarray]:
+        """Run GPEN over `crops` and blend each result back by RESTORE_BLEND."""
+        with timed_log(
+            logger, "restore_face", crop_size=crops[0].shape[0], face_count=len(crops)
+        ):
+            restored = self._run_gpen_on_patches(crops, gpen_session)
+        blend = float(np.clip(self._settings.restore_blend, 0.0, 1.0))
+        if blend >= 1.0:
+            return restored
+        return [
+            cv2.addWeighted(r, blend, crop, 1.0 - blend, 0.0)
+            for r, crop in zip(restored, crops)
+        ]
 
+    def _match_and_paste(
+        self,
+        img_bgr: np.ndarray,
+        crop: np.ndarray,
+        aligned_target: np.ndarray,
+        mask: np.ndarray,
+        matrix_hi: np.ndarray,
+    ) -> np.ndarray:
         with timed_log(logger, "match_color", crop_size=crop.shape[0]):
             crop = match_color_lab(
                 crop,
@@ -199,6 +307,96 @@ class FaceSwapService:
 
         return paste_back(img_bgr, crop, mask, matrix_hi)
 
+    @staticmethod
+    def _inswapper_input(img_bgr: np.ndarray, face, swapper) -> Tuple[np.ndarray, np.ndarray]:
+        """Aligned, normalised inswapper input blob and its frame -> crop matrix.
+
+        Mirrors `INSwapper.get`, split out so several crops can share one
+        session call.
+        """
+        # insightface is imported where it is used: importing any part of it
+        # loads the whole package, which takes longer than the service needs
+        # to start (see "Startup" in the README).
+        from insightface.utils.face_align import norm_crop2
+
+        size = swapper.input_size[0]
+        aimg, M = norm_crop2(img_bgr, face.kps, size)
+        mean = swapper.input_mean
+        blob = cv2.dnn.blobFromImage(
+            aimg, 1.0 / swapper.input_std, swapper.input_size, (mean, mean, mean), swapRB=True
+        )
+        return blob, M
+
+    @staticmethod
+    def _inswapper_latent(normed_embedding: np.ndarray, swapper) -> np.ndarray:
+        latent = np.dot(normed_embedding.reshape((1, -1)), swapper.emap)
+        return latent / np.linalg.norm(latent)
+
+    def _inswapper_outputs(
+        self, swapper, blobs: List[np.ndarray], latent: np.ndarray
+    ) -> List[np.ndarray]:
+        """Run inswapper over `blobs`, returning one BGR uint8 crop per blob."""
+        target_name, latent_name = swapper.input_names[0], swapper.input_names[1]
+        feeds = [{target_name: blob, latent_name: latent} for blob in blobs]
+        outputs = self._run_model(swapper.session, feeds, swapper.output_names[0])
+        return [
+            np.ascontiguousarray(
+                np.clip(255 * pred.transpose((0, 2, 3, 1))[0], 0, 255).astype(np.uint8)[:, :, ::-1]
+            )
+            for pred in outputs
+        ]
+
+    @staticmethod
+    def _hyperswap_input(img_bgr: np.ndarray, face) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Aligned hyperswap input batch and its matrix, or None without kps."""
+        kps = getattr(face, "kps", None)
+        if kps is None or len(kps) < 5:
+            return None
+
+        from insightface.utils.face_align import estimate_norm
+
+        M = estimate_norm(kps[:5].astype(np.float32), 256, mode="arcface")
+        if M is None:
+            return None
+        aimg = cv2.warpAffine(img_bgr, M, (256, 256), flags=cv2.INTER_LINEAR)
+
+        target_rgb = aimg[:, :, ::-1].copy().astype(np.float32)
+        target_norm = target_rgb / 127.5 - 1.0
+        target_batch = np.transpose(target_norm, (2, 0, 1))[np.newaxis, :].astype(np.float32)
+        return target_batch, M
+
+    @staticmethod
+    def _hyperswap_embedding(source_embedding: np.ndarray) -> np.ndarray:
+        emb = np.asarray(source_embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(emb)
+        emb = (emb / norm) if norm > 0 else emb
+        return emb[np.newaxis, :]
+
+    def _hyperswap_outputs(
+        self,
+        hyperswap_session, target_batches: List[np.ndarray], emb_batch: np.ndarray
+    ) -> List[np.ndarray]:
+        """Run hyperswap over `target_batches`, returning BGR uint8 crops."""
+        feeds = []
+        for target_batch in target_batches:
+            feed = {}
+            for inp in hyperswap_session.get_inputs():
+                if len(inp.shape) == 4:
+                    feed[inp.name] = target_batch
+                else:
+                    feed[inp.name] = emb_batch
+            feeds.append(feed)
+
+        results = []
+        output_name = hyperswap_session.get_outputs()[0].name
+        for out in self._run_model(hyperswap_session, feeds, output_name):
+            swapped = out[0]
+            if swapped.shape[0] == 3:
+                swapped = np.transpose(swapped, (1, 2, 0))
+            swapped_uint8 = ((swapped + 1.0) * 127.5).clip(0, 255).astype(np.uint8)
+            results.append(np.ascontiguousarray(swapped_uint8[:, :, ::-1]))
+        return results
+
     def _run_inswapper(
         self,
         img_bgr: np.ndarray,
@@ -213,8 +411,9 @@ class FaceSwapService:
         bleeds swapped pixels onto hair, glasses and background; the mask built
         here follows the face itself.
         """
-        bgr_fake, M = swapper.get(img_bgr, face, source_face, paste_back=False)
-        bgr_fake = np.ascontiguousarray(bgr_fake)
+        blob, M = self._inswapper_input(img_bgr, face, swapper)
+        latent = self._inswapper_latent(source_face.normed_embedding, swapper)
+        bgr_fake = self._inswapper_outputs(swapper, [blob], latent)[0]
 
         crop, aligned_target, matrix_hi = self._upscale_to_crop_space(img_bgr, bgr_fake, M)
         return self._finalize_crop(
@@ -229,38 +428,12 @@ class FaceSwapService:
         hyperswap_session,
         gpen_session,
     ) -> np.ndarray:
-        kps = getattr(face, "kps", None)
-        if kps is None or len(kps) < 5:
+        prepared = self._hyperswap_input(img_bgr, face)
+        if prepared is None:
             return img_bgr
-
-        M = estimate_norm(kps[:5].astype(np.float32), 256, mode="arcface")
-        if M is None:
-            return img_bgr
-        aimg = cv2.warpAffine(img_bgr, M, (256, 256), flags=cv2.INTER_LINEAR)
-
-        emb = np.asarray(source_embedding, dtype=np.float32).ravel()
-        norm = np.linalg.norm(emb)
-        emb = (emb / norm) if norm > 0 else emb
-        emb_batch = emb[np.newaxis, :]
-
-        target_rgb = aimg[:, :, ::-1].copy().astype(np.float32)
-        target_norm = target_rgb / 127.5 - 1.0
-        target_batch = np.transpose(target_norm, (2, 0, 1))[np.newaxis, :].astype(np.float32)
-
-        feed = {}
-        for inp in hyperswap_session.get_inputs():
-            if len(inp.shape) == 4:
-                feed[inp.name] = target_batch
-            else:
-                feed[inp.name] = emb_batch
-
-        out = hyperswap_session.run([hyperswap_session.get_outputs()[0].name], feed)[0]
-        swapped = out[0]
-        if swapped.shape[0] == 3:
-            swapped = np.transpose(swapped, (1, 2, 0))
-
-        swapped_uint8 = ((swapped + 1.0) * 127.5).clip(0, 255).astype(np.uint8)
-        swapped_bgr = np.ascontiguousarray(swapped_uint8[:, :, ::-1])
+        target_batch, M = prepared
+        emb_batch = self._hyperswap_embedding(source_embedding)
+        swapped_bgr = self._hyperswap_outputs(hyperswap_session, [target_batch], emb_batch)[0]
 
         crop, aligned_target, matrix_hi = self._upscale_to_crop_space(
             img_bgr, swapped_bgr, M
@@ -270,8 +443,8 @@ class FaceSwapService:
         )
 
     @staticmethod
-    def _select_faces(faces, source_gender: Optional[str]) -> Tuple[List, int]:
-        """Apply the gender filter, returning (faces to swap, skipped count).
+    def _gender_selection(faces, source_gender: Optional[str]) -> Tuple[List, bool]:
+        """(faces passing the gender filter, whether the fallback applied).
 
         Faces whose gender the detector couldn't determine are always kept. If
         the filter would reject every face in a single-face image the filter is
@@ -280,14 +453,21 @@ class FaceSwapService:
         identical to a broken swap.
         """
         if source_gender is None:
-            return list(faces), 0
-
+            return list(faces), False
         selected = [
             face
             for face in faces
             if (_face_sex(face) or source_gender) == source_gender
         ]
         if not selected and len(faces) == 1:
+            return list(faces), True
+        return selected, False
+
+    @classmethod
+    def _select_faces(cls, faces, source_gender: Optional[str]) -> Tuple[List, int]:
+        """Apply the gender filter, returning (faces to swap, skipped count)."""
+        selected, fallback = cls._gender_selection(faces, source_gender)
+        if fallback:
             logger.info(
                 "gender_filter_fallback",
                 extra={
@@ -296,7 +476,7 @@ class FaceSwapService:
                     "target_gender": _face_sex(faces[0]),
                 },
             )
-            return list(faces), 0
+            return selected, 0
 
         skipped = len(faces) - len(selected)
         if skipped:
@@ -314,18 +494,106 @@ class FaceSwapService:
         """Returns (embedding, gender) where gender is 'M', 'F', or None."""
         img_rgb = np.array(pil_img)
         img_bgr = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR)
-        self._registry.prepare_face_analyzer_for_image(img_bgr.shape)
+        faces = self._analyze_image(img_bgr, "extract_embedding", ANALYSIS_PROFILE_EMBEDDING)
+        if not faces:
+            return None, None
+        primary_face = faces[0]
+        return primary_face.normed_embedding, _face_sex(primary_face)
+
+    def detect_faces(
+        self,
+        img_bgr: np.ndarray,
+        source_gender: Optional[str] = None,
+        profile: str = ANALYSIS_PROFILE_SWAP,
+    ) -> List:
+        """Analyse one BGR image with `profile` (see ANALYSIS_PROFILE_*).
+
+        For the swap profile, `source_gender` decides which faces get
+        landmarks, so it must match the one later passed to the swap.
+        """
+        return self._run_analyzer(img_bgr, "face_detection_for_swap", profile, source_gender)
+
+    def _run_analyzer(
+        self,
+        img_bgr: np.ndarray,
+        event: str,
+        profile: str,
+        source_gender: Optional[str] = None,
+    ) -> List:
+        from insightface.app.common import Face
+
+        analyzer = self._registry.get_face_analyzer()
+        detector = self._registry.get_detector_for_image(img_bgr.shape)
         with timed_log(
             logger,
-            "extract_embedding",
+            event,
             image_width=img_bgr.shape[1],
             image_height=img_bgr.shape[0],
+            profile=profile,
         ):
-            faces = self._registry.get_face_analyzer().get(img_bgr)
-        if not faces:
-            return None, None
-        primary_face = faces[0]
-        return primary_face.normed_embedding, _face_sex(primary_face)
+            bboxes, kpss = detector.detect(img_bgr, max_num=0, metric="default")
+            faces = [
+                Face(
+                    bbox=bboxes[i, 0:4],
+                    kps=kpss[i] if kpss is not None else None,
+                    det_score=bboxes[i, 4],
+                )
+                for i in range(bboxes.shape[0])
+            ]
+            # Detections come back best-scored first, which is the face
+            # FaceAnalysis.get callers have always taken as faces[0].
+            if profile == ANALYSIS_PROFILE_FULL:
+                modules = [name for name in analyzer.models if name != "detection"]
+                self._annotate_faces(analyzer, img_bgr, faces, modules)
+                return faces
+            if profile == ANALYSIS_PROFILE_EMBEDDING:
+                faces = faces[:1]
+                self._annotate_faces(analyzer, img_bgr, faces, ("recognition", "genderage"))
+                return faces
+
+            if source_gender is not None:
+                self._annotate_faces(analyzer, img_bgr, faces, ("genderage",))
+            selected, _ = self._gender_selection(faces, source_gender)
+            self._annotate_faces(analyzer, img_bgr, selected, ("landmark_2d_106",))
+            return faces
+
+    @staticmethod
+    def _annotate_faces(analyzer, img_bgr: np.ndarray, faces: List, modules) -> None:
+        for name in modules:
+            model = analyzer.models.get(name)
+            if model is None:
+                continue
+            for face in faces:
+                model.get(img_bgr, face)
+
+    def _analyze_image(
+        self,
+        img_bgr: np.ndarray,
+        event: str,
+        profile: str,
+        source_gender: Optional[str] = None,
+    ) -> List:
+        """`_run_analyzer` for an uploaded image, through the face cache if any."""
+        if self._face_cache is None:
+            return self._run_analyzer(img_bgr, event, profile, source_gender)
+        det_size = self._settings.detection_size_for_image(
+            width=img_bgr.shape[1], height=img_bgr.shape[0]
+        )
+        # Only the swap profile's output depends on the gender filter.
+        variant = profile
+        if profile == ANALYSIS_PROFILE_SWAP and source_gender is not None:
+            variant = f"{profile}:{source_gender}"
+        key = image_key(img_bgr, det_size, variant)
+        faces = self._face_cache.get(key)
+        if faces is not None:
+            logger.info(
+                "face_cache_hit",
+                extra={"event": "face_cache_hit", "face_count": len(faces)},
+            )
+            return faces
+        faces = self._run_analyzer(img_bgr, event, profile, source_gender)
+        self._face_cache.put(key, faces)
+        return faces
 
     def extract_embedding(self, pil_img: Image.Image):
         embedding, _ = self.extract_face_features(pil_img)
@@ -348,6 +616,9 @@ class FaceSwapService:
             enable_restore=enable_restore,
             source_gender=source_gender,
             swap_model=swap_model,
+            faces=self._analyze_image(
+                img_bgr, "face_detection_for_swap", ANALYSIS_PROFILE_SWAP, source_gender
+            ),
         )
 
         return Image.fromarray(cv2.cvtColor(swapped_bgr, cv2.COLOR_BGR2RGB))
@@ -359,66 +630,155 @@ class FaceSwapService:
         enable_restore: bool = False,
         source_gender: Optional[str] = None,
         swap_model: str = SWAP_MODEL_INSWAPPER,
+        faces: Optional[List] = None,
     ) -> np.ndarray:
+        """Swap every selected face in one BGR frame.
+
+        `faces` skips detection when the caller already has them - a video
+        job's face tracker, for instance. They must describe this frame.
+        """
         img_bgr = np.ascontiguousarray(img_bgr)
         use_hyperswap = swap_model == SWAP_MODEL_HYPERSWAP
 
-        self._registry.prepare_face_analyzer_for_image(img_bgr.shape)
-        face_analyzer = self._registry.get_face_analyzer()
         swapper = None if use_hyperswap else self._registry.get_swapper()
-        hyperswap_session = self._registry.get_hyperswap_session() if use_hyperswap else None
-        gpen_session = self._registry.get_gpen_session() if enable_restore else None
-
-        with timed_log(
-            logger,
-            "face_detection_for_swap",
-            image_width=img_bgr.shape[1],
-            image_height=img_bgr.shape[0],
+        with self._swap_sessions(use_hyperswap, enable_restore) as (
+            hyperswap_session,
+            gpen_session,
         ):
-            faces = face_analyzer.get(img_bgr)
-
-        norm = np.linalg.norm(source_embedding)
-        embedding = source_embedding / norm if norm > 0 else source_embedding
-        source_face = DummyFace(embedding)
+            if faces is None:
+                faces = self.detect_faces(img_bgr, source_gender)
+
+            norm = np.linalg.norm(source_embedding)
+            embedding = source_embedding / norm if norm > 0 else source_embedding
+            source_face = DummyFace(embedding)
+
+            selected_faces, gender_skipped = self._select_faces(faces, source_gender)
+
+            swapped_count = 0
+
+            with timed_log(
+                logger,
+                "swap_faces",
+                face_count=len(selected_faces),
+                restore_enabled=enable_restore,
+            ):
+                for face in selected_faces:
+                    if use_hyperswap:
+                        img_bgr = self._run_hyperswap(
+                            img_bgr, face, source_embedding, hyperswap_session, gpen_session
+                        )
+                    else:
+                        img_bgr = self._run_inswapper(
+                            img_bgr, face, source_face, swapper, gpen_session
+                        )
+                    swapped_count += 1
 
-        selected_faces, gender_skipped = self._select_faces(faces, source_gender)
+            logger.info(
+                "swap_complete",
+                extra={
+                    "event": "swap_complete",
+                    "face_count": len(faces),
+                    "swapped_count": swapped_count,
+                    "gender_skipped": gender_skipped,
+                },
+            )
+            return img_bgr
 
-        skipped_faces = 0
-        swapped_count = 0
+    def swap_frames_with_embedding(
+        self,
+        frames_bgr: List[np.ndarray],
+        source_embedding: np.ndarray,
+        enable_restore: bool = False,
+        source_gender: Optional[str] = None,
+        swap_model: str = SWAP_MODEL_INSWAPPER,
+        faces_per_frame: Optional[List[Optional[List]]] = None,
+    ) -> List[np.ndarray]:
+        """Swap several frames at once, one model call per stage.
+
+        The aligned crops of every selected face across all of `frames_bgr` go
+        through the swap model together, and through GPEN together when
+        restoring; the per-face masking, colour matching and paste-back then
+        run as usual and results come back in input order.
+
+        Unlike `swap_frame_with_embedding`, every face's crop is taken from the
+        frame before any face in it was pasted back, so two overlapping faces
+        in one frame can come out marginally different.
+        """
+        frames = [np.ascontiguousarray(frame) for frame in frames_bgr]
+        if faces_per_frame is None:
+            faces_per_frame = [None] * len(frames)
+        use_hyperswap = swap_model == SWAP_MODEL_HYPERSWAP
 
-        with timed_log(
-            logger,
-            "swap_faces",
-            face_count=len(selected_faces),
-            restore_enabled=enable_restore,
+        swapper = None if use_hyperswap else self._registry.get_swapper()
+        with self._swap_sessions(use_hyperswap, enable_restore) as (
+            hyperswap_session,
+            gpen_session,
         ):
-            for face in selected_faces:
-                if face.normed_embedding is None:
-                    skipped_faces += 1
-                    logger.warning(
-                        "missing_face_embedding",
-                        extra={"event": "missing_face_embedding"},
-                    )
-                    continue
+            # (frame index, face, model input, frame -> crop matrix)
+            jobs = []
+            face_count = gender_skipped = 0
+            for index, (frame, faces) in enumerate(zip(frames, faces_per_frame)):
+                if faces is None:
+                    faces = self.detect_faces(frame, source_gender)
+                face_count += len(faces)
+                selected_faces, skipped = self._select_faces(faces, source_gender)
+                gender_skipped += skipped
+                for face in selected_faces:
+                    if use_hyperswap:
+                        prepared = self._hyperswap_input(frame, face)
+                        if prepared is None:
+                            continue
+                    else:
+                        prepared = self._inswapper_input(frame, face, swapper)
+                    jobs.append((index, face, prepared[0], prepared[1]))
+
+            if jobs:
+                with timed_log(
+                    logger,
+                    "swap_faces_batch",
+                    frame_count=len(frames),
+                    face_count=len(jobs),
+                    restore_enabled=enable_restore,
+                ):
+                    model_inputs = [job[2] for job in jobs]
+                    if use_hyperswap:
+                        emb_batch = self._hyperswap_embedding(source_embedding)
+                        outputs = self._hyperswap_outputs(
+                            hyperswap_session, model_inputs, emb_batch
+                        )
+                    else:
+                        norm = np.linalg.norm(source_embedding)
+                        embedding = source_embedding / norm if norm > 0 else source_embedding
+                        latent = self._inswapper_latent(embedding, swapper)
+                        outputs = self._inswapper_outputs(swapper, model_inputs, latent)
+
+                    lifted = []
+                    for (index, face, _, M), output in zip(jobs, outputs):
+                        crop, aligned_target, matrix_hi = self._upscale_to_crop_space(
+                            frames[index], output, M
+                        )
+                        mask = self._build_swap_mask(aligned_target, face, matrix_hi)
+                        lifted.append((crop, aligned_target, mask, matrix_hi))
+
+                    crops = [item[0] for item in lifted]
+                    if gpen_session is not None:
+                        crops = self._restore_crops(crops, gpen_session)
+
+                    for (index, _, _, _), crop, (_, aligned_target, mask, matrix_hi) in zip(
+                        jobs, crops, lifted
+                    ):
+                        frames[index] = self._match_and_paste(
+                            frames[index], crop, aligned_target, mask, matrix_hi
+                        )
 
-                if use_hyperswap:
-                    img_bgr = self._run_hyperswap(
-                        img_bgr, face, source_embedding, hyperswap_session, gpen_session
-                    )
-                else:
-                    img_bgr = self._run_inswapper(
-                        img_bgr, face, source_face, swapper, gpen_session
-                    )
-                swapped_count += 1
-
-        logger.info(
-            "swap_complete",
-            extra={
-                "event": "swap_complete",
-                "face_count": len(faces),
-                "swapped_count": swapped_count,
-                "skipped_faces": skipped_faces,
-                "gender_skipped": gender_skipped,
-            },
-        )
-        return img_bgr
+            logger.info(
+                "swap_complete",
+                extra={
+                    "event": "swap_complete",
+                    "frame_count": len(frames),
+                    "face_count": face_count,
+                    "swapped_count": len(jobs),
+                    "gender_skipped": gender_skipped,
+                },
+            )
+            return frames
@@ -0,0 +1,164 @@
+"""Keyframe detection with optical-flow face tracking in between.
+
+Face analysis (detection, then genderage and 106-point landmarks as needed)
+is the largest per-frame cost of a video swap on CPU. On footage where faces
+move smoothly from one frame to the next - talking heads, interviews - most of
+that work re-discovers what the previous frame already knew.
+
+`FaceTracker` runs the analyzer only on keyframes: the first frame, every
+`keyframe_interval` frames after that, on a scene cut, and whenever tracking
+loses a face. In between, each face's 5-point keypoints and dense landmarks are
+carried forward with pyramidal Lucas-Kanade flow, which is a few milliseconds
+per frame even at 1080p. Everything else about the face - embedding, sex, det
+score - is copied from the keyframe.
+
+Faces that enter the shot between keyframes are picked up at the next one.
+"""
+
+from typing import Callable, List, Optional
+
+import cv2
+import numpy as np
+
+from .observability import get_logger
+
+logger = get_logger("inference.face_tracking")
+
+# Scene-cut detection compares consecutive frames at this size. Small enough to
+# be free, large enough that a cut to a similar-looking shot still registers.
+_THUMB_SIZE = (64, 36)
+
+_LK_PARAMS = dict(
+    winSize=(21, 21),
+    maxLevel=3,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01),
+)
+
+# Forward-backward error, in pixels, above which a tracked point is distrusted.
+_MAX_FB_ERROR = 2.0
+
+
+class FaceTracker:
+    """Stateful, single-threaded: call `track` on frames in decode order."""
+
+    def __init__(
+        self,
+        detect: Callable[[np.ndarray], List],
+        keyframe_interval: int,
+        scene_cut_threshold: float,
+        min_tracked_ratio: float = 0.6,
+    ):
+        self._detect = detect
+        self._keyframe_interval = max(1, keyframe_interval)
+        self._scene_cut_threshold = scene_cut_threshold
+        self._min_tracked_ratio = min_tracked_ratio
+        self._faces: List = []
+        self._prev_gray: Optional[np.ndarray] = None
+        self._prev_thumb: Optional[np.ndarray] = None
+        self._since_keyframe = 0
+        self.stats = {
+            "keyframes": 0,
+            "tracked_frames": 0,
+            "scene_cuts": 0,
+            "tracking_lost": 0,
+        }
+
+    def track(self, frame_bgr: np.ndarray) -> List:
+        """Faces for `frame_bgr`, either detected or carried from the last frame."""
+        gray = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
+        thumb = cv2.resize(gray, _THUMB_SIZE, interpolation=cv2.INTER_AREA)
+
+        faces = None
+        if not self._is_keyframe(thumb):
+            faces = self._propagate(gray)
+            if faces is None:
+                self.stats["tracking_lost"] += 1
+
+        if faces is None:
+            faces = self._detect(frame_bgr)
+            self._since_keyframe = 0
+            self.stats["keyframes"] += 1
+        else:
+            self._since_keyframe += 1
+            self.stats["tracked_frames"] += 1
+
+        self._faces = faces
+        self._prev_gray = gray
+        self._prev_thumb = thumb
+        return faces
+
+    def _is_keyframe(self, thumb: np.ndarray) -> bool:
+        if self._prev_gray is None:
+            return True
+        if self._since_keyframe + 1 >= self._keyframe_interval:
+            return True
+        if self._scene_cut_threshold > 0:
+            diff = cv2.absdiff(thumb, self._prev_thumb)
+            if float(diff.mean()) / 255.0 > self._scene_cut_threshold:
+                self.stats["scene_cuts"] += 1
+                return True
+        return False
+
+    def _propagate(self, gray: np.ndarray) -> Optional[List]:
+        """Move every face into `gray`, or None if any face was lost."""
+        tracked = []
+        for face in self._faces:
+            moved = self._propagate_face(face, gray)
+            if moved is None:
+                return None
+            tracked.append(moved)
+        return tracked
+
+    def _propagate_face(self, face, gray: np.ndarray):
+        kps = getattr(face, "kps", None)
+        if kps is None:
+            return None
+        landmarks = getattr(face, "landmark_2d_106", None)
+        parts = [np.asarray(kps, dtype=np.float32).reshape(-1, 2)]
+        if landmarks is not None:
+            parts.append(np.asarray(landmarks, dtype=np.float32).reshape(-1, 2))
+        points = np.vstack(parts)
+
+        prev_pts = points.reshape(-1, 1, 2)
+        next_pts, status, _ = cv2.calcOpticalFlowPyrLK(
+            self._prev_gray, gray, prev_pts, None, **_LK_PARAMS
+        )
+        if next_pts is None:
+            return None
+        back_pts, back_status, _ = cv2.calcOpticalFlowPyrLK(
+            gray, self._prev_gray, next_pts, None, **_LK_PARAMS
+        )
+        fb_error = np.linalg.norm((back_pts - prev_pts).reshape(-1, 2), axis=1)
+        good = (
+            (status.ravel() == 1)
+            & (back_status.ravel() == 1)
+            & (fb_error < _MAX_FB_ERROR)
+        )
+        if good.sum() < max(3, int(len(points) * self._min_tracked_ratio)):
+            return None
+
+        # A similarity fitted to the reliable points moves the rest and the
+        # bbox; reliable points keep their own flow so expression changes
+        # still reach the mask.
+        next_pts = next_pts.reshape(-1, 2)
+        matrix, _ = cv2.estimateAffinePartial2D(
+            points[good], next_pts[good], method=cv2.LMEDS
+        )
+        if matrix is None:
+            return None
+        moved = cv2.transform(points.reshape(-1, 1, 2), matrix).reshape(-1, 2)
+        moved[good] = next_pts[good]
+
+        bbox = np.asarray(face.bbox, dtype=np.float32)
+        corners = np.array(
+            [[bbox[0], bbox[1]], [bbox[2], bbox[1]], [bbox[2], bbox[3]], [bbox[0], bbox[3]]],
+            dtype=np.float32,
+        )
+        corners = cv2.transform(corners.reshape(-1, 1, 2), matrix).reshape(-1, 2)
+
+        result = type(face)(face)
+        result.kps = moved[: len(parts[0])]
+        if landmarks is not None:
+            result.landmark_2d_106 = moved[len(parts[0]):]
+        result.bbox = np.concatenate([corners.min(axis=0), corners.max(axis=0)])
+        return result
@@ -0,0 +1,131 @@
+"""Admission control for blocking inference called from async routes.
+
+The routes are `async def`, but face analysis, swapping and the video frame
+loop are synchronous and CPU-bound. Run inline, they block the event loop, so
+`/health` and every other request stall behind a single swap.
+
+An `InferenceGate` runs that work on its own bounded thread pool instead. At
+most `max_concurrency` calls run at once and at most `max_queued` more wait
+for a slot; a call beyond that is refused straight away with `GateFull`,
+which the routes turn into `503` + `Retry-After`. Refusing early keeps a
+busy node's latency bounded and tells upstream retries when to come back
+instead of letting them pile up.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+from .observability import get_logger
+
+logger = get_logger("inference.gate")
+
+T = TypeVar("T")
+
+# Weight of the newest sample in the moving averages.
+EWMA_ALPHA = 0.2
+
+
+class GateFull(Exception):
+    """Raised by `InferenceGate.run` when every slot and queue place is taken."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"{name} inference is at capacity")
+        self.retry_after = retry_after
+
+
+class InferenceGate:
+    """Bounded executor plus wait queue for one class of inference work."""
+
+    def __init__(self, name: str, max_concurrency: int, max_queued: int):
+        self.name = name
+        self._max_concurrency = max(1, max_concurrency)
+        self._max_queued = max(0, max_queued)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._max_concurrency, thread_name_prefix=f"{name}-inference"
+        )
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queued = 0
+        self._started = 0
+        self._completed = 0
+        self._rejected = 0
+        self._avg_wait = 0.0
+        self._max_wait = 0.0
+        self._avg_run = 0.0
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run `fn(*args, **kwargs)` on the gate's pool, or raise GateFull."""
+        with self._lock:
+            if self._running + self._queued >= self._max_concurrency + self._max_queued:
+                self._rejected += 1
+                retry_after = self._retry_after()
+                logger.warning(
+                    "inference_rejected",
+                    extra={
+                        "event": "inference_rejected",
+                        "gate": self.name,
+                        "running": self._running,
+                        "queued": self._queued,
+                        "retry_after": retry_after,
+                    },
+                )
+                raise GateFull(self.name, retry_after)
+            self._queued += 1
+        enqueued_at = time.perf_counter()
+
+        def call() -> T:
+            started_at = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                wait = started_at - enqueued_at
+                # The first sample seeds each average rather than being
+                # pulled toward zero.
+                alpha = EWMA_ALPHA if self._started else 1.0
+                self._started += 1
+                self._avg_wait += alpha * (wait - self._avg_wait)
+                self._max_wait = max(self._max_wait, wait)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started_at
+                with self._lock:
+                    self._running -= 1
+                    alpha = EWMA_ALPHA if self._completed else 1.0
+                    self._completed += 1
+                    self._avg_run += alpha * (elapsed - self._avg_run)
+
+        def release_if_cancelled(done) -> None:
+            if done.cancelled():
+                with self._lock:
+                    self._queued -= 1
+
+        # If the client goes away, a call still queued is dropped; one that
+        # has started keeps its slot until it finishes.
+        future = self._executor.submit(call)
+        future.add_done_callback(release_if_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "running": self._running,
+                "queued": self._queued,
+                "max_concurrency": self._max_concurrency,
+                "max_queued": self._max_queued,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._avg_wait * 1000, 1),
+                "max_wait_ms": round(self._max_wait * 1000, 1),
+                "avg_run_ms": round(self._avg_run * 1000, 1),
+            }
+
+    def _retry_after(self) -> int:
+        # Roughly how long the work already admitted takes to drain.
+        # Called with the lock held.
+        waves = (self._running + self._queued) / self._max_concurrency
+        return max(1, math.ceil(self._avg_run * waves))
@@ -0,0 +1,171 @@
+"""Cross-request micro-batching of ONNX Runtime calls.
+
+An image swap makes one batch-of-one call per model (inswapper or
+hyperswap, then GPEN when restoring) for each face. When several
+`/swap-remote` requests run at once, those calls reach the same shared
+sessions at nearly the same moment. `ModelBatcher` holds each call for at
+most `max_wait_ms` so that calls from other requests can join it, runs the
+lot as one batched session call through `run_batched`, and hands each
+caller back its own slice of the output.
+
+Calls are grouped per session, output and input shape, so only calls that
+can be concatenated share a batch. Models exported with a fixed batch of one
+gain nothing from waiting and bypass the batcher.
+
+The face detector is not batched: its input size follows the image, so
+concurrent requests rarely share a shape.
+
+Each queue holds on to its session, so the registry tells the batcher when
+it evicts one (`forget_session`) and the session's queues are closed.
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from .face_swap import _batchable, run_batched
+from .observability import get_logger
+
+logger = get_logger("inference.micro_batcher")
+
+
+class _BatchQueue:
+    """Pending calls for one (session, output, input shape) and their dispatcher."""
+
+    def __init__(self, session, output_name: str, max_batch_size: int, max_wait: float, stats):
+        self._session = session
+        self._output_name = output_name
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._stats = stats
+        self._cond = threading.Condition()
+        self._closed = False
+        # (feed, future, enqueued_at)
+        self._pending: List[Tuple[dict, Future, float]] = []
+        threading.Thread(target=self._run, name="micro-batcher", daemon=True).start()
+
+    def submit(self, feed: dict) -> Future:
+        future: Future = Future()
+        with self._cond:
+            self._pending.append((feed, future, time.perf_counter()))
+            self._cond.notify()
+        return future
+
+    def close(self) -> None:
+        """Stop the dispatcher once the calls already queued have run."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                # The window opens with the oldest call, so none waits longer
+                # than max_wait for company.
+                deadline = self._pending[0][2] + self._max_wait
+                while len(self._pending) < self._max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[: self._max_batch_size]
+                del self._pending[: self._max_batch_size]
+
+            try:
+                outputs = run_batched(
+                    self._session, [feed for feed, _, _ in batch], self._output_name
+                )
+            except Exception as exc:
+                for _, future, _ in batch:
+                    future.set_exception(exc)
+                continue
+            for (_, future, _), output in zip(batch, outputs):
+                future.set_result(output)
+            self._stats.record(len(batch))
+
+
+class _BatchStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.max_batch = 0
+
+    def record(self, size: int) -> None:
+        with self._lock:
+            self.batches += 1
+            self.items += size
+            self.max_batch = max(self.max_batch, size)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "max_batch_size_seen": self.max_batch,
+            }
+
+
+class ModelBatcher:
+    """Coalesces concurrent single-item session calls into batched ones."""
+
+    def __init__(self, max_batch_size: int, max_wait_ms: float):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self._lock = threading.Lock()
+        self._queues: Dict[tuple, _BatchQueue] = {}
+        self._stats = _BatchStats()
+
+    def run(self, session, feeds: List[dict], output_name: str) -> List[np.ndarray]:
+        """Same contract as `run_batched`; blocks until every feed is done."""
+        if self.max_batch_size <= 1 or not _batchable(session):
+            return run_batched(session, feeds, output_name)
+        futures = [self._queue(session, output_name, feed).submit(feed) for feed in feeds]
+        return [future.result() for future in futures]
+
+    def forget_session(self, session) -> None:
+        """Close the queues of `session`, which the registry has evicted."""
+        with self._lock:
+            keys = [key for key in self._queues if key[0] == id(session)]
+            queues = [self._queues.pop(key) for key in keys]
+        for queue in queues:
+            queue.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            **self._stats.snapshot(),
+        }
+
+    def _queue(self, session, output_name: str, feed: dict) -> _BatchQueue:
+        shapes = tuple(sorted((name, value.shape, value.dtype.str) for name, value in feed.items()))
+        key = (id(session), output_name, shapes)
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is None:
+                queue = _BatchQueue(
+                    session,
+                    output_name,
+                    self.max_batch_size,
+                    self.max_wait_ms / 1000.0,
+                    self._stats,
+                )
+                self._queues[key] = queue
+                logger.info(
+                    "micro_batch_queue_created",
+                    extra={
+                        "event": "micro_batch_queue_created",
+                        "output_name": output_name,
+                        "queue_count": len(self._queues),
+                    },
+                )
+            return queue
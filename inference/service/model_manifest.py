@@ -0,0 +1,168 @@
+"""Local manifest of model files, so a start with models on disk needs no network.
+
+Every model used to be resolved through `try_to_load_from_cache`, and a file
+the hub cache had marked as missing (the optional occluder, typically) cost a
+Hub round trip on every start. The manifest records each file once it has been
+resolved: its path, size and sha256, or that the repo does not have it. Later
+starts open listed files straight from disk after checking them against the
+manifest - by size, or by sha256 with `MODEL_MANIFEST_VERIFY=sha256` - and
+only go back to the Hub for a file that is unlisted or fails the check.
+`preload_models.py` writes the manifest at image build time.
+
+Files listed as absent are not looked up again; delete the manifest to make
+the service re-check the repo.
+
+`file_lock` serialises work on one model file across processes, so replicas
+starting together on one host download it once: the first takes the lock and
+downloads, the rest wait and then find it in the cache.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from .observability import get_logger, timed_log
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl; the lock is a no-op there.
+    fcntl = None
+
+logger = get_logger("inference.model_manifest")
+
+MANIFEST_VERIFY_SIZE = "size"
+MANIFEST_VERIFY_SHA256 = "sha256"
+VALID_MANIFEST_VERIFY = {MANIFEST_VERIFY_SIZE, MANIFEST_VERIFY_SHA256}
+
+_HASH_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as model_file:
+        for chunk in iter(lambda: model_file.read(_HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def file_lock(lock_path: str, blocking: bool = True):
+    """Exclusive lock on `lock_path`, held across processes on this host.
+
+    With `blocking=False`, raises BlockingIOError instead of waiting when
+    another holder has it.
+    """
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    with open(lock_path, "a") as lock_file:
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class ModelAbsent(FileNotFoundError):
+    """The manifest records that the model repo does not have this file."""
+
+
+class ModelManifest:
+    def __init__(self, path: str, verify: str = MANIFEST_VERIFY_SIZE):
+        if verify not in VALID_MANIFEST_VERIFY:
+            raise ValueError(
+                f"MODEL_MANIFEST_VERIFY must be one of {sorted(VALID_MANIFEST_VERIFY)}, "
+                f"got {verify!r}"
+            )
+        self._path = path
+        self._verify = verify
+        self._lock = threading.Lock()
+        self._entries = self._read()
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self._path, "r", encoding="utf-8") as manifest_file:
+                return dict(json.load(manifest_file).get("files", {}))
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, AttributeError) as exc:
+            logger.warning(
+                "model_manifest_unreadable",
+                extra={"event": "model_manifest_unreadable", "path": self._path, "error": str(exc)},
+            )
+            return {}
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self._entries
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Path of `name` if the manifest lists it and the file checks out.
+
+        Raises ModelAbsent for a file the repo is recorded not to have.
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None:
+            return None
+        if entry.get("absent"):
+            raise ModelAbsent(f"{name} is recorded as absent in {self._path}")
+        path = entry["path"]
+        problem = None
+        if not os.path.isfile(path):
+            problem = "missing"
+        elif os.path.getsize(path) != entry["size"]:
+            problem = "size"
+        elif self._verify == MANIFEST_VERIFY_SHA256:
+            with timed_log(logger, "model_manifest_hash", model_filename=name):
+                if sha256_file(path) != entry["sha256"]:
+                    problem = "sha256"
+        if problem is not None:
+            logger.warning(
+                "model_manifest_mismatch",
+                extra={
+                    "event": "model_manifest_mismatch",
+                    "model_filename": name,
+                    "path": path,
+                    "problem": problem,
+                },
+            )
+            return None
+        return path
+
+    def record(self, name: str, path: str) -> None:
+        with timed_log(logger, "model_manifest_hash", model_filename=name):
+            entry = {
+                "path": os.path.abspath(path),
+                "size": os.path.getsize(path),
+                "sha256": sha256_file(path),
+            }
+        self._write(name, entry)
+
+    def record_absent(self, name: str) -> None:
+        self._write(name, {"absent": True})
+
+    def _write(self, name: str, entry: Dict[str, Any]) -> None:
+        try:
+            with self._lock, file_lock(f"{self._path}.lock"):
+                # Re-read under the lock so replicas recording different
+                # files at once keep each other's entries.
+                entries = self._read()
+                entries[name] = entry
+                os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+                tmp_path = f"{self._path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as manifest_file:
+                    json.dump({"files": entries}, manifest_file, indent=2, sort_keys=True)
+                os.replace(tmp_path, self._path)
+                self._entries = entries
+        except OSError as exc:
+            # A read-only model directory still serves; it just keeps
+            # checking the cache on each start.
+            logger.warning(
+                "model_manifest_write_failed",
+                extra={"event": "model_manifest_write_failed", "path": self._path, "error": str(exc)},
+            )
@@ -0,0 +1,96 @@
+"""INT8 variants of the swap, restoration and occlusion models.
+
+`MODEL_PRECISION=int8` makes `ModelRegistry` load a dynamically quantized
+copy of inswapper, hyperswap, GPEN and the occluder in place of the FP32
+original: weights are stored as 8-bit integers and activations are quantized
+per call, which cuts model memory to about a quarter and speeds up the large
+convolutions on CPU. The buffalo_l analysis models always stay FP32 - they
+are small, and detection and landmark errors move every later stage.
+
+The copies are produced ahead of time from the cached originals by
+`quantize_models.py` and written to `QUANTIZED_MODEL_DIR`. A model without a
+copy is loaded in FP32, with a warning. Quantization changes the output, so
+compare modes with `eval/run_eval.py --precisions fp32,int8` before switching.
+
+Weights are quantized as unsigned 8-bit: ONNX Runtime's CPU `ConvInteger`
+kernel only accepts uint8 weights, and these models are mostly convolutions.
+"""
+
+import os
+from typing import Dict
+
+from .observability import get_logger, timed_log
+from .settings import Settings
+
+logger = get_logger("inference.model_precision")
+
+PRECISION_FP32 = "fp32"
+PRECISION_INT8 = "int8"
+VALID_MODEL_PRECISIONS = {PRECISION_FP32, PRECISION_INT8}
+
+
+def quantizable_models(settings: Settings) -> Dict[str, str]:
+    """Model name -> file in `MODEL_REPO` for every model with an INT8 variant."""
+    return {
+        "inswapper": "inswapper_128.onnx",
+        "hyperswap": "Hyperswap_1b_256.onnx",
+        "gpen": "GPEN-BFR-512.onnx",
+        "occluder": settings.occluder_model_file,
+    }
+
+
+def quantized_model_path(settings: Settings, filename: str) -> str:
+    stem, _ = os.path.splitext(os.path.basename(filename))
+    return os.path.join(settings.quantized_model_dir, f"{stem}.int8.onnx")
+
+
+def resolve_model_path(settings: Settings, model_name: str, original_path: str) -> str:
+    """The file to load for `model_name` at the configured precision."""
+    if settings.model_precision not in VALID_MODEL_PRECISIONS:
+        raise ValueError(
+            f"MODEL_PRECISION must be one of {sorted(VALID_MODEL_PRECISIONS)}, "
+            f"got {settings.model_precision!r}"
+        )
+    if settings.model_precision != PRECISION_INT8:
+        return original_path
+    filename = quantizable_models(settings).get(model_name)
+    if filename is None:
+        return original_path
+    path = quantized_model_path(settings, filename)
+    if not os.path.exists(path):
+        logger.warning(
+            "quantized_model_missing",
+            extra={
+                "event": "quantized_model_missing",
+                "model_name": model_name,
+                "path": path,
+            },
+        )
+        return original_path
+    return path
+
+
+def quantize_model(source_path: str, output_path: str) -> None:
+    # Imported here: the quantization tooling pulls in more of onnx than the
+    # service needs at runtime.
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp.onnx"
+    try:
+        with timed_log(logger, "quantize_model", model_path=source_path):
+            quantize_dynamic(source_path, tmp_path, weight_type=QuantType.QUInt8)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    logger.info(
+        "quantized_model_written",
+        extra={
+            "event": "quantized_model_written",
+            "path": output_path,
+            "source_bytes": os.path.getsize(source_path),
+            "quantized_bytes": os.path.getsize(output_path),
+        },
+    )
+
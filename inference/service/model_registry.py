@@ -1,32 +1,161 @@
+import copy
 import os
-from threading import Lock
-from typing import Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Lock, Thread
+from time import monotonic, perf_counter, sleep
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+import numpy as np
 import onnxruntime as ort
-from huggingface_hub import _CACHED_NO_EXIST, hf_hub_download, try_to_load_from_cache
-from insightface import model_zoo
-from insightface.app import FaceAnalysis
 
-from .observability import get_logger, timed_log
+from .model_manifest import ModelManifest, file_lock
+from .model_precision import (
+    quantizable_models,
+    quantize_model,
+    quantized_model_path,
+    resolve_model_path,
+)
+from .observability import get_logger, process_uptime_ms, timed_log
+from .ort_sessions import DEFAULT_SAMPLE_SIZE, create_session, sample_feed
 from .settings import Settings, get_settings
 
 
-ModelTuple = Tuple[FaceAnalysis, object]
 logger = get_logger("inference.model_registry")
 
+# The buffalo_l modules the service uses: module -> (file, insightface
+# model_zoo class). The pack's 3D landmark model is never read, so it is not
+# loaded. Classes are named rather than imported: importing insightface takes
+# longer than the rest of startup, so it waits until models load.
+BUFFALO_L_MODULES = {
+    "detection": ("det_10g.onnx", "RetinaFace"),
+    "recognition": ("w600k_r50.onnx", "ArcFaceONNX"),
+    "genderage": ("genderage.onnx", "Attribute"),
+    "landmark_2d_106": ("2d106det.onnx", "Landmark"),
+}
+
+# Models the registry loads, each behind its own lock so that a request waits
+# only on the model it needs. "core" is buffalo_l plus inswapper.
+MODEL_CORE = "core"
+MODEL_OCCLUDER = "occluder"
+MODEL_GPEN = "gpen"
+MODEL_HYPERSWAP = "hyperswap"
+# Every swap uses these, so they are loaded first and gate readiness; GPEN and
+# hyperswap only serve requests that ask for them.
+READINESS_MODELS = (MODEL_CORE, MODEL_OCCLUDER)
+PRELOAD_ORDER = READINESS_MODELS + (MODEL_GPEN, MODEL_HYPERSWAP)
+# Single sessions that can be dropped while idle and loaded again on the next
+# request that leases them (MODEL_IDLE_TIMEOUT_S, MODEL_MEMORY_BUDGET_MB).
+# Every request goes through the core models, so they stay resident.
+EVICTABLE_MODELS = (MODEL_OCCLUDER, MODEL_GPEN, MODEL_HYPERSWAP)
+_SESSION_ATTRS = {
+    MODEL_OCCLUDER: "_occluder_session",
+    MODEL_GPEN: "_gpen_session",
+    MODEL_HYPERSWAP: "_hyperswap_session",
+}
+
+# Free input dims when priming, matching what the pipeline feeds each model:
+# GPEN runs at 512, hyperswap at 256, and the occluder defaults to 256.
+PRIME_SAMPLE_SIZES = {MODEL_OCCLUDER: 256, MODEL_GPEN: 512, MODEL_HYPERSWAP: 256}
+
+LOAD_PENDING = "pending"
+LOAD_LOADING = "loading"
+LOAD_READY = "ready"
+LOAD_FAILED = "failed"
+# The occluder is optional: missing from the model repo, or switched off.
+LOAD_UNAVAILABLE = "unavailable"
+# Dropped while idle; the next lease loads it again.
+LOAD_EVICTED = "evicted"
+LOAD_SETTLED = {LOAD_READY, LOAD_UNAVAILABLE, LOAD_EVICTED}
+
+_BYTES_PER_MB = 1024 * 1024
+
+
+class FaceAnalyzer:
+    """The buffalo_l modules, each on a session from `create_session`.
+
+    Stands in for insightface's `FaceAnalysis`, which builds its sessions with
+    default options; it exposes the same `models` and `det_model`.
+    """
+
+    def __init__(self, models: Dict[str, object]):
+        self.models = models
+        self.det_model = models["detection"]
+
+
+ModelTuple = Tuple[FaceAnalyzer, object]
+
 
 class ModelRegistry:
     def __init__(self, settings: Settings):
         self._settings = settings
-        self._lock = Lock()
+        self._manifest = ModelManifest(
+            settings.model_manifest_path, settings.model_manifest_verify
+        )
+        self._locks = {name: Lock() for name in PRELOAD_ORDER}
+        self._load_states: Dict[str, Dict[str, Any]] = {
+            name: {"state": LOAD_PENDING} for name in PRELOAD_ORDER
+        }
+        if not settings.occlusion_mask_enabled:
+            self._load_states[MODEL_OCCLUDER] = {"state": LOAD_UNAVAILABLE, "reason": "disabled"}
+        self._state_lock = Lock()
+        self._ready_ms: Optional[float] = None
+        # Readiness models the background preload has yet to load and prime.
+        self._preload_pending: set = set()
+        self._preload_thread: Optional[Thread] = None
         self._models: Optional[ModelTuple] = None
         self._gpen_session: Optional[ort.InferenceSession] = None
         self._hyperswap_session: Optional[ort.InferenceSession] = None
         self._occluder_session: Optional[ort.InferenceSession] = None
         self._occluder_unavailable = False
-        self._current_det_size: Optional[int] = None
+        # det_size -> detector prepared for it, least recently used first.
+        self._detectors: "OrderedDict[int, object]" = OrderedDict()
+        self._detector_lock = Lock()
+        # Leases and residency, for eviction. Taken after a model's load lock,
+        # never before it.
+        self._usage_lock = Lock()
+        self._in_use: Dict[str, int] = {name: 0 for name in PRELOAD_ORDER}
+        self._last_used: Dict[str, float] = {}
+        # Model name -> bytes of the model files its sessions were built from.
+        self._resident_bytes: Dict[str, int] = {}
+        self._evictions: Dict[str, int] = {name: 0 for name in EVICTABLE_MODELS}
+        self._pinned: set = set()
+        self._eviction_listeners: List[Callable[[Any], None]] = []
+        self._evictor_thread: Optional[Thread] = None
+
+    def _lock_path(self, name: str) -> str:
+        return os.path.join(self._settings.local_model_dir, ".locks", f"{name}.lock")
 
     def _download_model(self, filename: str) -> str:
+        """Local path of `filename` from `MODEL_REPO`, downloading it if needed.
+
+        Files the manifest lists are opened without touching the Hub (see
+        model_manifest.py).
+        """
+        from huggingface_hub.errors import EntryNotFoundError
+
+        path = self._manifest.resolve(filename)
+        if path is not None:
+            logger.info(
+                "model_manifest_hit",
+                extra={"event": "model_manifest_hit", "model_filename": filename, "path": path},
+            )
+            return path
+        # Replicas on one host take turns: whoever waited finds the file in
+        # the cache instead of downloading it again.
+        with file_lock(self._lock_path(filename)):
+            try:
+                path = self._fetch_model(filename)
+            except EntryNotFoundError:
+                self._manifest.record_absent(filename)
+                raise
+        self._manifest.record(filename, path)
+        return path
+
+    def _fetch_model(self, filename: str) -> str:
+        from huggingface_hub import _CACHED_NO_EXIST, hf_hub_download, try_to_load_from_cache
+
         cached_path = try_to_load_from_cache(
             repo_id=self._settings.model_repo,
             filename=filename,
@@ -63,71 +192,348 @@ class ModelRegistry:
                 cache_dir=self._settings.local_model_dir,
             )
 
+    def _buffalo_l_dir(self) -> str:
+        from insightface.utils import ensure_available
+
+        # insightface downloads and unzips the pack when its directory is
+        # missing, with no locking of its own.
+        with file_lock(self._lock_path("buffalo_l")):
+            model_dir = ensure_available("models", "buffalo_l")
+        for filename, _ in BUFFALO_L_MODULES.values():
+            name = f"buffalo_l/{filename}"
+            if name in self._manifest:
+                # A file failing its check is reported by `resolve`; the
+                # pack is not re-downloaded over it.
+                self._manifest.resolve(name)
+            else:
+                self._manifest.record(name, os.path.join(model_dir, filename))
+        return model_dir
+
+    def _load_analysis_module(self, model_dir: str, module: str):
+        from insightface import model_zoo
+
+        filename, class_name = BUFFALO_L_MODULES[module]
+        model_path = os.path.join(model_dir, filename)
+        # Detection has free input dims; benchmark it at the size it is
+        # first prepared with.
+        sample_size = (
+            self._settings.detection_size_min if module == "detection" else DEFAULT_SAMPLE_SIZE
+        )
+        return getattr(model_zoo, class_name)(
+            model_file=model_path,
+            session=create_session(model_path, module, self._settings, sample_size=sample_size),
+        )
+
+    def _load_swapper(self):
+        from insightface.model_zoo.inswapper import INSwapper
+
+        inswapper_path = self._download_model("inswapper_128.onnx")
+        # INSwapper reads its embedding map from `model_file`, which must
+        # stay the original even when the session runs a quantized copy.
+        return INSwapper(
+            model_file=inswapper_path,
+            session=create_session(
+                self._precision_path("inswapper", inswapper_path),
+                "inswapper",
+                self._settings,
+            ),
+        )
+
     def _initialize_models(self) -> ModelTuple:
         with timed_log(logger, "model_initialize"):
             # buffalo_l includes detection, recognition, genderage AND the
             # 106-point landmark module used to build the face mask.
-            face_analyzer = FaceAnalysis(
-                name="buffalo_l",
-                allowed_modules=[
-                    "detection",
-                    "recognition",
-                    "genderage",
-                    "landmark_2d_106",
-                ],
-                providers=["CPUExecutionProvider"],
-            )
+            # FaceAnalysis used to quieten ORT's own warnings; keep that.
+            ort.set_default_logger_severity(3)
+            # The sessions are independent and building one is mostly
+            # single-threaded graph work, so they are built side by side.
+            with ThreadPoolExecutor(
+                max_workers=max(1, self._settings.model_load_concurrency),
+                thread_name_prefix="model-load",
+            ) as pool:
+                swapper_future = pool.submit(self._load_swapper)
+                model_dir = self._buffalo_l_dir()
+                module_futures = {
+                    module: pool.submit(self._load_analysis_module, model_dir, module)
+                    for module in BUFFALO_L_MODULES
+                }
+                models = {module: future.result() for module, future in module_futures.items()}
+                swapper = swapper_future.result()
             initial_det_size = self._settings.detection_size_min
-            face_analyzer.prepare(
-                ctx_id=0,
-                det_size=(initial_det_size, initial_det_size),
-            )
-            self._current_det_size = initial_det_size
+            for module, model in models.items():
+                if module == "detection":
+                    model.prepare(
+                        0,
+                        input_size=(initial_det_size, initial_det_size),
+                        det_thresh=0.5,
+                    )
+                else:
+                    model.prepare(0)
 
-            inswapper_path = self._download_model("inswapper_128.onnx")
-            swapper = model_zoo.get_model(
-                inswapper_path,
-                providers=["CPUExecutionProvider"],
-            )
+            return FaceAnalyzer(models), swapper
+
+    def _precision_path(self, model_name: str, original_path: str) -> str:
+        return resolve_model_path(self._settings, model_name, original_path)
+
+    def quantize_models(self, names: Optional[List[str]] = None, force: bool = False) -> List[str]:
+        """Write INT8 copies of the quantizable models; returns the paths written."""
+        written = []
+        for model_name, filename in quantizable_models(self._settings).items():
+            if names and model_name not in names:
+                continue
+            output_path = quantized_model_path(self._settings, filename)
+            if os.path.exists(output_path) and not force:
+                continue
+            try:
+                source_path = self._download_model(filename)
+            except Exception as exc:
+                # The occluder is optional and may not be published.
+                logger.warning(
+                    "quantize_source_unavailable",
+                    extra={
+                        "event": "quantize_source_unavailable",
+                        "model_filename": filename,
+                        "error": str(exc),
+                    },
+                )
+                continue
+            quantize_model(source_path, output_path)
+            written.append(output_path)
+        return written
 
-            return face_analyzer, swapper
+    def _loaders(self):
+        return {
+            MODEL_CORE: self.get_models,
+            MODEL_OCCLUDER: self.get_occluder_session,
+            MODEL_GPEN: self.get_gpen_session,
+            MODEL_HYPERSWAP: self.get_hyperswap_session,
+        }
+
+    def _preload_pool(self) -> ThreadPoolExecutor:
+        # Models are submitted in PRELOAD_ORDER, so with fewer threads than
+        # models the ones every swap needs still start first.
+        return ThreadPoolExecutor(
+            max_workers=max(1, self._settings.model_load_concurrency),
+            thread_name_prefix="model-preload",
+        )
 
     def preload_assets(self) -> None:
-        self.get_models()
-        self.get_gpen_session()
-        self.get_hyperswap_session()
-        self.get_occluder_session()
+        loaders = self._loaders()
+        with self._preload_pool() as pool:
+            futures = [pool.submit(loaders[name]) for name in PRELOAD_ORDER]
+            for future in futures:
+                future.result()
         logger.info("preload_complete", extra={"event": "preload_complete"})
 
+    def start_background_preload(self) -> None:
+        """Load every model in the background, `MODEL_LOAD_CONCURRENCY` at a time.
+
+        Requests that arrive meanwhile block on the lock of the model they
+        need, so nothing is loaded twice. A model that fails here is retried
+        by the first request that needs it.
+        """
+        if self._preload_thread is not None:
+            return
+        with self._state_lock:
+            self._preload_pending = set(READINESS_MODELS)
+        self._preload_thread = Thread(
+            target=self._preload_in_background, name="model-preload", daemon=True
+        )
+        self._preload_thread.start()
+
+    def _preload_in_background(self) -> None:
+        with timed_log(logger, "background_preload"), self._preload_pool() as pool:
+            for name in PRELOAD_ORDER:
+                pool.submit(self._preload_model, name)
+
+    def _preload_model(self, name: str) -> None:
+        try:
+            self._loaders()[name]()
+            if self._settings.model_priming:
+                self.prime_model(name)
+        except Exception:
+            logger.exception(
+                "preload_failed",
+                extra={"event": "preload_failed", "model_name": name},
+            )
+        finally:
+            # Readiness waits for the preload to be done with this model,
+            # priming included, whether or not it succeeded.
+            with self._state_lock:
+                self._preload_pending.discard(name)
+            self._check_ready()
+
+    def prime_detection_sizes(self) -> List[int]:
+        if self._settings.prime_detection_sizes.strip():
+            return [
+                int(size)
+                for size in self._settings.prime_detection_sizes.split(",")
+                if size.strip()
+            ]
+        return self._settings.detection_size_buckets()
+
+    def prime_model(self, name: str) -> Optional[float]:
+        """Run a loaded model once on synthetic input of the shapes it serves.
+
+        The first run of a session grows its memory arena and picks kernels
+        for the input shape, which would otherwise land on a customer
+        request. The detector runs once per detection size in
+        `prime_detection_sizes()`, through throwaway copies so the detector
+        pool is left alone. Returns the time taken, or None if the model is
+        not loaded.
+        """
+        resident = self._resident(name)
+        if resident is None:
+            return None
+        started = perf_counter()
+        if name == MODEL_CORE:
+            analyzer, swapper = resident
+            for det_size in self.prime_detection_sizes():
+                detector = copy.copy(analyzer.det_model)
+                detector.input_size = (det_size, det_size)
+                detector.center_cache = {}
+                detector.detect(
+                    np.zeros((det_size, det_size, 3), dtype=np.uint8),
+                    max_num=0,
+                    metric="default",
+                )
+            for module, model in analyzer.models.items():
+                if module != "detection":
+                    model.session.run(None, sample_feed(model.session, DEFAULT_SAMPLE_SIZE))
+            swapper.session.run(None, sample_feed(swapper.session, DEFAULT_SAMPLE_SIZE))
+        else:
+            resident.run(None, sample_feed(resident, PRIME_SAMPLE_SIZES[name]))
+        prime_ms = round((perf_counter() - started) * 1000, 2)
+        with self._state_lock:
+            self._load_states[name]["prime_ms"] = prime_ms
+        logger.info(
+            "model_primed",
+            extra={"event": "model_primed", "model_name": name, "prime_ms": prime_ms},
+        )
+        return prime_ms
+
+    def prime_models(self) -> Dict[str, float]:
+        """Prime every loaded model; model name -> priming time in ms."""
+        timings = {}
+        for name in PRELOAD_ORDER:
+            prime_ms = self.prime_model(name)
+            if prime_ms is not None:
+                timings[name] = prime_ms
+        return timings
+
+    @contextmanager
+    def _loading(self, name: str):
+        with self._state_lock:
+            reloading = self._load_states[name]["state"] == LOAD_EVICTED
+        self._set_load_state(name, LOAD_LOADING)
+        started = perf_counter()
+        try:
+            yield
+        except Exception as exc:
+            self._set_load_state(name, LOAD_FAILED, error=str(exc))
+            raise
+        load_ms = round((perf_counter() - started) * 1000, 2)
+        with self._usage_lock:
+            self._last_used[name] = monotonic()
+            resident_mb = round(self._resident_bytes.get(name, 0) / _BYTES_PER_MB, 1)
+        self._set_load_state(name, LOAD_READY, load_ms=load_ms, resident_mb=resident_mb)
+        if reloading:
+            logger.info(
+                "model_reloaded",
+                extra={
+                    "event": "model_reloaded",
+                    "model_name": name,
+                    "load_ms": load_ms,
+                    "resident_model_mb": self.resident_memory()["resident_model_mb"],
+                },
+            )
+
+    def _set_load_state(self, name: str, state: str, **fields: Any) -> None:
+        with self._state_lock:
+            self._load_states[name] = {"state": state, **fields}
+        self._check_ready()
+
+    def _check_ready(self) -> None:
+        with self._state_lock:
+            if (
+                self._ready_ms is not None
+                or self._preload_pending
+                or not all(
+                    self._load_states[model]["state"] in LOAD_SETTLED
+                    for model in READINESS_MODELS
+                )
+            ):
+                return
+            self._ready_ms = process_uptime_ms()
+        logger.info(
+            "service_ready",
+            extra={"event": "service_ready", "startup_to_ready_ms": self._ready_ms},
+        )
+
+    def is_ready(self) -> bool:
+        """Whether every model a swap always uses has loaded (and been primed,
+        when the startup preload primes)."""
+        with self._state_lock:
+            return self._ready_ms is not None
+
+    def load_states(self) -> Dict[str, Any]:
+        """Per-model load state; never triggers a load."""
+        with self._state_lock:
+            return {
+                "ready": self._ready_ms is not None,
+                "startup_to_ready_ms": self._ready_ms,
+                "models": {name: dict(state) for name, state in self._load_states.items()},
+            }
+
     def get_models(self) -> ModelTuple:
         if self._models is None:
-            with self._lock:
+            with self._locks[MODEL_CORE]:
                 if self._models is None:
-                    self._models = self._initialize_models()
+                    with self._loading(MODEL_CORE):
+                        analyzer, swapper = self._initialize_models()
+                        self._record_resident(
+                            MODEL_CORE,
+                            *(model.model_file for model in analyzer.models.values()),
+                            self._precision_path("inswapper", swapper.model_file),
+                        )
+                        self._models = analyzer, swapper
         return self._models
 
-    def get_face_analyzer(self) -> FaceAnalysis:
+    def get_face_analyzer(self) -> FaceAnalyzer:
         return self.get_models()[0]
 
-    def prepare_face_analyzer_for_image(self, image_shape) -> None:
+    def get_detector_for_image(self, image_shape):
+        """Face detector prepared for this image's detection-size bucket.
+
+        Each bucket gets its own shallow copy of the analyzer's detector, with
+        its own input size and anchor cache, and every copy shares the one ORT
+        session. Concurrent requests of different sizes therefore neither wait
+        on each other nor run detection at each other's size. The pool keeps
+        the `DETECTOR_POOL_SIZE` most recently used buckets.
+        """
         height, width = image_shape[:2]
         det_size = self._settings.detection_size_for_image(width=width, height=height)
-        if det_size == self._current_det_size:
-            return
-
-        face_analyzer = self.get_face_analyzer()
-        with self._lock:
-            if det_size == self._current_det_size:
-                return
-            face_analyzer.prepare(
-                ctx_id=0,
-                det_size=(det_size, det_size),
-            )
-            self._current_det_size = det_size
+        base_detector = self.get_face_analyzer().det_model
+        with self._detector_lock:
+            detector = self._detectors.get(det_size)
+            if detector is not None:
+                self._detectors.move_to_end(det_size)
+                return detector
+            detector = copy.copy(base_detector)
+            detector.input_size = (det_size, det_size)
+            detector.center_cache = {}
+            self._detectors[det_size] = detector
+            while len(self._detectors) > max(1, self._settings.detector_pool_size):
+                self._detectors.popitem(last=False)
             logger.info(
                 "detector_prepared",
-                extra={"event": "detector_prepared", "detection_size": det_size},
+                extra={
+                    "event": "detector_prepared",
+                    "detection_size": det_size,
+                    "pool_sizes": list(self._detectors),
+                },
             )
+            return detector
 
     def warmup_for_frames(
         self,
@@ -137,14 +543,12 @@ class ModelRegistry:
     ) -> None:
         """Load and configure every model a swap will touch, up front.
 
-        Worth calling before handing frames to a worker pool.
-        `prepare_face_analyzer_for_image` mutates detector state, and doing it
-        here - while nothing else is running - means the workers only ever hit
-        its early-return path. Lazily loading a session from several threads at
-        once is safe but wasteful, so those are forced here too.
+        Worth calling before handing frames to a worker pool: lazily loading
+        a session from several threads at once is safe but wasteful, so every
+        session the job needs, and its detector, is created here.
         """
         self.get_models()
-        self.prepare_face_analyzer_for_image(image_shape)
+        self.get_detector_for_image(image_shape)
         if restore:
             self.get_gpen_session()
         if hyperswap:
@@ -164,26 +568,32 @@ class ModelRegistry:
 
     def get_gpen_session(self) -> Optional[ort.InferenceSession]:
         if self._gpen_session is None:
-            with self._lock:
+            with self._locks[MODEL_GPEN]:
                 if self._gpen_session is None:
-                    with timed_log(logger, "gpen_initialize"):
-                        gpen_path = self._download_model("GPEN-BFR-512.onnx")
-                        self._gpen_session = ort.InferenceSession(
-                            gpen_path,
-                            providers=["CPUExecutionProvider"],
+                    with self._loading(MODEL_GPEN), timed_log(logger, "gpen_initialize"):
+                        gpen_path = self._precision_path(
+                            "gpen", self._download_model("GPEN-BFR-512.onnx")
                         )
+                        self._make_room(MODEL_GPEN, gpen_path)
+                        self._gpen_session = create_session(gpen_path, "gpen", self._settings)
+                        self._record_resident(MODEL_GPEN, gpen_path)
         return self._gpen_session
 
     def get_hyperswap_session(self) -> Optional[ort.InferenceSession]:
         if self._hyperswap_session is None:
-            with self._lock:
+            with self._locks[MODEL_HYPERSWAP]:
                 if self._hyperswap_session is None:
-                    with timed_log(logger, "hyperswap_initialize"):
-                        hyperswap_path = self._download_model("Hyperswap_1b_256.onnx")
-                        self._hyperswap_session = ort.InferenceSession(
-                            hyperswap_path,
-                            providers=["CPUExecutionProvider"],
+                    with self._loading(MODEL_HYPERSWAP), timed_log(
+                        logger, "hyperswap_initialize"
+                    ):
+                        hyperswap_path = self._precision_path(
+                            "hyperswap", self._download_model("Hyperswap_1b_256.onnx")
+                        )
+                        self._make_room(MODEL_HYPERSWAP, hyperswap_path)
+                        self._hyperswap_session = create_session(
+                            hyperswap_path, "hyperswap", self._settings
                         )
+                        self._record_resident(MODEL_HYPERSWAP, hyperswap_path)
         return self._hyperswap_session
 
     def get_occluder_session(self) -> Optional[ort.InferenceSession]:
@@ -195,21 +605,26 @@ class ModelRegistry:
         if not self._settings.occlusion_mask_enabled or self._occluder_unavailable:
             return None
         if self._occluder_session is None:
-            with self._lock:
+            with self._locks[MODEL_OCCLUDER]:
                 if self._occluder_unavailable:
                     return None
                 if self._occluder_session is None:
                     try:
-                        with timed_log(logger, "occluder_initialize"):
-                            occluder_path = self._download_model(
-                                self._settings.occluder_model_file
+                        with self._loading(MODEL_OCCLUDER), timed_log(
+                            logger, "occluder_initialize"
+                        ):
+                            occluder_path = self._precision_path(
+                                "occluder",
+                                self._download_model(self._settings.occluder_model_file),
                             )
-                            self._occluder_session = ort.InferenceSession(
-                                occluder_path,
-                                providers=["CPUExecutionProvider"],
+                            self._make_room(MODEL_OCCLUDER, occluder_path)
+                            self._occluder_session = create_session(
+                                occluder_path, "occluder", self._settings
                             )
+                            self._record_resident(MODEL_OCCLUDER, occluder_path)
                     except Exception as exc:
                         self._occluder_unavailable = True
+                        self._set_load_state(MODEL_OCCLUDER, LOAD_UNAVAILABLE, error=str(exc))
                         logger.warning(
                             "occluder_unavailable",
                             extra={
@@ -221,6 +636,183 @@ class ModelRegistry:
                         return None
         return self._occluder_session
 
+    def _resident(self, name: str):
+        if name == MODEL_CORE:
+            return self._models
+        return getattr(self, _SESSION_ATTRS[name])
+
+    @contextmanager
+    def lease(self, name: str):
+        """The loaded model `name` (as its getter returns it), held resident
+        until the block exits.
+
+        Eviction skips a model while any lease on it is open, so a session is
+        never dropped mid-inference; the model's idle time starts when its
+        last lease closes. Yields None for an unavailable occluder.
+        """
+        loader = self._loaders()[name]
+        while True:
+            model = loader()
+            if model is None:
+                yield None
+                return
+            with self._usage_lock:
+                # Evicted between loading and leasing: load it again.
+                if model is self._resident(name):
+                    self._in_use[name] += 1
+                    break
+        try:
+            yield model
+        finally:
+            with self._usage_lock:
+                self._in_use[name] -= 1
+                self._last_used[name] = monotonic()
+
+    def _record_resident(self, name: str, *paths: str) -> None:
+        with self._usage_lock:
+            self._resident_bytes[name] = sum(os.path.getsize(path) for path in paths)
+
+    def resident_memory(self) -> Dict[str, Any]:
+        """Size of the loaded models, per model and in total, in MB.
+
+        Measured as the size of the model files the sessions were built
+        from: a lower bound of what they hold, which leaves out ONNX
+        Runtime's arenas and per-shape buffers.
+        """
+        with self._usage_lock:
+            models = {
+                name: round(size / _BYTES_PER_MB, 1) for name, size in self._resident_bytes.items()
+            }
+            total = sum(self._resident_bytes.values())
+            evictions = dict(self._evictions)
+        return {
+            "resident_model_mb": round(total / _BYTES_PER_MB, 1),
+            "memory_budget_mb": self._settings.model_memory_budget_mb or None,
+            "models": models,
+            "evictions": evictions,
+        }
+
+    def add_eviction_listener(self, listener: Callable[[Any], None]) -> None:
+        """Call `listener(session)` whenever a session is evicted, so that
+        anything holding on to it (a micro-batcher queue) lets it go."""
+        self._eviction_listeners.append(listener)
+
+    def pin_resident(self) -> None:
+        """Exempt every model loaded so far from eviction.
+
+        For the prefork master: a worker dropping a session it inherited
+        frees nothing, since the master still maps those pages, and loading
+        it again would give the worker a private copy.
+        """
+        with self._usage_lock:
+            self._pinned = {name for name in EVICTABLE_MODELS if self._resident(name) is not None}
+
+    def _evictable(self) -> List[str]:
+        return [name for name in EVICTABLE_MODELS if name not in self._pinned]
+
+    def _evict(self, name: str, reason: str, idle_for: float = 0.0) -> bool:
+        """Drop model `name` if it is loaded, unleased and idle for at least
+        `idle_for` seconds. Returns whether it was dropped."""
+        lock = self._locks[name]
+        # A model being loaded is not idle; and a load making room must not
+        # wait on another model's load lock, which may be making room too.
+        if not lock.acquire(blocking=False):
+            return False
+        try:
+            with self._usage_lock:
+                session = self._resident(name)
+                idle_s = monotonic() - self._last_used.get(name, 0.0)
+                if (
+                    session is None
+                    or name in self._pinned
+                    or self._in_use[name]
+                    or idle_s < idle_for
+                ):
+                    return False
+                setattr(self, _SESSION_ATTRS[name], None)
+                freed = self._resident_bytes.pop(name, 0)
+                self._evictions[name] += 1
+            # Before releasing the load lock, so a reload's state lands after.
+            self._set_load_state(name, LOAD_EVICTED, reason=reason)
+        finally:
+            lock.release()
+        for listener in self._eviction_listeners:
+            listener(session)
+        logger.info(
+            "model_evicted",
+            extra={
+                "event": "model_evicted",
+                "model_name": name,
+                "reason": reason,
+                "idle_s": round(idle_s, 1),
+                "freed_mb": round(freed / _BYTES_PER_MB, 1),
+                "resident_model_mb": self.resident_memory()["resident_model_mb"],
+            },
+        )
+        return True
+
+    def _make_room(self, name: str, path: str) -> None:
+        """Evict idle models, least recently used first, until loading
+        `path` fits in `MODEL_MEMORY_BUDGET_MB`.
+
+        Models that cannot be evicted are never refused: the load goes ahead
+        over budget, with a warning.
+        """
+        budget = self._settings.model_memory_budget_mb * _BYTES_PER_MB
+        if budget <= 0:
+            return
+        incoming = os.path.getsize(path)
+        while True:
+            with self._usage_lock:
+                resident = sum(self._resident_bytes.values())
+                if resident + incoming <= budget:
+                    return
+                candidates = sorted(
+                    (self._last_used.get(other, 0.0), other)
+                    for other in self._evictable()
+                    if other != name and other in self._resident_bytes and not self._in_use[other]
+                )
+            if not any(self._evict(other, "memory_budget") for _, other in candidates):
+                logger.warning(
+                    "model_memory_budget_exceeded",
+                    extra={
+                        "event": "model_memory_budget_exceeded",
+                        "model_name": name,
+                        "resident_model_mb": round(resident / _BYTES_PER_MB, 1),
+                        "incoming_mb": round(incoming / _BYTES_PER_MB, 1),
+                        "memory_budget_mb": self._settings.model_memory_budget_mb,
+                    },
+                )
+                return
+
+    def evict_idle(self) -> List[str]:
+        """Evict every model unused for `MODEL_IDLE_TIMEOUT_S`; returns their names."""
+        timeout = self._settings.model_idle_timeout_s
+        if timeout <= 0:
+            return []
+        return [name for name in self._evictable() if self._evict(name, "idle", idle_for=timeout)]
+
+    def start_idle_eviction(self) -> None:
+        """Check for idle models on a background thread, when
+        `MODEL_IDLE_TIMEOUT_S` is set."""
+        if self._settings.model_idle_timeout_s <= 0 or self._evictor_thread is not None:
+            return
+        self._evictor_thread = Thread(
+            target=self._evict_idle_forever, name="model-evictor", daemon=True
+        )
+        self._evictor_thread.start()
+
+    def _evict_idle_forever(self) -> None:
+        # Often enough that a model goes at most a quarter of the timeout
+        # past it.
+        interval = min(60.0, max(1.0, self._settings.model_idle_timeout_s / 4))
+        while True:
+            sleep(interval)
+            try:
+                self.evict_idle()
+            except Exception:
+                logger.exception("idle_eviction_failed", extra={"event": "idle_eviction_failed"})
+
 
 _REGISTRY: Optional[ModelRegistry] = None
 _REGISTRY_LOCK = Lock()
@@ -3,9 +3,12 @@ import logging
 import os
 from contextlib import contextmanager
 from datetime import datetime, timezone
-from time import perf_counter
+from time import perf_counter, time
 from typing import Any, Dict
 
+# Fallback origin for process_uptime_ms where /proc is unavailable.
+_IMPORTED_AT = time()
+
 
 _RESERVED_LOG_FIELDS = {
     "name",
@@ -77,3 +80,24 @@ def timed_log(logger: logging.Logger, event: str, **fields: Any):
         duration_ms = round((perf_counter() - start) * 1000, 2)
         logger.info("timing", extra={"event": event, "duration_ms": duration_ms, **fields})
 
+
+def _process_started_at() -> float:
+    """Wall-clock start of this process, from /proc on Linux."""
+    try:
+        with open("/proc/self/stat", "r", encoding="utf-8") as stat_file:
+            # The command name may contain spaces; fields resume after ")".
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", "r", encoding="utf-8") as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        started_ticks = int(fields[19])
+        return time() - uptime + started_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return _IMPORTED_AT
+
+
+_PROCESS_STARTED_AT = _process_started_at()
+
+
+def process_uptime_ms() -> float:
+    """Milliseconds since this process started, imports included."""
+    return round((time() - _PROCESS_STARTED_AT) * 1000, 2)
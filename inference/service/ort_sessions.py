@@ -0,0 +1,406 @@
+"""ONNX Runtime session construction for every model the service loads.
+
+Sessions used to be created with default `SessionOptions`, leaving thread
+counts, graph optimization, execution mode and the CPU arena to ONNX Runtime.
+`create_session` builds them from `Settings` instead: `ORT_*` variables set
+the defaults and `ORT_SESSION_OVERRIDES` adjusts individual models, e.g.
+
+    ORT_SESSION_OVERRIDES="gpen:intra_op_threads=4;detection:graph_optimization=extended,intra_op_threads=2"
+
+Model names are `detection`, `recognition`, `genderage`, `landmark_2d_106`,
+`inswapper`, `hyperswap`, `gpen` and `occluder`.
+
+With `ORT_OPTIMIZED_MODEL_DIR` set, the first session for a model saves its
+optimized graph there and later starts load that copy with graph optimization
+switched off, which skips the optimization pass. Copies are keyed by the
+source file, the optimization level, the ONNX Runtime version and the CPU
+architecture; layout optimizations at the `all` level can be specific to the
+host's CPU, so the directory should not be shared between different machines.
+Only CPU-only sessions use the directory.
+
+`ORT_PROVIDERS` lists execution providers in order of preference, as aliases
+(`openvino`, `dnnl`, `cuda`, ...) or full names, and the `providers` override
+key sets them per model (`gpen:providers=openvino|cpu`). Providers this ONNX
+Runtime build lacks are skipped with a warning and CPU always comes last. A
+session that fails to build, or to run the load-time benchmark, on the
+preferred providers is rebuilt on CPU alone.
+
+The benchmark runs each new session `MODEL_BENCHMARK_RUNS` times on random
+input after one untimed run; `session_benchmarks()` reports the provider each
+model ended up on and its median warm latency (see `/health`).
+"""
+
+import dataclasses
+import hashlib
+import os
+import platform
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import onnxruntime as ort
+
+from .cache_dir import remove_quietly
+from .cpu_budget import get_cpu_budget
+from .observability import get_logger, timed_log
+from .settings import Settings
+
+logger = get_logger("inference.ort_sessions")
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+CPU_PROVIDER = "CPUExecutionProvider"
+CPU_PROVIDERS = [CPU_PROVIDER]
+PROVIDER_ALIASES = {
+    "cpu": CPU_PROVIDER,
+    "openvino": "OpenVINOExecutionProvider",
+    "dnnl": "DnnlExecutionProvider",
+    "cuda": "CUDAExecutionProvider",
+    "tensorrt": "TensorrtExecutionProvider",
+    "coreml": "CoreMLExecutionProvider",
+}
+# Spatial size for free input dims in the load-time benchmark; detection
+# passes its configured size instead.
+DEFAULT_SAMPLE_SIZE = 128
+_INPUT_DTYPES = {
+    "tensor(float)": np.float32,
+    "tensor(float16)": np.float16,
+    "tensor(double)": np.float64,
+    "tensor(int64)": np.int64,
+    "tensor(int32)": np.int32,
+    "tensor(uint8)": np.uint8,
+}
+
+_benchmarks: Dict[str, Dict[str, Any]] = {}
+_benchmarks_lock = threading.Lock()
+
+
+@dataclasses.dataclass(frozen=True)
+class SessionConfig:
+    intra_op_threads: int
+    inter_op_threads: int
+    graph_optimization: str
+    execution_mode: str
+    cpu_mem_arena: bool
+    providers: Tuple[str, ...] = (CPU_PROVIDER,)
+
+
+def parse_providers(raw: str) -> Tuple[str, ...]:
+    """`openvino|cpu` or `openvino,cpu` -> full provider names, in preference order."""
+    names = [name.strip() for name in raw.replace("|", ",").split(",") if name.strip()]
+    return tuple(PROVIDER_ALIASES.get(name.lower(), name) for name in names)
+
+
+def _parse_bool(raw: str) -> bool:
+    return raw.strip().lower() in {"1", "true", "yes", "on"}
+
+
+_FIELD_PARSERS = {
+    "intra_op_threads": int,
+    "inter_op_threads": int,
+    "graph_optimization": lambda raw: raw.strip().lower(),
+    "execution_mode": lambda raw: raw.strip().lower(),
+    "cpu_mem_arena": _parse_bool,
+    # Lists are `|`-separated here, since `,` separates settings.
+    "providers": parse_providers,
+}
+
+
+def parse_session_overrides(raw: str) -> Dict[str, Dict[str, Any]]:
+    """`model:key=value,key=value;model:...` -> {model: {key: value}}."""
+    overrides: Dict[str, Dict[str, Any]] = {}
+    for entry in raw.split(";"):
+        if not entry.strip():
+            continue
+        model_name, sep, assignments = entry.partition(":")
+        if not sep:
+            raise ValueError(f"ORT_SESSION_OVERRIDES entry {entry!r} has no model name")
+        fields = overrides.setdefault(model_name.strip(), {})
+        for assignment in assignments.split(","):
+            if not assignment.strip():
+                continue
+            key, sep, value = assignment.partition("=")
+            key = key.strip()
+            if not sep or key not in _FIELD_PARSERS:
+                raise ValueError(f"ORT_SESSION_OVERRIDES has an invalid setting {assignment!r}")
+            fields[key] = _FIELD_PARSERS[key](value)
+    return overrides
+
+
+def session_config(settings: Settings, model_name: str) -> SessionConfig:
+    config = SessionConfig(
+        intra_op_threads=settings.ort_intra_op_threads,
+        inter_op_threads=settings.ort_inter_op_threads,
+        graph_optimization=settings.ort_graph_optimization,
+        execution_mode=settings.ort_execution_mode,
+        cpu_mem_arena=settings.ort_cpu_mem_arena,
+        providers=parse_providers(settings.ort_providers) or (CPU_PROVIDER,),
+    )
+    overrides = parse_session_overrides(settings.ort_session_overrides).get(model_name, {})
+    config = dataclasses.replace(config, **overrides)
+    if config.intra_op_threads <= 0:
+        # Sized so that concurrent calls share the machine instead of each
+        # spreading across every core (see cpu_budget.py).
+        config = dataclasses.replace(
+            config, intra_op_threads=get_cpu_budget().threads_per_call
+        )
+    if config.graph_optimization not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unknown graph optimization level {config.graph_optimization!r}")
+    if config.execution_mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode {config.execution_mode!r}")
+    return config
+
+
+def session_options(config: SessionConfig) -> ort.SessionOptions:
+    options = ort.SessionOptions()
+    # 0 leaves the choice to ONNX Runtime.
+    options.intra_op_num_threads = max(0, config.intra_op_threads)
+    options.inter_op_num_threads = max(0, config.inter_op_threads)
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[config.graph_optimization]
+    options.execution_mode = EXECUTION_MODES[config.execution_mode]
+    options.enable_cpu_mem_arena = config.cpu_mem_arena
+    return options
+
+
+def _optimized_model_path(
+    cache_dir: str, model_path: str, model_name: str, config: SessionConfig
+) -> str:
+    stat = os.stat(model_path)
+    digest = hashlib.sha256(
+        "|".join(
+            [
+                os.path.realpath(model_path),
+                str(stat.st_size),
+                str(int(stat.st_mtime)),
+                config.graph_optimization,
+                ort.__version__,
+                platform.machine(),
+            ]
+        ).encode("utf-8")
+    ).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{model_name}-{digest}.onnx")
+
+
+def resolve_providers(requested: Tuple[str, ...]) -> Tuple[List[str], List[str]]:
+    """(providers to use, requested ones this build lacks). CPU always ends the list."""
+    available = set(ort.get_available_providers())
+    usable: List[str] = []
+    missing: List[str] = []
+    for provider in requested:
+        if provider in available:
+            if provider not in usable:
+                usable.append(provider)
+        else:
+            missing.append(provider)
+    if CPU_PROVIDER not in usable:
+        usable.append(CPU_PROVIDER)
+    return usable, missing
+
+
+def sample_feed(session: ort.InferenceSession, spatial_size: int) -> Dict[str, np.ndarray]:
+    """Random inputs of the session's shapes; free dims become 1 (batch) or `spatial_size`."""
+    rng = np.random.default_rng(0)
+    feed = {}
+    for model_input in session.get_inputs():
+        shape = [
+            dim if isinstance(dim, int) and dim > 0 else (1 if axis == 0 else spatial_size)
+            for axis, dim in enumerate(model_input.shape)
+        ]
+        dtype = _INPUT_DTYPES.get(model_input.type, np.float32)
+        feed[model_input.name] = rng.random(shape).astype(dtype)
+    return feed
+
+
+def _benchmark(session: ort.InferenceSession, runs: int, spatial_size: int) -> float:
+    """Median warm latency in ms; the first, cold run is not counted."""
+    feed = sample_feed(session, spatial_size)
+    session.run(None, feed)
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        session.run(None, feed)
+        timings.append((time.perf_counter() - started) * 1000)
+    return float(np.median(timings))
+
+
+def _warm_latency(
+    session: ort.InferenceSession,
+    model_name: str,
+    settings: Settings,
+    sample_size: int,
+    strict: bool,
+) -> Optional[float]:
+    if settings.model_benchmark_runs <= 0:
+        return None
+    try:
+        return _benchmark(session, settings.model_benchmark_runs, sample_size)
+    except Exception as exc:
+        if strict:
+            raise
+        # On CPU a failed run means the synthetic input did not suit the
+        # model, not that the session is unusable.
+        logger.warning(
+            "ort_benchmark_failed",
+            extra={"event": "ort_benchmark_failed", "model_name": model_name, "error": str(exc)},
+        )
+        return None
+
+
+def _build_session(
+    model_path: str,
+    model_name: str,
+    settings: Settings,
+    config: SessionConfig,
+    providers: List[str],
+) -> Tuple[ort.InferenceSession, str]:
+    options = session_options(config)
+    optimized_cache = "off"
+    session = None
+
+    # Graphs optimized for another provider may hold nodes only it can run,
+    # so only CPU-only sessions use the cache.
+    cache_dir = settings.ort_optimized_model_dir
+    if cache_dir and config.graph_optimization != "disable" and providers == CPU_PROVIDERS:
+        os.makedirs(cache_dir, exist_ok=True)
+        optimized_path = _optimized_model_path(cache_dir, model_path, model_name, config)
+        if os.path.exists(optimized_path):
+            cached_options = session_options(config)
+            cached_options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS["disable"]
+            try:
+                with timed_log(logger, "ort_session_load", model_name=model_name, optimized=True):
+                    session = ort.InferenceSession(
+                        optimized_path, sess_options=cached_options, providers=providers
+                    )
+                optimized_cache = "hit"
+            except Exception as exc:
+                logger.warning(
+                    "ort_optimized_model_unreadable",
+                    extra={
+                        "event": "ort_optimized_model_unreadable",
+                        "model_name": model_name,
+                        "path": optimized_path,
+                        "error": str(exc),
+                    },
+                )
+                # Another process may have found it unreadable too.
+                remove_quietly(optimized_path)
+        if session is None:
+            # ORT writes the file while the session is built; write beside the
+            # final name and rename so a concurrent start never reads half a file.
+            tmp_path = f"{optimized_path}.{os.getpid()}.tmp.onnx"
+            options.optimized_model_filepath = tmp_path
+            optimized_cache = "write"
+
+    if session is None:
+        try:
+            with timed_log(logger, "ort_session_load", model_name=model_name, optimized=False):
+                session = ort.InferenceSession(model_path, sess_options=options, providers=providers)
+            if optimized_cache == "write":
+                if os.path.exists(tmp_path):
+                    os.replace(tmp_path, optimized_path)
+                else:
+                    optimized_cache = "off"
+        finally:
+            if optimized_cache == "write":
+                # Whatever ORT wrote before failing; gone already on success.
+                remove_quietly(tmp_path)
+    return session, optimized_cache
+
+
+def create_session(
+    model_path: str,
+    model_name: str,
+    settings: Settings,
+    sample_size: int = DEFAULT_SAMPLE_SIZE,
+) -> ort.InferenceSession:
+    """InferenceSession for `model_path` with the options configured for `model_name`.
+
+    Falls back to CPU when a configured provider fails to build the session or
+    to run it. `sample_size` fills the free spatial dims of the benchmark input.
+    A model is benchmarked once per process: rebuilding it (after an idle
+    eviction, say) reuses the recorded latency, and runs it once only to
+    check a non-CPU provider.
+    """
+    with _benchmarks_lock:
+        previous = _benchmarks.get(model_name)
+    config = session_config(settings, model_name)
+    providers, missing = resolve_providers(config.providers)
+    if missing:
+        logger.warning(
+            "ort_provider_unavailable",
+            extra={
+                "event": "ort_provider_unavailable",
+                "model_name": model_name,
+                "missing": missing,
+                "available": ort.get_available_providers(),
+            },
+        )
+
+    try:
+        session, optimized_cache = _build_session(
+            model_path, model_name, settings, config, providers
+        )
+        # A provider can accept a graph and still fail to run it, so the
+        # benchmark doubles as the check that decides on the fallback.
+        if previous is None:
+            warm_ms = _warm_latency(
+                session, model_name, settings, sample_size, strict=providers != CPU_PROVIDERS
+            )
+        else:
+            warm_ms = previous["warm_ms"]
+            if providers != CPU_PROVIDERS:
+                session.run(None, sample_feed(session, sample_size))
+    except Exception as exc:
+        if providers == CPU_PROVIDERS:
+            raise
+        logger.warning(
+            "ort_provider_fallback",
+            extra={
+                "event": "ort_provider_fallback",
+                "model_name": model_name,
+                "providers": providers,
+                "error": str(exc),
+            },
+        )
+        providers = list(CPU_PROVIDERS)
+        session, optimized_cache = _build_session(
+            model_path, model_name, settings, config, providers
+        )
+        if previous is None or previous["provider"] != CPU_PROVIDER:
+            warm_ms = _warm_latency(session, model_name, settings, sample_size, strict=False)
+
+    provider = session.get_providers()[0]
+    with _benchmarks_lock:
+        _benchmarks[model_name] = {"provider": provider, "warm_ms": _round(warm_ms)}
+    logger.info(
+        "ort_session_created",
+        extra={
+            "event": "ort_session_created",
+            "model_name": model_name,
+            "optimized_cache": optimized_cache,
+            "warm_ms": _round(warm_ms),
+            **dataclasses.asdict(config),
+            "requested_providers": list(config.providers),
+            "providers": session.get_providers(),
+        },
+    )
+    return session
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 1)
+
+
+def session_benchmarks() -> Dict[str, Dict[str, Any]]:
+    """Provider and warm latency of every session this process has created."""
+    with _benchmarks_lock:
+        return {name: dict(entry) for name, entry in _benchmarks.items()}
@@ -2,8 +2,6 @@ import os
 from pathlib import PurePosixPath
 from typing import Optional
 
-from huggingface_hub import HfApi
-
 
 def _clean_repo_type(repo_type: Optional[str]) -> str:
     value = str(repo_type or "dataset").strip().lower()
@@ -42,6 +40,10 @@ def upload_output(
     clean_revision = str(revision or "main").strip() or "main"
     size = os.path.getsize(local_path)
 
+    # Imported on use: huggingface_hub's client is slow to import, and
+    # startup should not wait for it.
+    from huggingface_hub import HfApi
+
     HfApi(token=token).upload_file(
         path_or_fileobj=local_path,
         path_in_repo=clean_key,
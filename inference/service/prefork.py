@@ -0,0 +1,283 @@
+"""Prefork HTTP server: models load once, forked workers share them.
+
+`app.py` runs a single uvicorn process - one event loop, one interpreter -
+and each extra process started beside it would load its own copy of the
+models (about a gigabyte, see video_swap.py). `PreforkServer` loads every
+model in a master process, then forks `PREFORK_WORKERS` uvicorn workers that
+accept on one shared socket. The model weights stay in pages the workers only
+read, so they share them copy-on-write with the master and each other; what a
+worker adds on top is reported as `prefork_memory` (`private_mb`) for sizing
+containers.
+
+ONNX Runtime sessions survive fork, but their intra-op thread pools do not:
+a forked worker runs every call on its calling thread whatever the session
+was built with. Sessions are therefore built in the master with one thread
+each, and parallelism comes from the workers instead. Each worker's CPU budget
+is its share of the cores (pinned to them with `CPU_PIN_WORKERS`).
+
+The master restarts a worker that exits, in the same slot, so that it
+recovers that slot's video jobs (see video_jobs.py); slot 0 also recovers
+those of slots beyond `PREFORK_WORKERS`. `PREFORK_MAX_REQUESTS` recycles a
+worker after that many requests, give or take 10% so the workers do not all
+restart together. On SIGTERM or SIGINT the workers stop accepting
+and finish in-flight requests for up to `PREFORK_DRAIN_TIMEOUT_S`, then are
+killed. A stopping worker - recycled or drained - then waits up to
+`PREFORK_DRAIN_TIMEOUT_S` more for the video jobs it is running, without
+starting queued ones; whatever it leaves, the slot's next worker, or the next
+start, resumes from the last checkpoint.
+"""
+
+import os
+import random
+import signal
+import socket
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from .cpu_budget import CpuBudget, available_cores, use_cpu_budget
+from .model_registry import get_model_registry
+from .observability import get_logger, timed_log
+from .settings import Settings
+
+logger = get_logger("inference.prefork")
+
+# A worker that exits sooner than this after starting is restarted only after
+# a pause, so a crash at startup does not become a fork loop.
+_MIN_WORKER_LIFETIME_S = 5.0
+_POLL_INTERVAL_S = 0.5
+# The first memory report waits for the workers to have started serving.
+_FIRST_MEMORY_REPORT_S = 10.0
+
+
+def resolve_prefork_workers(configured: int, settings: Settings) -> int:
+    if configured > 0:
+        return configured
+    # Enough workers for one concurrent call per core.
+    return max(1, len(available_cores()) // max(1, settings.inference_concurrency))
+
+
+def process_memory_mb(pid: int) -> Dict[str, float]:
+    """RSS, PSS and private memory of `pid` in MB; empty where /proc lacks them.
+
+    PSS splits shared pages between the processes sharing them, and private
+    memory is what the process does not share at all: its cost on top of the
+    master.
+    """
+    fields: Dict[str, int] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r", encoding="utf-8") as smaps:
+            for line in smaps:
+                name, _, value = line.partition(":")
+                parts = value.split()
+                if parts and parts[0].isdigit():
+                    fields[name] = int(parts[0])
+    except OSError:
+        return {}
+    kb_to_mb = 1 / 1024
+    return {
+        "rss_mb": round(fields.get("Rss", 0) * kb_to_mb, 1),
+        "pss_mb": round(fields.get("Pss", 0) * kb_to_mb, 1),
+        "private_mb": round(
+            (fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)) * kb_to_mb, 1
+        ),
+    }
+
+
+class PreforkServer:
+    def __init__(self, settings: Settings):
+        self._settings = settings
+        self._worker_count = resolve_prefork_workers(settings.prefork_workers, settings)
+        self._cores = available_cores()
+        # pid -> (slot, monotonic start time)
+        self._workers: Dict[int, Tuple[int, float]] = {}
+        self._stopping = False
+
+    def serve(self) -> None:
+        sock = self._bind()
+        self._load_models()
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        for slot in range(self._worker_count):
+            self._spawn(slot, sock)
+        logger.info(
+            "prefork_started",
+            extra={
+                "event": "prefork_started",
+                "port": self._settings.port,
+                "workers": self._worker_count,
+            },
+        )
+
+        next_report = time.monotonic() + min(
+            _FIRST_MEMORY_REPORT_S, self._settings.prefork_memory_report_s
+        )
+        drain_deadline = None
+        while self._workers:
+            self._reap(sock)
+            now = time.monotonic()
+            if self._stopping and drain_deadline is None:
+                # In-flight requests, then running video jobs, each get the
+                # drain timeout.
+                drain_deadline = now + 2 * self._settings.prefork_drain_timeout_s
+                self._signal_workers(signal.SIGTERM)
+            elif drain_deadline is not None and now >= drain_deadline:
+                logger.warning(
+                    "prefork_drain_timeout",
+                    extra={"event": "prefork_drain_timeout", "workers": len(self._workers)},
+                )
+                self._signal_workers(signal.SIGKILL)
+                drain_deadline = float("inf")
+            if self._settings.prefork_memory_report_s > 0 and now >= next_report:
+                self._report_memory()
+                next_report = now + self._settings.prefork_memory_report_s
+            time.sleep(_POLL_INTERVAL_S)
+        sock.close()
+        logger.info("prefork_stopped", extra={"event": "prefork_stopped"})
+
+    def _bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("0.0.0.0", self._settings.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def _load_models(self) -> None:
+        if self._settings.ort_intra_op_threads > 1:
+            logger.warning(
+                "prefork_threaded_sessions",
+                extra={
+                    "event": "prefork_threaded_sessions",
+                    "ort_intra_op_threads": self._settings.ort_intra_op_threads,
+                    "detail": "intra-op threads do not survive fork; workers run sessions on one thread",
+                },
+            )
+        use_cpu_budget(
+            CpuBudget(self._cores, threads_per_call=1, image_slots=self._settings.inference_concurrency)
+        )
+        registry = get_model_registry()
+        with timed_log(logger, "prefork_model_load"):
+            registry.preload_assets()
+            if self._settings.model_priming:
+                registry.prime_models()
+        # Workers share these copy-on-write; evicting one would free nothing.
+        registry.pin_resident()
+        # Locks held by other threads at fork stay held forever in the child.
+        # Loading joins its own threads; anything left is a bug to look at.
+        if threading.active_count() > 1:
+            logger.warning(
+                "prefork_threads_at_fork",
+                extra={
+                    "event": "prefork_threads_at_fork",
+                    "threads": [thread.name for thread in threading.enumerate()],
+                },
+            )
+
+    def _spawn(self, slot: int, sock: socket.socket) -> None:
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 1
+            try:
+                self._run_worker(slot, sock)
+                exit_code = 0
+            except BaseException:
+                logger.exception(
+                    "prefork_worker_failed", extra={"event": "prefork_worker_failed", "slot": slot}
+                )
+            finally:
+                # Never fall back into the master's loop. The app's shutdown
+                # has already drained its video jobs (see api.py).
+                os._exit(exit_code)
+        self._workers[pid] = (slot, time.monotonic())
+        logger.info(
+            "prefork_worker_started",
+            extra={"event": "prefork_worker_started", "slot": slot, "pid": pid},
+        )
+
+    def _worker_cores(self, slot: int) -> List[int]:
+        return self._cores[slot :: self._worker_count] or self._cores
+
+    def _run_worker(self, slot: int, sock: socket.socket) -> None:
+        import uvicorn
+
+        from .api import create_app
+
+        # uvicorn installs its own handlers for a graceful shutdown.
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        cores = self._worker_cores(slot)
+        if self._settings.cpu_pin_workers:
+            try:
+                os.sched_setaffinity(0, cores)
+            except (AttributeError, OSError):
+                pass
+        use_cpu_budget(
+            CpuBudget(cores, threads_per_call=1, image_slots=self._settings.inference_concurrency)
+        )
+        max_requests = None
+        if self._settings.prefork_max_requests > 0:
+            jitter = int(self._settings.prefork_max_requests * 0.1)
+            max_requests = self._settings.prefork_max_requests + random.randint(0, jitter)
+        # Slot 0 also takes over the jobs of slots that no longer exist.
+        owners = [f"worker-{other}" for other in range(self._worker_count)]
+        config = uvicorn.Config(
+            create_app(job_owner=owners[slot], live_job_owners=owners if slot == 0 else None),
+            log_config=None,
+            limit_max_requests=max_requests,
+            timeout_graceful_shutdown=self._settings.prefork_drain_timeout_s,
+        )
+        uvicorn.Server(config).run(sockets=[sock])
+
+    def _reap(self, sock: socket.socket) -> None:
+        while self._workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self._workers.clear()
+                return
+            if pid == 0:
+                return
+            slot, started = self._workers.pop(pid, (None, None))
+            if slot is None:
+                continue
+            lifetime = time.monotonic() - started
+            logger.info(
+                "prefork_worker_exited",
+                extra={
+                    "event": "prefork_worker_exited",
+                    "slot": slot,
+                    "pid": pid,
+                    "exit_code": os.waitstatus_to_exitcode(status),
+                    "lifetime_s": round(lifetime, 1),
+                },
+            )
+            if not self._stopping:
+                if lifetime < _MIN_WORKER_LIFETIME_S:
+                    time.sleep(1.0)
+                self._spawn(slot, sock)
+
+    def _signal_workers(self, signum: int) -> None:
+        for pid in list(self._workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _request_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def _report_memory(self) -> None:
+        workers = []
+        for pid, (slot, _) in sorted(self._workers.items(), key=lambda item: item[1][0]):
+            workers.append({"slot": slot, "pid": pid, **process_memory_mb(pid)})
+        private = [worker["private_mb"] for worker in workers if "private_mb" in worker]
+        logger.info(
+            "prefork_memory",
+            extra={
+                "event": "prefork_memory",
+                "master": process_memory_mb(os.getpid()),
+                "workers": workers,
+                "worker_private_mb_avg": round(sum(private) / len(private), 1) if private else None,
+            },
+        )
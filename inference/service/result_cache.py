@@ -0,0 +1,285 @@
+"""Content-addressed cache of finished image swaps.
+
+The API retries `/swap-remote` when a request fails upstream, and users
+often re-run a model on a photo they have already swapped. Both used to run
+the whole pipeline and the storage upload again.
+
+A result is keyed by a hash of everything that decides its pixels: the
+source embedding and gender, the target image bytes, the swap options, and
+the settings that affect the output (`OUTPUT_SETTINGS`). The encoded image
+is kept on disk under `RESULT_CACHE_DIR`, with the storage locations it has
+already been uploaded to:
+
+- a retry for a location the result already reached returns at once, with
+  no inference and no upload;
+- a re-run for a new location skips inference and only uploads.
+
+The cache holds users' images, so it is off unless `RESULT_CACHE_MAX_MB` is
+set. Entries are evicted least-recently-used once their total size passes
+it, and removed once unused for `RESULT_CACHE_TTL_HOURS` - on the next
+lookup of the entry, or the next rescan of the directory. Recency is the
+data file's mtime, so it survives a restart. Prefork workers share the
+directory, its entries and its budget (see cache_dir.py).
+"""
+
+import dataclasses
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, List, Optional
+
+import numpy as np
+
+from .cache_dir import RESCAN_INTERVAL_S, lock_path, remove_quietly, scan_entries, touch
+from .model_manifest import file_lock
+from .observability import get_logger
+from .settings import Settings
+
+logger = get_logger("inference.result_cache")
+
+# Settings that change what a swap produces. Anything else (ports, queue
+# sizes, directories) may change without invalidating the cache.
+OUTPUT_SETTINGS = (
+    "model_repo",
+    "detection_size_min",
+    "detection_size_max",
+    "detection_size_ratio",
+    "detection_size_step",
+    "face_mask_blur",
+    "face_mask_forehead_ratio",
+    "face_mask_erode",
+    "occlusion_mask_enabled",
+    "occluder_model_file",
+    "face_swap_crop_size",
+    "color_match_strength",
+    "restore_blend",
+    "output_jpeg_quality",
+    "model_precision",
+)
+
+# Bumped when the pipeline changes output for identical inputs.
+CACHE_VERSION = 1
+
+
+def hash_file(file_obj: BinaryIO) -> str:
+    """sha256 of a seekable file's contents; leaves it rewound."""
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(1 << 20), b""):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def swap_cache_key(
+    source_embedding: np.ndarray,
+    target_hash: str,
+    settings: Settings,
+    **options: Any,
+) -> str:
+    """Cache key for one swap. `options` are the request's effective options."""
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(source_embedding, dtype=np.float32).tobytes())
+    settings_values = dataclasses.asdict(settings)
+    digest.update(
+        json.dumps(
+            {
+                "version": CACHE_VERSION,
+                "target": target_hash,
+                "options": options,
+                "settings": {name: settings_values[name] for name in OUTPUT_SETTINGS},
+            },
+            sort_keys=True,
+        ).encode("utf-8")
+    )
+    return digest.hexdigest()
+
+
+@dataclasses.dataclass(frozen=True)
+class CachedResult:
+    data: bytes
+    mime_type: str
+    uploads: List[List[str]]
+
+
+class ResultCache:
+    """Disk-backed LRU of encoded swap results. Safe to share across threads."""
+
+    def __init__(self, root: str, max_bytes: int, ttl_s: float = 0):
+        """`ttl_s` 0 keeps entries until they are evicted."""
+        os.makedirs(root, exist_ok=True)
+        self._root = root
+        self._max_bytes = max_bytes
+        self._ttl_s = ttl_s
+        self._lock = threading.Lock()
+        # key -> size in bytes, least recently used first.
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._next_scan = 0.0
+        self._stats = {
+            "hits": 0, "upload_hits": 0, "misses": 0, "evictions": 0, "expirations": 0,
+        }
+        self._load_index()
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        # Looked up on disk even when not indexed: another worker may have
+        # written it. The files are read outside the lock, which only guards
+        # the index: they are replaced atomically, and another worker may
+        # remove them at any moment whatever this one holds.
+        data_path = self._data_path(key)
+        data = None
+        expired = False
+        try:
+            expired = self._expired(os.stat(data_path).st_mtime_ns)
+            if not expired:
+                meta = self._read_meta(key)
+                with open(data_path, "rb") as file_obj:
+                    data = file_obj.read()
+                touch(data_path)
+        except FileNotFoundError:
+            # Never written, evicted by another worker, or still being
+            # written by one.
+            with self._lock:
+                self._bytes -= self._entries.pop(key, 0)
+                self._stats["misses"] += 1
+            return None
+        except (OSError, ValueError):
+            pass
+        with self._lock:
+            if data is None:
+                # Expired or unreadable.
+                self._drop(key)
+                self._stats["misses"] += 1
+                if expired:
+                    self._stats["expirations"] += 1
+                return None
+            if key not in self._entries:
+                self._entries[key] = len(data)
+                self._bytes += len(data)
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return CachedResult(data=data, mime_type=meta["mime_type"], uploads=meta["uploads"])
+
+    def put(self, key: str, data: bytes, mime_type: str) -> None:
+        """Store a result. A failed write (a full disk, say) is logged and
+        dropped: the caller already has its output."""
+        if len(data) > self._max_bytes:
+            return
+        try:
+            self._write_atomic(self._data_path(key), data)
+            with self._lock:
+                self._write_meta(key, {"mime_type": mime_type, "uploads": []})
+                if key in self._entries:
+                    self._bytes -= self._entries.pop(key)
+                self._entries[key] = len(data)
+                self._bytes += len(data)
+                self._enforce_budget()
+        except OSError as exc:
+            logger.warning(
+                "result_cache_write_failed",
+                extra={"event": "result_cache_write_failed", "error": str(exc)},
+            )
+
+    def record_upload(self, key: str, location: List[str]) -> None:
+        """Remember that the result for `key` now exists at `location`."""
+        with self._lock:
+            if key not in self._entries:
+                return
+            try:
+                meta = self._read_meta(key)
+            except (OSError, ValueError):
+                return
+            if location not in meta["uploads"]:
+                meta["uploads"].append(location)
+                try:
+                    self._write_meta(key, meta)
+                except OSError as exc:
+                    logger.warning(
+                        "result_cache_write_failed",
+                        extra={"event": "result_cache_write_failed", "error": str(exc)},
+                    )
+
+    def count_upload_hit(self) -> None:
+        with self._lock:
+            self._stats["upload_hits"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+            }
+
+    def _enforce_budget(self) -> None:
+        if self._bytes <= self._max_bytes and time.monotonic() < self._next_scan:
+            return
+        # Other workers write to the same directory: re-read it, then evict
+        # from the whole of it, one worker at a time.
+        with file_lock(lock_path(self._root)):
+            self._rescan()
+            while self._bytes > self._max_bytes and self._entries:
+                key = next(iter(self._entries))
+                self._drop(key)
+                self._stats["evictions"] += 1
+
+    def _drop(self, key: str) -> None:
+        self._bytes -= self._entries.pop(key, 0)
+        for path in (self._data_path(key), self._meta_path(key)):
+            remove_quietly(path)
+
+    def _rescan(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+        for mtime_ns, key, size in scan_entries(self._root, ".bin", companion_suffix=".json"):
+            if self._expired(mtime_ns):
+                self._drop(key)
+                self._stats["expirations"] += 1
+                continue
+            self._entries[key] = size
+            self._bytes += size
+        self._next_scan = time.monotonic() + RESCAN_INTERVAL_S
+
+    def _load_index(self) -> None:
+        with self._lock:
+            self._enforce_budget()
+        logger.info(
+            "result_cache_loaded",
+            extra={
+                "event": "result_cache_loaded",
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            },
+        )
+
+    def _expired(self, mtime_ns: int) -> bool:
+        return self._ttl_s > 0 and time.time_ns() - mtime_ns > self._ttl_s * 1e9
+
+    def _data_path(self, key: str) -> str:
+        return os.path.join(self._root, key + ".bin")
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self._root, key + ".json")
+
+    def _read_meta(self, key: str) -> Dict[str, Any]:
+        with open(self._meta_path(key), "r", encoding="utf-8") as file_obj:
+            return json.load(file_obj)
+
+    def _write_meta(self, key: str, meta: Dict[str, Any]) -> None:
+        self._write_atomic(self._meta_path(key), json.dumps(meta).encode("utf-8"))
+
+    def _write_atomic(self, path: str, data: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self._root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file_obj:
+                file_obj.write(data)
+            touch(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            remove_quietly(tmp_path)
+            raise
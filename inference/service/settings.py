@@ -1,6 +1,7 @@
 import os
 from dataclasses import dataclass
 from functools import lru_cache
+from typing import List
 
 
 def _env_bool(name: str, default: bool) -> bool:
@@ -29,6 +30,63 @@ class Settings:
     restore_blend: float
     output_jpeg_quality: int
     video_worker_count: int
+    video_executor: str
+    video_detect_interval: int
+    video_scene_cut_threshold: float
+    video_encoder: str
+    video_batch_size: int
+    video_detect_worker_count: int
+    video_queue_max_mb: int
+    video_shard_workers: str
+    video_shard_segment_seconds: float
+    video_shard_timeout_seconds: float
+    video_job_dir: str
+    video_job_workers: int
+    video_job_max_queued: int
+    video_checkpoint_dir: str
+    video_checkpoint_frames: int
+    video_checkpoint_ttl_hours: float
+    image_upload_max_mb: int
+    video_upload_max_mb: int
+    inference_concurrency: int
+    inference_queue_max: int
+    video_request_concurrency: int
+    video_request_queue_max: int
+    swap_batch_max_size: int
+    swap_batch_wait_ms: float
+    result_cache_dir: str
+    result_cache_max_mb: int
+    face_cache_entries: int
+    face_cache_dir: str
+    face_cache_disk_max_mb: int
+    detector_pool_size: int
+    ort_intra_op_threads: int
+    ort_inter_op_threads: int
+    ort_graph_optimization: str
+    ort_execution_mode: str
+    ort_cpu_mem_arena: bool
+    ort_session_overrides: str
+    ort_optimized_model_dir: str
+    cpu_budget_cores: int
+    cpu_threads_per_call: int
+    cpu_pin_workers: bool
+    model_precision: str
+    quantized_model_dir: str
+    ort_providers: str
+    model_benchmark_runs: int
+    model_preload_on_start: bool
+    model_priming: bool
+    prime_detection_sizes: str
+    model_manifest_path: str
+    model_manifest_verify: str
+    model_load_concurrency: int
+    prefork_workers: int
+    prefork_max_requests: int
+    prefork_drain_timeout_s: int
+    prefork_memory_report_s: int
+    model_memory_budget_mb: int
+    model_idle_timeout_s: int
+    result_cache_ttl_hours: float
 
     def detection_size_for_image(self, width: int, height: int) -> int:
         step = max(1, self.detection_size_step)
@@ -40,6 +98,14 @@ class Settings:
         stepped = (clamped // step) * step
         return max(min_size, stepped)
 
+    def detection_size_buckets(self) -> List[int]:
+        """Every size `detection_size_for_image` can return, smallest first."""
+        step = max(1, self.detection_size_step)
+        min_size = min(self.detection_size_min, self.detection_size_max)
+        max_size = max(self.detection_size_min, self.detection_size_max)
+        first = (min_size // step + 1) * step
+        return [min_size] + list(range(first, max_size + 1, step))
+
 
 @lru_cache(maxsize=1)
 def get_settings() -> Settings:
@@ -64,4 +130,62 @@ def get_settings() -> Settings:
         restore_blend=float(os.environ.get("RESTORE_BLEND", "0.8")),
         output_jpeg_quality=int(os.environ.get("OUTPUT_JPEG_QUALITY", "95")),
         video_worker_count=int(os.environ.get("VIDEO_WORKER_COUNT", "0")),
+        video_executor=os.environ.get("VIDEO_EXECUTOR", "thread").strip().lower(),
+        video_detect_interval=int(os.environ.get("VIDEO_DETECT_INTERVAL", "1")),
+        video_scene_cut_threshold=float(os.environ.get("VIDEO_SCENE_CUT_THRESHOLD", "0.12")),
+        video_encoder=os.environ.get("VIDEO_ENCODER", "auto").strip().lower(),
+        video_batch_size=int(os.environ.get("VIDEO_BATCH_SIZE", "1")),
+        video_detect_worker_count=int(os.environ.get("VIDEO_DETECT_WORKER_COUNT", "0")),
+        video_queue_max_mb=int(os.environ.get("VIDEO_QUEUE_MAX_MB", "64")),
+        video_shard_workers=os.environ.get("VIDEO_SHARD_WORKERS", ""),
+        video_shard_segment_seconds=float(os.environ.get("VIDEO_SHARD_SEGMENT_SECONDS", "10")),
+        video_shard_timeout_seconds=float(os.environ.get("VIDEO_SHARD_TIMEOUT_SECONDS", "1800")),
+        video_job_dir=os.environ.get("VIDEO_JOB_DIR", "video_jobs"),
+        video_job_workers=int(os.environ.get("VIDEO_JOB_WORKERS", "1")),
+        video_job_max_queued=int(os.environ.get("VIDEO_JOB_MAX_QUEUED", "16")),
+        video_checkpoint_dir=os.environ.get("VIDEO_CHECKPOINT_DIR", "video_checkpoints"),
+        video_checkpoint_frames=int(os.environ.get("VIDEO_CHECKPOINT_FRAMES", "300")),
+        video_checkpoint_ttl_hours=float(os.environ.get("VIDEO_CHECKPOINT_TTL_HOURS", "24")),
+        image_upload_max_mb=int(os.environ.get("IMAGE_UPLOAD_MAX_MB", "25")),
+        video_upload_max_mb=int(os.environ.get("VIDEO_UPLOAD_MAX_MB", "1024")),
+        inference_concurrency=int(os.environ.get("INFERENCE_CONCURRENCY", "2")),
+        inference_queue_max=int(os.environ.get("INFERENCE_QUEUE_MAX", "8")),
+        video_request_concurrency=int(os.environ.get("VIDEO_REQUEST_CONCURRENCY", "1")),
+        video_request_queue_max=int(os.environ.get("VIDEO_REQUEST_QUEUE_MAX", "1")),
+        swap_batch_max_size=int(os.environ.get("SWAP_BATCH_MAX_SIZE", "1")),
+        swap_batch_wait_ms=float(os.environ.get("SWAP_BATCH_WAIT_MS", "10")),
+        result_cache_dir=os.environ.get("RESULT_CACHE_DIR", "result_cache"),
+        result_cache_max_mb=int(os.environ.get("RESULT_CACHE_MAX_MB", "0")),
+        face_cache_entries=int(os.environ.get("FACE_CACHE_ENTRIES", "256")),
+        face_cache_dir=os.environ.get("FACE_CACHE_DIR", ""),
+        face_cache_disk_max_mb=int(os.environ.get("FACE_CACHE_DISK_MAX_MB", "64")),
+        detector_pool_size=int(os.environ.get("DETECTOR_POOL_SIZE", "4")),
+        ort_intra_op_threads=int(os.environ.get("ORT_INTRA_OP_THREADS", "0")),
+        ort_inter_op_threads=int(os.environ.get("ORT_INTER_OP_THREADS", "0")),
+        ort_graph_optimization=os.environ.get("ORT_GRAPH_OPTIMIZATION", "all").strip().lower(),
+        ort_execution_mode=os.environ.get("ORT_EXECUTION_MODE", "sequential").strip().lower(),
+        ort_cpu_mem_arena=_env_bool("ORT_CPU_MEM_ARENA", True),
+        ort_session_overrides=os.environ.get("ORT_SESSION_OVERRIDES", ""),
+        ort_optimized_model_dir=os.environ.get("ORT_OPTIMIZED_MODEL_DIR", ""),
+        cpu_budget_cores=int(os.environ.get("CPU_BUDGET_CORES", "0")),
+        cpu_threads_per_call=int(os.environ.get("CPU_THREADS_PER_CALL", "0")),
+        cpu_pin_workers=_env_bool("CPU_PIN_WORKERS", False),
+        model_precision=os.environ.get("MODEL_PRECISION", "fp32").strip().lower(),
+        quantized_model_dir=os.environ.get("QUANTIZED_MODEL_DIR", "models/quantized"),
+        ort_providers=os.environ.get("ORT_PROVIDERS", "cpu"),
+        model_benchmark_runs=int(os.environ.get("MODEL_BENCHMARK_RUNS", "2")),
+        model_preload_on_start=_env_bool("MODEL_PRELOAD_ON_START", True),
+        model_priming=_env_bool("MODEL_PRIMING", True),
+        prime_detection_sizes=os.environ.get("PRIME_DETECTION_SIZES", ""),
+        model_manifest_path=os.environ.get("MODEL_MANIFEST")
+        or os.path.join(os.environ.get("LOCAL_MODEL_DIR", "models"), "manifest.json"),
+        model_manifest_verify=os.environ.get("MODEL_MANIFEST_VERIFY", "size").strip().lower(),
+        model_load_concurrency=int(os.environ.get("MODEL_LOAD_CONCURRENCY", "4")),
+        prefork_workers=int(os.environ.get("PREFORK_WORKERS", "0")),
+        prefork_max_requests=int(os.environ.get("PREFORK_MAX_REQUESTS", "0")),
+        prefork_drain_timeout_s=int(os.environ.get("PREFORK_DRAIN_TIMEOUT_S", "30")),
+        prefork_memory_report_s=int(os.environ.get("PREFORK_MEMORY_REPORT_S", "60")),
+        model_memory_budget_mb=int(os.environ.get("MODEL_MEMORY_BUDGET_MB", "0")),
+        model_idle_timeout_s=int(os.environ.get("MODEL_IDLE_TIMEOUT_S", "0")),
+        result_cache_ttl_hours=float(os.environ.get("RESULT_CACHE_TTL_HOURS", "24")),
     )
@@ -0,0 +1,267 @@
+"""Checkpoints that let an interrupted video swap resume where it stopped.
+
+A request that carries an idempotency key encodes its output as a series of
+H.264 segments of `VIDEO_CHECKPOINT_FRAMES` frames each, under
+`VIDEO_CHECKPOINT_DIR/<hash of the key>/`. Each finished segment is recorded
+in `manifest.json` (replaced atomically), together with the running count of
+completed frames. When the process dies - preemptible hosts restart several
+times a day - a retry with the same key skips the frames the manifest already
+covers, swaps the rest into new segments, and joins everything with ffmpeg's
+concat demuxer, without re-encoding.
+
+The manifest also records a fingerprint of the input file, the swap
+parameters and the output geometry. A retry whose fingerprint differs starts
+over rather than splicing two different jobs together.
+
+Checkpoints are deleted once the output is complete and pruned after
+`VIDEO_CHECKPOINT_TTL_HOURS` if their job is never retried.
+
+A checkpoint is held under an exclusive lock (`<dir>.lock`, across processes)
+from opening to `close` or `discard`. A second request with the same key
+while the first still runs - a client retrying a request that is only slow,
+possibly on another prefork worker - gets CheckpointBusy rather than writing
+over its segments.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import ExitStack
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .cache_dir import remove_quietly
+from .model_manifest import file_lock
+from .observability import get_logger
+from .video_encoder import FfmpegPipeWriter, concat_videos
+
+logger = get_logger("inference.video_checkpoint")
+
+MANIFEST_NAME = "manifest.json"
+
+
+class CheckpointBusy(RuntimeError):
+    """Another run holds the checkpoint of this idempotency key."""
+
+
+def video_fingerprint(input_path: str, parts: Dict[str, Any]) -> str:
+    """Hash of the input file's bytes plus `parts` (JSON-serialisable or arrays)."""
+    digest = hashlib.sha256()
+    with open(input_path, "rb") as file_obj:
+        for chunk in iter(lambda: file_obj.read(1 << 20), b""):
+            digest.update(chunk)
+    for name in sorted(parts):
+        value = parts[name]
+        digest.update(name.encode("utf-8"))
+        if isinstance(value, np.ndarray):
+            digest.update(np.ascontiguousarray(value).tobytes())
+        else:
+            digest.update(json.dumps(value).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def prune_checkpoints(root: str, ttl_seconds: float) -> None:
+    """Remove checkpoints that have not been touched for `ttl_seconds`."""
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - ttl_seconds
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            if not os.path.isdir(path) or os.path.getmtime(path) >= cutoff:
+                continue
+            # A run still holding it is not abandoned, however old.
+            with file_lock(path + ".lock", blocking=False):
+                shutil.rmtree(path, ignore_errors=True)
+                remove_quietly(path + ".lock")
+            logger.info(
+                "video_checkpoint_pruned",
+                extra={"event": "video_checkpoint_pruned", "checkpoint": name},
+            )
+        except (FileNotFoundError, BlockingIOError):
+            continue
+
+
+class VideoCheckpoint:
+    """The committed segments of one idempotency key, locked while open.
+
+    Raises CheckpointBusy if another run has the key open.
+    """
+
+    def __init__(self, root: str, key: str, fingerprint: str):
+        self.path = os.path.join(root, hashlib.sha256(key.encode("utf-8")).hexdigest())
+        self._fingerprint = fingerprint
+        self._segments: List[Dict[str, Any]] = []
+        self._lock = ExitStack()
+        try:
+            self._lock.enter_context(file_lock(self.path + ".lock", blocking=False))
+        except BlockingIOError:
+            raise CheckpointBusy(f"Video {key!r} is already being processed") from None
+        try:
+            self._load()
+        except BaseException:
+            self._lock.close()
+            raise
+
+    def _load(self) -> None:
+        manifest = self._read_manifest()
+        if manifest is not None and manifest.get("fingerprint") == self._fingerprint:
+            self._segments = [
+                segment
+                for segment in manifest.get("segments", [])
+                if os.path.exists(os.path.join(self.path, segment["file"]))
+            ]
+        elif manifest is not None:
+            logger.info(
+                "video_checkpoint_mismatch",
+                extra={"event": "video_checkpoint_mismatch", "checkpoint": self.path},
+            )
+            shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+        # Touch so the pruner sees an active checkpoint.
+        os.utime(self.path)
+
+    @property
+    def completed_frames(self) -> int:
+        return sum(segment["frames"] for segment in self._segments)
+
+    @property
+    def segment_count(self) -> int:
+        return len(self._segments)
+
+    def writer(
+        self,
+        ffmpeg_bin: str,
+        fps: float,
+        frame_size: Tuple[int, int],
+        segment_frames: int,
+    ) -> "SegmentedVideoWriter":
+        return SegmentedVideoWriter(self, ffmpeg_bin, fps, frame_size, segment_frames)
+
+    def commit_segment(self, file_name: str, frames: int) -> None:
+        self._segments.append({"file": file_name, "frames": frames})
+        self._write_manifest()
+
+    def next_segment_name(self) -> str:
+        return f"segment_{len(self._segments):05d}.mp4"
+
+    def finish(self, ffmpeg_bin: str, output_path: str) -> None:
+        """Join every committed segment into `output_path`."""
+        paths = [os.path.join(self.path, segment["file"]) for segment in self._segments]
+        if len(paths) == 1:
+            shutil.copyfile(paths[0], output_path)
+        else:
+            concat_videos(ffmpeg_bin, paths, output_path)
+
+    def discard(self) -> None:
+        """Delete the checkpoint and release its lock."""
+        shutil.rmtree(self.path, ignore_errors=True)
+        remove_quietly(self.path + ".lock")
+        self.close()
+
+    def close(self) -> None:
+        """Release the lock; committed segments stay for a later retry."""
+        self._lock.close()
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.path, MANIFEST_NAME), "r", encoding="utf-8") as file_obj:
+                return json.load(file_obj)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_manifest(self) -> None:
+        manifest = {
+            "fingerprint": self._fingerprint,
+            "segments": self._segments,
+            "completed_frames": self.completed_frames,
+            "updated_at": time.time(),
+        }
+        tmp_path = os.path.join(self.path, MANIFEST_NAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file_obj:
+            json.dump(manifest, file_obj)
+            file_obj.flush()
+            os.fsync(file_obj.fileno())
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST_NAME))
+
+
+class SegmentedVideoWriter:
+    """Writer that encodes into checkpoint segments of a fixed frame count.
+
+    Same surface as the other writers. A segment only reaches the manifest
+    once ffmpeg has finished it, so a crash can lose at most the segment in
+    progress.
+    """
+
+    def __init__(
+        self,
+        checkpoint: VideoCheckpoint,
+        ffmpeg_bin: str,
+        fps: float,
+        frame_size: Tuple[int, int],
+        segment_frames: int,
+    ):
+        self._checkpoint = checkpoint
+        self._ffmpeg_bin = ffmpeg_bin
+        self._fps = fps
+        self._frame_size = frame_size
+        self._segment_frames = max(1, segment_frames)
+        self._current: Optional[FfmpegPipeWriter] = None
+        self._current_name = ""
+        self._current_frames = 0
+
+    def isOpened(self) -> bool:
+        return True
+
+    def write(self, frame: np.ndarray) -> None:
+        if self._current is None:
+            self._current_name = self._checkpoint.next_segment_name()
+            self._current = FfmpegPipeWriter(
+                self._ffmpeg_bin,
+                self._partial_path(),
+                self._fps,
+                self._frame_size,
+            )
+            self._current_frames = 0
+        self._current.write(frame)
+        self._current_frames += 1
+        if self._current_frames >= self._segment_frames:
+            self._commit()
+
+    def release(self) -> None:
+        """Commit the final, possibly short, segment."""
+        if self._current is not None:
+            self._commit()
+
+    def abort(self) -> None:
+        """Drop the segment in progress; committed segments stay."""
+        current, self._current = self._current, None
+        if current is not None:
+            current.abort()
+            if os.path.exists(self._partial_path()):
+                os.remove(self._partial_path())
+
+    def _commit(self) -> None:
+        current, self._current = self._current, None
+        current.release()
+        os.replace(
+            self._partial_path(),
+            os.path.join(self._checkpoint.path, self._current_name),
+        )
+        self._checkpoint.commit_segment(self._current_name, self._current_frames)
+        logger.info(
+            "video_checkpoint_segment",
+            extra={
+                "event": "video_checkpoint_segment",
+                "segment": self._current_name,
+                "frames": self._current_frames,
+                "completed_frames": self._checkpoint.completed_frames,
+            },
+        )
+
+    def _partial_path(self) -> str:
+        # ffmpeg picks the container from the extension, so keep .mp4 last.
+        return os.path.join(self._checkpoint.path, "partial_" + self._current_name)
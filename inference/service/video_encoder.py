@@ -0,0 +1,255 @@
+"""Video output backends for swapped frames.
+
+The preferred backend pipes raw BGR frames straight into an ffmpeg libx264
+process, so encoding overlaps the swap and the finished file is already the
+H.264 MP4 we deliver - no second decode/encode pass after the last frame, and
+one lossy generation instead of two.
+
+Hosts without ffmpeg fall back to `cv2.VideoWriter` with the mp4v codec, whose
+output the caller still transcodes afterwards (see `open_video_writer`).
+
+Both backends expose the `cv2.VideoWriter` surface `swap_video_frames` uses:
+`write(frame)`, `isOpened()` and `release()`.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .observability import get_logger
+
+logger = get_logger("inference.video_encoder")
+
+VIDEO_ENCODER_AUTO = "auto"
+VIDEO_ENCODER_CV2 = "cv2"
+
+
+class FfmpegPipeWriter:
+    """Streams BGR frames into an ffmpeg libx264 subprocess over stdin."""
+
+    def __init__(
+        self,
+        ffmpeg_bin: str,
+        output_path: str,
+        fps: float,
+        frame_size: Tuple[int, int],
+    ):
+        width, height = frame_size
+        self._frame_shape = (height, width, 3)
+        command = [
+            ffmpeg_bin,
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "bgr24",
+            "-s",
+            f"{width}x{height}",
+            "-r",
+            f"{fps:.6f}",
+            "-i",
+            "-",
+            "-an",
+            "-c:v",
+            "libx264",
+            "-pix_fmt",
+            "yuv420p",
+        ]
+        if width % 2 or height % 2:
+            # yuv420p needs even dimensions; pad rather than fail the job.
+            command += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+        command += ["-movflags", "+faststart", output_path]
+
+        # stderr goes to a file, not a pipe: nobody drains it while frames are
+        # being written, and a full pipe would stall ffmpeg and then us.
+        self._stderr = tempfile.TemporaryFile()
+        self._process: Optional[subprocess.Popen] = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=self._stderr,
+        )
+
+    def isOpened(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def write(self, frame: np.ndarray) -> None:
+        if self._process is None:
+            raise RuntimeError("ffmpeg encoder is closed")
+        if frame.shape != self._frame_shape:
+            raise ValueError(
+                f"frame shape {frame.shape} does not match encoder {self._frame_shape}"
+            )
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            self._process.wait()
+            raise RuntimeError(
+                f"ffmpeg encoder exited early: {self._stderr_tail()}"
+            ) from None
+
+    def release(self) -> None:
+        """Flush and wait for ffmpeg. Raises if the encode failed."""
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        return_code = process.wait()
+        tail = self._stderr_tail()
+        self._stderr.close()
+        if return_code != 0:
+            raise RuntimeError(f"ffmpeg encoder failed ({return_code}): {tail}")
+
+    def abort(self) -> None:
+        """Stop ffmpeg without waiting for a finished file."""
+        process, self._process = self._process, None
+        if process is None:
+            return
+        process.kill()
+        process.wait()
+        self._stderr.close()
+
+    def _stderr_tail(self) -> str:
+        try:
+            self._stderr.seek(0)
+            return self._stderr.read().decode("utf-8", "replace")[-500:]
+        except ValueError:
+            return ""
+
+
+def open_video_writer(
+    output_path: str,
+    raw_output_path: str,
+    fps: float,
+    frame_size: Tuple[int, int],
+    encoder: str = VIDEO_ENCODER_AUTO,
+):
+    """Open the best available writer. Returns (writer, needs_transcode).
+
+    The ffmpeg backend writes the finished file to `output_path`. The cv2
+    fallback writes mp4v to `raw_output_path` instead and reports
+    `needs_transcode`: that output still has to be converted into
+    `output_path` once the last frame is in.
+    """
+    ffmpeg_bin = shutil.which("ffmpeg")
+    if encoder != VIDEO_ENCODER_CV2 and ffmpeg_bin:
+        writer = FfmpegPipeWriter(ffmpeg_bin, output_path, fps, frame_size)
+        logger.info(
+            "video_encoder_selected",
+            extra={"event": "video_encoder_selected", "encoder": "ffmpeg_pipe"},
+        )
+        return writer, False
+
+    if encoder != VIDEO_ENCODER_CV2:
+        logger.warning(
+            "ffmpeg_not_found",
+            extra={"event": "ffmpeg_not_found", "fallback": "cv2_mp4v"},
+        )
+    writer = cv2.VideoWriter(
+        raw_output_path,
+        cv2.VideoWriter_fourcc(*"mp4v"),
+        fps,
+        frame_size,
+    )
+    logger.info(
+        "video_encoder_selected",
+        extra={"event": "video_encoder_selected", "encoder": "cv2_mp4v"},
+    )
+    return writer, True
+
+
+def transcode_to_h264_mp4(raw_input_path: str, output_path: str) -> None:
+    """Re-encode the cv2 fallback's mp4v output as H.264, or copy it as-is."""
+    ffmpeg_bin = shutil.which("ffmpeg")
+    if not ffmpeg_bin:
+        shutil.copyfile(raw_input_path, output_path)
+        logger.warning(
+            "ffmpeg_not_found",
+            extra={"event": "ffmpeg_not_found", "fallback": "raw_copy"},
+        )
+        return
+
+    command = [
+        ffmpeg_bin,
+        "-y",
+        "-i",
+        raw_input_path,
+        "-c:v",
+        "libx264",
+        "-pix_fmt",
+        "yuv420p",
+        "-movflags",
+        "+faststart",
+        "-an",
+        output_path,
+    ]
+    completed = subprocess.run(
+        command,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if completed.returncode == 0 and os.path.exists(output_path):
+        return
+
+    logger.warning(
+        "ffmpeg_transcode_failed",
+        extra={
+            "event": "ffmpeg_transcode_failed",
+            "return_code": completed.returncode,
+            "stderr_tail": (completed.stderr or "")[-500:],
+            "fallback": "raw_copy",
+        },
+    )
+    shutil.copyfile(raw_input_path, output_path)
+
+
+def concat_videos(ffmpeg_bin: str, paths: List[str], output_path: str) -> None:
+    """Join encoded segments without re-encoding."""
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as list_file:
+        for path in paths:
+            escaped = path.replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+        list_path = list_file.name
+    try:
+        run_ffmpeg(
+            [
+                ffmpeg_bin,
+                "-y",
+                "-loglevel",
+                "error",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                list_path,
+                "-c",
+                "copy",
+                "-movflags",
+                "+faststart",
+                output_path,
+            ],
+            "concat",
+        )
+    finally:
+        os.remove(list_path)
+
+
+def run_ffmpeg(command: List[str], step: str) -> None:
+    """Run a short ffmpeg command, raising with its stderr tail on failure."""
+    completed = subprocess.run(command, capture_output=True, text=True, check=False)
+    if completed.returncode != 0:
+        raise RuntimeError(
+            f"ffmpeg {step} failed ({completed.returncode}): {(completed.stderr or '')[-500:]}"
+        )
@@ -0,0 +1,356 @@
+"""Swap a whole video file: read it, run the frame pipeline, write the result.
+
+This is the body of `/swap-remote-video` without the HTTP around it, so the
+same code serves a full job, one segment of a sharded job
+(`/swap-video-segment`), and the coordinator's local fallback.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Optional
+
+import cv2
+import numpy as np
+
+from .cpu_budget import get_cpu_budget
+from .face_swap import SWAP_MODEL_INSWAPPER, FaceSwapService
+from .face_tracking import FaceTracker
+from .model_registry import get_model_registry
+from .observability import get_logger, timed_log
+from .settings import get_settings
+from .video_checkpoint import VideoCheckpoint, prune_checkpoints, video_fingerprint
+from .video_encoder import VIDEO_ENCODER_CV2, open_video_writer, transcode_to_h264_mp4
+from .video_process_pool import VIDEO_EXECUTOR_PROCESS, get_process_swap_pool
+from .video_swap import (
+    VideoCancelled,
+    resolve_detect_worker_count,
+    resolve_worker_count,
+    swap_video_frames,
+)
+
+logger = get_logger("inference.video_job")
+
+# Called with (processed_frames, total_frames); total is None when the
+# container does not report a frame count.
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+
+class VideoInputError(ValueError):
+    """The target video cannot be processed as given (a client error)."""
+
+
+@dataclass(frozen=True)
+class VideoSwapParams:
+    source_embedding: np.ndarray
+    source_gender: Optional[str]
+    restore: bool
+    swap_model: str
+
+
+@dataclass(frozen=True)
+class VideoSwapResult:
+    frame_count: int
+    total_frames: Optional[int]
+
+
+def read_video_info(input_path: str):
+    """(fps, width, height, total_frames) from the container metadata."""
+    cap = cv2.VideoCapture(input_path)
+    try:
+        if not cap.isOpened():
+            raise VideoInputError("Invalid target_video")
+        return _video_info(cap)
+    finally:
+        cap.release()
+
+
+def _video_info(cap):
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0) or None
+    if width <= 0 or height <= 0:
+        raise VideoInputError("Unable to read video dimensions")
+    if not fps or fps <= 0:
+        fps = 25.0
+    return fps, width, height, total_frames
+
+
+def swap_video_file(
+    swap_service: FaceSwapService,
+    input_path: str,
+    output_path: str,
+    params: VideoSwapParams,
+    on_progress: Optional[ProgressCallback] = None,
+    cancel_event: Optional[threading.Event] = None,
+    checkpoint_key: Optional[str] = None,
+) -> VideoSwapResult:
+    """Swap every frame of `input_path` into an H.264 MP4 at `output_path`.
+
+    Raises VideoCancelled if `cancel_event` is set before the last frame.
+    With a `checkpoint_key`, output is checkpointed as it is encoded and a
+    later call with the same key and input resumes after the last
+    checkpoint (see video_checkpoint.py); CheckpointBusy if another call
+    with that key is still running.
+    """
+    settings = get_settings()
+    raw_output_path = ""
+    cap = None
+    writer = None
+    process_session = None
+    checkpoint = None
+    cancelled = False
+    worker_lease = None
+    try:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as raw_output_file:
+            raw_output_path = raw_output_file.name
+
+        with timed_log(logger, "decode_target_video"):
+            cap = cv2.VideoCapture(input_path)
+        if not cap.isOpened():
+            raise VideoInputError("Invalid target_video")
+        fps, width, height, total_frames = _video_info(cap)
+
+        ffmpeg_bin = shutil.which("ffmpeg")
+        if checkpoint_key and _checkpointing_enabled(settings, ffmpeg_bin):
+            checkpoint = _open_checkpoint(checkpoint_key, input_path, params, fps, (width, height))
+
+        if checkpoint is not None:
+            writer = checkpoint.writer(
+                ffmpeg_bin, fps, (width, height), settings.video_checkpoint_frames
+            )
+            needs_transcode = False
+        else:
+            # Prefer piping frames into ffmpeg, which writes the final H.264
+            # file while the swap runs. The cv2 fallback writes mp4v to a raw
+            # file that is transcoded once the swap has finished.
+            writer, needs_transcode = open_video_writer(
+                output_path,
+                raw_output_path,
+                fps,
+                (width, height),
+                encoder=settings.video_encoder,
+            )
+        if not writer.isOpened():
+            raise RuntimeError("Failed to initialize video writer")
+
+        resumed_frames = checkpoint.completed_frames if checkpoint is not None else 0
+        if resumed_frames:
+            with timed_log(logger, "skip_checkpointed_frames", frame_count=resumed_frames):
+                for _ in range(resumed_frames):
+                    if not cap.grab():
+                        break
+
+        report_every = 30
+        if total_frames:
+            report_every = max(1, int(total_frames * 0.02))
+        if on_progress:
+            on_progress(resumed_frames, total_frames)
+
+        def swap_one(frame, faces=None):
+            return swap_service.swap_frame_with_embedding(
+                frame,
+                params.source_embedding,
+                enable_restore=params.restore,
+                source_gender=params.source_gender,
+                swap_model=params.swap_model,
+                faces=faces,
+            )
+
+        def swap_many(frames, faces_per_frame):
+            return swap_service.swap_frames_with_embedding(
+                frames,
+                params.source_embedding,
+                enable_restore=params.restore,
+                source_gender=params.source_gender,
+                swap_model=params.swap_model,
+                faces_per_frame=faces_per_frame,
+            )
+
+        # Workers come out of the shared CPU budget: a job that starts while
+        # others hold the video slots runs with fewer (see cpu_budget.py).
+        cpu_budget = get_cpu_budget()
+        requested_workers = resolve_worker_count(settings.video_worker_count)
+        if cpu_budget.bounded:
+            requested_workers = min(requested_workers, cpu_budget.video_slots)
+        worker_lease = cpu_budget.lease_video_workers(requested_workers)
+        worker_count = worker_lease.workers
+
+        # Tracking mode: full detection on keyframes only, faces carried
+        # between them by optical flow. Off at the default interval of 1.
+        # The tracker carries state from frame to frame, so it runs as a
+        # single in-order detect worker; plain detection fans out.
+        # Analysis runs the swap profile: the gender filter decides which
+        # faces get landmarks, so it needs the job's source gender.
+        detect_faces = partial(swap_service.detect_faces, source_gender=params.source_gender)
+        tracker = None
+        if settings.video_detect_interval > 1:
+            tracker = FaceTracker(
+                detect_faces,
+                keyframe_interval=settings.video_detect_interval,
+                scene_cut_threshold=settings.video_scene_cut_threshold,
+            )
+            analyze_frame = tracker.track
+            detect_worker_count = 1
+        else:
+            analyze_frame = detect_faces
+            detect_worker_count = resolve_detect_worker_count(
+                settings.video_detect_worker_count, worker_count
+            )
+
+        # Process executor: swap workers become proxies into the shared
+        # worker processes, which hold their own copies of the models.
+        use_processes = settings.video_executor == VIDEO_EXECUTOR_PROCESS
+        swap_frame, swap_batch = swap_one, swap_many
+        if use_processes:
+            # The pool is sized for an uncontended job so that narrower leases
+            # never restart it; the lease caps how many of its workers this
+            # job keeps busy.
+            process_session = get_process_swap_pool(requested_workers).session(
+                (height, width, 3),
+                slot_count=worker_count * max(1, settings.video_batch_size),
+                swap_params={
+                    "source_embedding": params.source_embedding,
+                    "enable_restore": params.restore,
+                    "source_gender": params.source_gender,
+                    "swap_model": params.swap_model,
+                },
+            )
+            swap_frame, swap_batch = process_session.swap_frame, process_session.swap_batch
+
+        # Every frame is the same size, so the detector only needs
+        # configuring once - do it before the workers start rather than
+        # from inside them. Swap models are only needed here when the
+        # swap runs in this process.
+        with timed_log(logger, "warmup_video_models"):
+            get_model_registry().warmup_for_frames(
+                (height, width),
+                restore=params.restore and not use_processes,
+                hyperswap=params.swap_model != SWAP_MODEL_INSWAPPER and not use_processes,
+            )
+
+        with timed_log(
+            logger,
+            "swap_remote_video_inference",
+            restore_enabled=params.restore,
+            worker_count=worker_count,
+            detect_worker_count=detect_worker_count,
+            batch_size=settings.video_batch_size,
+            executor=settings.video_executor,
+            cpu_total=os.cpu_count() or 1,
+        ):
+            frame_count = swap_video_frames(
+                cap,
+                writer,
+                swap_frame,
+                worker_count=worker_count,
+                on_progress=(
+                    (lambda done: on_progress(resumed_frames + done, total_frames))
+                    if on_progress
+                    else None
+                ),
+                progress_every=report_every,
+                analyze_frame=analyze_frame,
+                swap_batch=swap_batch,
+                batch_size=settings.video_batch_size,
+                analyze_workers=detect_worker_count,
+                queue_max_bytes=settings.video_queue_max_mb * 1024 * 1024,
+                cancel_event=cancel_event,
+            )
+        if tracker is not None:
+            logger.info(
+                "video_tracking",
+                extra={
+                    "event": "video_tracking",
+                    "detect_interval": settings.video_detect_interval,
+                    **tracker.stats,
+                },
+            )
+
+        frame_count += resumed_frames
+        if frame_count == 0:
+            raise VideoInputError("Video has no readable frames")
+
+        with timed_log(logger, "finish_output_video", frame_count=frame_count):
+            writer.release()
+            writer = None
+            if checkpoint is not None:
+                checkpoint.finish(ffmpeg_bin, output_path)
+                checkpoint.discard()
+                checkpoint = None
+
+        if needs_transcode:
+            with timed_log(logger, "transcode_output_video", frame_count=frame_count):
+                transcode_to_h264_mp4(raw_output_path, output_path)
+
+        return VideoSwapResult(frame_count=frame_count, total_frames=total_frames)
+    except VideoCancelled:
+        cancelled = True
+        raise
+    finally:
+        if cap is not None:
+            cap.release()
+        if process_session is not None:
+            process_session.close()
+        if worker_lease is not None:
+            worker_lease.release()
+        if writer is not None:
+            # On failure there is no file worth finishing. A checkpointed
+            # writer keeps the segments it has already committed.
+            getattr(writer, "abort", writer.release)()
+        if checkpoint is not None:
+            if cancelled:
+                # Nobody resumes a cancelled job.
+                checkpoint.discard()
+            else:
+                checkpoint.close()
+        if raw_output_path and os.path.exists(raw_output_path):
+            os.remove(raw_output_path)
+
+
+def _checkpointing_enabled(settings, ffmpeg_bin: Optional[str]) -> bool:
+    # Segments are encoded by, and joined with, ffmpeg.
+    return (
+        settings.video_checkpoint_frames > 0
+        and ffmpeg_bin is not None
+        and settings.video_encoder != VIDEO_ENCODER_CV2
+    )
+
+
+def _open_checkpoint(
+    key: str,
+    input_path: str,
+    params: VideoSwapParams,
+    fps: float,
+    frame_size,
+) -> VideoCheckpoint:
+    settings = get_settings()
+    prune_checkpoints(
+        settings.video_checkpoint_dir, settings.video_checkpoint_ttl_hours * 3600
+    )
+    with timed_log(logger, "fingerprint_target_video"):
+        fingerprint = video_fingerprint(
+            input_path,
+            {
+                "embedding": params.source_embedding,
+                "source_gender": params.source_gender,
+                "restore": params.restore,
+                "swap_model": params.swap_model,
+                "fps": fps,
+                "frame_size": list(frame_size),
+            },
+        )
+    checkpoint = VideoCheckpoint(settings.video_checkpoint_dir, key, fingerprint)
+    logger.info(
+        "video_checkpoint_opened",
+        extra={
+            "event": "video_checkpoint_opened",
+            "resumed_frames": checkpoint.completed_frames,
+            "segment_count": checkpoint.segment_count,
+        },
+    )
+    return checkpoint
@@ -0,0 +1,418 @@
+"""Asynchronous video jobs: submit, poll, cancel.
+
+`/swap-remote-video` holds its HTTP request open for the whole decode, swap,
+encode and upload cycle. `/jobs/video` instead spools the inputs to disk,
+records a job, and returns its id straight away; a bounded executor runs the
+job in the background and `GET /jobs/{id}` reports on it.
+
+Jobs are kept in SQLite next to their spooled inputs (`VIDEO_JOB_DIR`), so
+status survives a restart. A job is only recorded once its inputs are fully
+spooled, so one that was queued or running when the process died is queued
+again on startup; its video output is checkpointed under the job id, so a
+job that was mid-way resumes rather than starting over. Jobs whose inputs
+have gone missing are marked failed.
+
+Cancelling a queued job drops it before it starts. Cancelling a running one
+sets its cancel event; the frame pipeline checks it before every frame, and
+the upload once more before it starts, and unwinds exactly as it does on an
+error. Until then the job shows `cancel_pending`.
+
+Under the prefork server (serve.py) several worker processes share one job
+directory and store. Each job records the worker slot that accepted it as its
+owner, and a worker restarting in that slot recovers only its own jobs; slot
+0 also adopts those of slots that no longer exist (after `PREFORK_WORKERS`
+was lowered). Any worker can answer for any job; a cancel that reaches a worker other than the
+owner is left in the store, where the owner picks it up at its next progress
+report. A worker that stops - recycled, or on SIGTERM - first `drain`s: it
+takes no new jobs, leaves its queued ones queued for the slot's next worker,
+and waits a bounded time for running ones to finish.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Collection, Dict, List, Optional
+
+from .observability import get_logger
+from .video_swap import VideoCancelled
+
+logger = get_logger("inference.video_jobs")
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+TERMINAL_STATES = {JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED}
+
+# Runs one job: (job_id, spec, job_dir, on_progress, cancel_event) -> result.
+# `on_progress` takes (processed_frames, total_frames).
+JobRunner = Callable[
+    [str, Dict[str, Any], str, Callable[[int, Optional[int]], None], threading.Event],
+    Dict[str, Any],
+]
+
+
+# A job directory with no record is assumed to be mid-spool until it is this
+# old.
+ORPHAN_SPOOL_AGE_S = 3600
+# Retry-After for a full queue: about as long as a short job runs.
+QUEUE_FULL_RETRY_AFTER_S = 30
+
+
+class JobQueueFull(Exception):
+    """Raised by `submit` when the executor already has its queue limit."""
+
+    def __init__(self, retry_after: int = QUEUE_FULL_RETRY_AFTER_S):
+        super().__init__("Too many video jobs queued")
+        self.retry_after = retry_after
+
+
+class JobStore:
+    """SQLite-backed job records. Safe to share across threads."""
+
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS video_jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    spec TEXT NOT NULL,
+                    processed_frames INTEGER NOT NULL DEFAULT 0,
+                    total_frames INTEGER,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    owner TEXT NOT NULL DEFAULT '',
+                    cancel_requested INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(video_jobs)")}
+            # Stores created before jobs had owners.
+            if "owner" not in columns:
+                self._conn.execute(
+                    "ALTER TABLE video_jobs ADD COLUMN owner TEXT NOT NULL DEFAULT ''"
+                )
+            if "cancel_requested" not in columns:
+                self._conn.execute(
+                    "ALTER TABLE video_jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0"
+                )
+
+    def create(self, job_id: str, spec: Dict[str, Any], owner: str = "") -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO video_jobs (id, status, spec, created_at, updated_at, owner)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, json.dumps(spec), now, now, owner),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM video_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["spec"] = json.loads(job["spec"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE video_jobs SET {columns} WHERE id = ?",
+                (*fields.values(), job_id),
+            )
+
+    def transition(self, job_id: str, from_status: str, to_status: str, **fields: Any) -> bool:
+        """Move a job between states only if it is still in `from_status`."""
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in ["status", *fields])
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"UPDATE video_jobs SET {columns} WHERE id = ? AND status = ?",
+                (to_status, *fields.values(), job_id, from_status),
+            )
+        return cursor.rowcount == 1
+
+    def cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT cancel_requested FROM video_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def adopt(self, owner: str, live_owners: Collection[str]) -> int:
+        """Give `owner` every queued or running job whose owner is not live."""
+        placeholders = ", ".join("?" for _ in live_owners)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE video_jobs SET owner = ?, updated_at = ?"
+                f" WHERE status IN (?, ?) AND owner NOT IN ({placeholders})",
+                (owner, time.time(), JOB_QUEUED, JOB_RUNNING, *live_owners),
+            )
+        return cursor.rowcount
+
+    def unfinished(self, owner: str = "") -> List[Dict[str, Any]]:
+        """Every queued or running job of `owner`, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, status, spec FROM video_jobs WHERE status IN (?, ?) AND owner = ?"
+                " ORDER BY created_at",
+                (JOB_QUEUED, JOB_RUNNING, owner),
+            ).fetchall()
+        return [
+            {"id": row["id"], "status": row["status"], "spec": json.loads(row["spec"])}
+            for row in rows
+        ]
+
+
+class VideoJobManager:
+    """Bounded background executor for video jobs.
+
+    With `live_owners` - every owner that still has a process, this one
+    included - the manager also recovers the unfinished jobs of any other
+    owner. Exactly one manager of a deployment should be given it.
+    """
+
+    def __init__(
+        self,
+        job_dir: str,
+        runner: JobRunner,
+        max_workers: int,
+        max_queued: int,
+        owner: str = "",
+        live_owners: Optional[Collection[str]] = None,
+    ):
+        os.makedirs(job_dir, exist_ok=True)
+        self._job_dir = job_dir
+        self._owner = owner
+        self._runner = runner
+        self._max_pending = max(1, max_workers) + max(0, max_queued)
+        self._store = JobStore(os.path.join(job_dir, "jobs.sqlite3"))
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, max_workers), thread_name_prefix="video-job"
+        )
+        self._lock = threading.Lock()
+        self._futures: Dict[str, Future] = {}
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self._draining = False
+
+        # Nothing of ours is running yet. Our jobs interrupted by the last
+        # shutdown run again if their inputs survived; any other directory of
+        # ours belongs to a job that will never run again.
+        adopted = 0
+        if live_owners is not None:
+            adopted = self._store.adopt(owner, live_owners)
+        requeued = []
+        failed = 0
+        for job in self._store.unfinished(owner):
+            if os.path.isdir(self.job_path(job["id"])):
+                self._store.transition(job["id"], job["status"], JOB_QUEUED)
+                requeued.append(job)
+            else:
+                self._store.transition(
+                    job["id"], job["status"], JOB_FAILED,
+                    error="Interrupted by a service restart",
+                )
+                failed += 1
+        keep = {job["id"] for job in requeued}
+        for name in os.listdir(job_dir):
+            path = os.path.join(job_dir, name)
+            if not os.path.isdir(path) or name in keep:
+                continue
+            job = self._store.get(name)
+            if job is None:
+                # Inputs still being spooled, possibly by another worker, or
+                # left behind by a crash mid-spool.
+                if time.time() - os.path.getmtime(path) < ORPHAN_SPOOL_AGE_S:
+                    continue
+            elif job["owner"] != owner and (
+                live_owners is None or job["owner"] in live_owners
+            ):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+        for job in requeued:
+            self._enqueue(job["id"], job["spec"])
+        if requeued or failed:
+            logger.warning(
+                "video_jobs_interrupted",
+                extra={
+                    "event": "video_jobs_interrupted",
+                    "requeued": len(requeued),
+                    "failed": failed,
+                    "adopted": adopted,
+                },
+            )
+
+    def job_path(self, job_id: str) -> str:
+        """Directory for a job's spooled inputs. Removed when the job ends."""
+        return os.path.join(self._job_dir, job_id)
+
+    def new_job_id(self) -> str:
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.job_path(job_id))
+        return job_id
+
+    def submit(self, job_id: str, spec: Dict[str, Any]) -> None:
+        """Queue a job whose inputs are already in `job_path(job_id)`."""
+        with self._lock:
+            if self._draining:
+                # Stopping; another worker, or this slot's next one, takes it.
+                raise JobQueueFull(retry_after=1)
+            if len(self._futures) >= self._max_pending:
+                raise JobQueueFull()
+            self._store.create(job_id, spec, self._owner)
+        self._enqueue(job_id, spec)
+
+    def _enqueue(self, job_id: str, spec: Dict[str, Any]) -> None:
+        with self._lock:
+            cancel_event = threading.Event()
+            self._cancel_events[job_id] = cancel_event
+            self._futures[job_id] = self._executor.submit(self._run, job_id, spec, cancel_event)
+        logger.info(
+            "video_job_queued",
+            extra={"event": "video_job_queued", "job_id": job_id, "pending": len(self._futures)},
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._store.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued or running job. Returns the job, or None if unknown."""
+        with self._lock:
+            future = self._futures.get(job_id)
+            cancel_event = self._cancel_events.get(job_id)
+        if cancel_event is not None:
+            cancel_event.set()
+        if future is not None and future.cancel():
+            # Never started: nothing will run its cleanup, so do it here.
+            self._store.transition(job_id, JOB_QUEUED, JOB_CANCELLED)
+            self._finish(job_id)
+        elif future is not None:
+            # Running here; recorded so that every worker reports it pending.
+            self._store.update(job_id, cancel_requested=1)
+        else:
+            # Another worker process owns it. A queued job is cancelled in
+            # the store, so its owner skips it; a running one is flagged for
+            # the owner's next progress report.
+            if not self._store.transition(job_id, JOB_QUEUED, JOB_CANCELLED):
+                self._store.update(job_id, cancel_requested=1)
+        logger.info("video_job_cancel", extra={"event": "video_job_cancel", "job_id": job_id})
+        return self._store.get(job_id)
+
+    def drain(self, timeout_s: float) -> None:
+        """Stop taking jobs and wait up to `timeout_s` for running ones.
+
+        Jobs that have not started are dropped from the executor but stay
+        queued in the store, with their inputs, for this owner's next start.
+        A job still running at the deadline is cut off there and resumes
+        from its last checkpoint on that start.
+        """
+        with self._lock:
+            self._draining = True
+            futures = list(self._futures.values())
+        for future in futures:
+            future.cancel()
+        running = [future for future in futures if not future.cancelled()]
+        _, unfinished = wait(running, timeout=max(0.0, timeout_s))
+        self._executor.shutdown(wait=False)
+        logger.info(
+            "video_jobs_drained",
+            extra={
+                "event": "video_jobs_drained",
+                "left_queued": len(futures) - len(running),
+                "finished": len(running) - len(unfinished),
+                "interrupted": len(unfinished),
+            },
+        )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"pending": len(self._futures), "max_pending": self._max_pending}
+
+    def _run(self, job_id: str, spec: Dict[str, Any], cancel_event: threading.Event) -> None:
+        try:
+            if not self._store.transition(job_id, JOB_QUEUED, JOB_RUNNING):
+                return
+
+            def on_progress(processed: int, total: Optional[int]) -> None:
+                self._store.update(job_id, processed_frames=processed, total_frames=total)
+                if self._store.cancel_requested(job_id):
+                    cancel_event.set()
+
+            try:
+                result = self._runner(job_id, spec, self.job_path(job_id), on_progress, cancel_event)
+            except VideoCancelled:
+                self._store.transition(job_id, JOB_RUNNING, JOB_CANCELLED)
+                logger.info(
+                    "video_job_cancelled",
+                    extra={"event": "video_job_cancelled", "job_id": job_id},
+                )
+                return
+            except Exception as exc:
+                self._store.transition(job_id, JOB_RUNNING, JOB_FAILED, error=str(exc))
+                logger.exception(
+                    "video_job_failed",
+                    extra={"event": "video_job_failed", "job_id": job_id, "error": str(exc)},
+                )
+                return
+            self._store.transition(
+                job_id,
+                JOB_RUNNING,
+                JOB_COMPLETED,
+                result=json.dumps(result),
+                processed_frames=result.get("processed_frames", 0),
+            )
+            logger.info(
+                "video_job_completed",
+                extra={"event": "video_job_completed", "job_id": job_id},
+            )
+        finally:
+            self._finish(job_id)
+
+    def _finish(self, job_id: str) -> None:
+        with self._lock:
+            self._futures.pop(job_id, None)
+            self._cancel_events.pop(job_id, None)
+        shutil.rmtree(self.job_path(job_id), ignore_errors=True)
+
+
+def job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """The public shape of a job for `GET /jobs/{id}`."""
+    total = job["total_frames"]
+    processed = job["processed_frames"]
+    progress_percent = None
+    if job["status"] == JOB_COMPLETED:
+        progress_percent = 100
+    elif total:
+        progress_percent = min(100, round(processed / total * 100))
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "processed_frames": processed,
+        "total_frames": total,
+        "progress_percent": progress_percent,
+        "result": job["result"],
+        "error": job["error"],
+        # Cancelled, but still running until it next checks.
+        "cancel_pending": bool(job["cancel_requested"]) and job["status"] not in TERMINAL_STATES,
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
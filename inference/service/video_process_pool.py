@@ -0,0 +1,336 @@
+"""Process-based swap workers for video jobs (`VIDEO_EXECUTOR=process`).
+
+The thread pool in video_swap.py tops out around 1.8x, partly because the
+mask, colour-match and paste-back code between model calls holds the GIL.
+This pool runs the swap stage in separate processes instead. It only
+replaces the swap workers: decode, detection and encode stay in the API
+process, and the pipeline's swap threads become thin proxies that hand
+frames to a process and wait for the result.
+
+Frames never go through pickle. Each job gets one `SharedMemory` block cut
+into fixed-size slots, one frame per slot. A proxy thread copies its frame
+into a free slot, sends the slot number (plus the detected faces and swap
+parameters, which are small) over a queue, and the worker swaps the frame
+in place inside the slot. The proxy copies the result back out and frees the
+slot. insightface `Face` objects do not pickle, so faces travel as plain
+dicts and are rebuilt on the other side.
+
+Workers are started with `spawn`, not `fork`. By the time a video job
+arrives the API process already holds ONNX Runtime sessions and their
+thread pools, which do not survive a fork, so each worker loads its own
+models - once, when the pool starts, not per job. That costs roughly a
+gigabyte of memory per worker; size `VIDEO_WORKER_COUNT` with that in mind.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future
+from itertools import count
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty, Queue
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .cpu_budget import CpuBudget, available_cores, get_cpu_budget, use_cpu_budget
+from .observability import get_logger
+from .settings import get_settings
+
+logger = get_logger("inference.video_process_pool")
+
+VIDEO_EXECUTOR_THREAD = "thread"
+VIDEO_EXECUTOR_PROCESS = "process"
+
+# How often the result thread checks that every worker is still alive.
+_LIVENESS_POLL_SECONDS = 1.0
+
+
+class FrameRing:
+    """A shared-memory block split into equal frame slots."""
+
+    def __init__(self, frame_shape: Tuple[int, ...], slot_count: int):
+        self.frame_shape = tuple(frame_shape)
+        self.slot_bytes = int(np.prod(self.frame_shape))
+        self._shm = SharedMemory(create=True, size=self.slot_bytes * slot_count)
+        self._free: "Queue[int]" = Queue()
+        for slot in range(slot_count):
+            self._free.put(slot)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def acquire(self) -> int:
+        return self._free.get()
+
+    def release(self, slot: int) -> None:
+        self._free.put(slot)
+
+    def view(self, slot: int) -> np.ndarray:
+        return _slot_view(self._shm, slot, self.frame_shape, self.slot_bytes)
+
+    def close(self) -> None:
+        self._shm.close()
+        self._shm.unlink()
+
+
+def _slot_view(shm: SharedMemory, slot: int, shape: Tuple[int, ...], slot_bytes: int) -> np.ndarray:
+    return np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+
+
+class ProcessSwapPool:
+    """Long-lived swap worker processes shared by every video job."""
+
+    def __init__(
+        self,
+        worker_count: int,
+        threads_per_call: int = 1,
+        cpu_sets: Optional[List[List[int]]] = None,
+    ):
+        self.worker_count = worker_count
+        cpu_sets = cpu_sets or [None] * worker_count
+        context = multiprocessing.get_context("spawn")
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._processes = [
+            context.Process(
+                target=_worker_main,
+                args=(self._tasks, self._results, threads_per_call, cpu_sets[i]),
+                name=f"video-swap-{i}",
+                daemon=True,
+            )
+            for i in range(worker_count)
+        ]
+        for process in self._processes:
+            process.start()
+
+        self._pending: Dict[int, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._task_ids = count()
+        self._broken: Optional[str] = None
+        self._closed = threading.Event()
+        self._result_thread = threading.Thread(
+            target=self._collect_results, name="video-swap-results", daemon=True
+        )
+        self._result_thread.start()
+        logger.info(
+            "video_process_pool_started",
+            extra={
+                "event": "video_process_pool_started",
+                "worker_count": worker_count,
+                "threads_per_call": threads_per_call,
+                "pinned": cpu_sets[0] is not None,
+            },
+        )
+
+    @property
+    def healthy(self) -> bool:
+        return self._broken is None and not self._closed.is_set()
+
+    def session(
+        self,
+        frame_shape: Tuple[int, ...],
+        slot_count: int,
+        swap_params: Dict[str, Any],
+    ) -> "ProcessSwapSession":
+        return ProcessSwapSession(self, FrameRing(frame_shape, slot_count), swap_params)
+
+    def submit(self, ring: FrameRing, slots: List[int], analyses: List[Any], swap_params: Dict[str, Any]) -> Future:
+        future: Future = Future()
+        task_id = next(self._task_ids)
+        with self._pending_lock:
+            if self._broken is not None:
+                raise RuntimeError(self._broken)
+            self._pending[task_id] = future
+        self._tasks.put(
+            (task_id, ring.name, ring.frame_shape, ring.slot_bytes, slots, analyses, swap_params)
+        )
+        return future
+
+    def close(self) -> None:
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.kill()
+        self._fail_pending("video swap pool closed")
+
+    def _collect_results(self) -> None:
+        while not self._closed.is_set():
+            try:
+                task_id, error = self._results.get(timeout=_LIVENESS_POLL_SECONDS)
+            except Empty:
+                dead = [p.name for p in self._processes if not p.is_alive()]
+                if dead:
+                    self._fail_pending(f"video swap worker exited: {', '.join(dead)}")
+                    return
+                continue
+            with self._pending_lock:
+                future = self._pending.pop(task_id, None)
+            if future is None:
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(RuntimeError(error))
+
+    def _fail_pending(self, reason: str) -> None:
+        with self._pending_lock:
+            if self._broken is None:
+                self._broken = reason
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(RuntimeError(reason))
+        if self._closed.is_set() and not pending:
+            return
+        logger.warning(
+            "video_process_pool_failed",
+            extra={"event": "video_process_pool_failed", "reason": reason},
+        )
+
+
+class ProcessSwapSession:
+    """One job's view of the pool: its frame ring and swap parameters.
+
+    `swap_frame` and `swap_batch` have the signatures `swap_video_frames`
+    expects and may be called from several threads at once.
+    """
+
+    def __init__(self, pool: ProcessSwapPool, ring: FrameRing, swap_params: Dict[str, Any]):
+        self._pool = pool
+        self._ring = ring
+        self._swap_params = swap_params
+
+    def swap_frame(self, frame: np.ndarray, analysis: Any = None) -> np.ndarray:
+        return self.swap_batch([frame], [analysis])[0]
+
+    def swap_batch(self, frames: List[np.ndarray], analyses: List[Any]) -> List[np.ndarray]:
+        slots = [self._ring.acquire() for _ in frames]
+        try:
+            for slot, frame in zip(slots, frames):
+                self._ring.view(slot)[...] = frame
+            faces = [_faces_to_wire(analysis) for analysis in analyses]
+            self._pool.submit(self._ring, slots, faces, self._swap_params).result()
+            # Copy back into the caller's arrays so the slots can be reused
+            # while the frames wait in the encode queue.
+            for slot, frame in zip(slots, frames):
+                frame[...] = self._ring.view(slot)
+        finally:
+            for slot in slots:
+                self._ring.release(slot)
+        return frames
+
+    def close(self) -> None:
+        self._ring.close()
+
+    def __enter__(self) -> "ProcessSwapSession":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+_pool: Optional[ProcessSwapPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_process_swap_pool(worker_count: int) -> ProcessSwapPool:
+    """The shared pool, (re)started if missing, broken or resized."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and (not _pool.healthy or _pool.worker_count != worker_count):
+            _pool.close()
+            _pool = None
+        if _pool is None:
+            budget = get_cpu_budget()
+            cpu_sets = None
+            if get_settings().cpu_pin_workers and hasattr(os, "sched_setaffinity"):
+                cpu_sets = budget.worker_cpu_sets(worker_count)
+            _pool = ProcessSwapPool(worker_count, budget.threads_per_call, cpu_sets)
+        return _pool
+
+
+def shutdown_process_swap_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def _faces_to_wire(faces: Optional[List]) -> Optional[List[dict]]:
+    return None if faces is None else [dict(face) for face in faces]
+
+
+def _faces_from_wire(faces: Optional[List[dict]]) -> Optional[List]:
+    from insightface.app.common import Face
+
+    return None if faces is None else [Face(face) for face in faces]
+
+
+def _attach(name: str) -> SharedMemory:
+    # Attaching registers the block with the resource tracker again, but a
+    # spawned worker shares the API process's tracker, so that is a no-op:
+    # the block is still unlinked exactly once, by the FrameRing that owns it.
+    return SharedMemory(name=name)
+
+
+def _worker_main(tasks, results, threads_per_call: int, cpu_set: Optional[List[int]]) -> None:
+    from .face_swap import SWAP_MODEL_INSWAPPER, FaceSwapService
+    from .model_registry import get_model_registry
+
+    # Before any session exists, so ONNX Runtime's threads inherit the
+    # affinity and every session is sized like the parent's.
+    if cpu_set:
+        os.sched_setaffinity(0, cpu_set)
+    use_cpu_budget(CpuBudget(cpu_set or available_cores(), threads_per_call, image_slots=0))
+    registry = get_model_registry()
+    registry.get_models()
+    service = FaceSwapService(registry)
+    attached: Optional[SharedMemory] = None
+    warmed = set()
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, shm_name, shape, slot_bytes, slots, analyses, params = task
+        try:
+            if attached is None or attached.name != shm_name:
+                if attached is not None:
+                    attached.close()
+                attached = _attach(shm_name)
+            warm_key = (shape, params["enable_restore"], params["swap_model"])
+            if warm_key not in warmed:
+                registry.warmup_for_frames(
+                    shape,
+                    restore=params["enable_restore"],
+                    hyperswap=params["swap_model"] != SWAP_MODEL_INSWAPPER,
+                )
+                warmed.add(warm_key)
+            _swap_in_slots(service, attached, shape, slot_bytes, slots, analyses, params)
+            results.put((task_id, None))
+        except Exception as exc:
+            results.put((task_id, f"{type(exc).__name__}: {exc}"))
+
+    if attached is not None:
+        attached.close()
+
+
+def _swap_in_slots(service, shm, shape, slot_bytes, slots, analyses, params) -> None:
+    # A helper rather than inline in the loop so the slot views are gone by
+    # the time the block is closed; close() refuses while any are alive.
+    frames = [_slot_view(shm, slot, shape, slot_bytes) for slot in slots]
+    faces = [_faces_from_wire(analysis) for analysis in analyses]
+    if len(frames) == 1:
+        swapped = [service.swap_frame_with_embedding(frames[0], faces=faces[0], **params)]
+    else:
+        swapped = service.swap_frames_with_embedding(frames, faces_per_frame=faces, **params)
+    for frame, result in zip(frames, swapped):
+        if result is not frame:
+            frame[...] = result
@@ -0,0 +1,171 @@
+"""Background delivery of video progress callbacks.
+
+Progress used to be posted synchronously from the encode thread, so a slow
+`progress_url` stalled the writer - and through the bounded queues, every
+worker behind it - for up to the request timeout on each report.
+
+`ProgressReporter.report` now only records the latest count and returns. One
+sender thread per job posts it over a pooled, keep-alive HTTP session. Counts
+reported while a post is in flight are coalesced: only the newest is sent
+next, since the API only ever shows the latest value. `close` sends whatever
+is still pending, waiting a bounded time, and logs the reporter's counters.
+The same counters, summed over every job of the process, are in `/health`
+(`progress_stats`).
+"""
+
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .observability import get_logger
+
+logger = get_logger("inference.video_progress")
+
+POST_TIMEOUT_SECONDS = 30.0
+# A post delivered later than this after its count was reported is "delayed".
+DELAYED_AFTER_SECONDS = 5.0
+CLOSE_TIMEOUT_SECONDS = 5.0
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+_STAT_NAMES = ("reported", "sent", "dropped", "delayed", "failed", "unsent")
+_totals = dict.fromkeys(_STAT_NAMES, 0)
+_totals_lock = threading.Lock()
+
+
+def progress_stats() -> Dict[str, int]:
+    """Counters of every reporter this process has run."""
+    with _totals_lock:
+        return dict(_totals)
+
+
+def _count_total(name: str) -> None:
+    with _totals_lock:
+        _totals[name] += 1
+
+
+def _get_session() -> requests.Session:
+    """Process-wide session, so jobs reuse connections to the progress host."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def progress_form(processed_frames: int, total_frames: Optional[int]) -> Dict[str, str]:
+    data = {"processed_frames": str(processed_frames)}
+    if total_frames is not None:
+        data["total_frames"] = str(total_frames)
+    if total_frames and total_frames > 0:
+        data["progress_percent"] = str(min(100, round((processed_frames / total_frames) * 100)))
+    return data
+
+
+class ProgressReporter:
+    """Coalescing, non-blocking progress sender for one video job."""
+
+    def __init__(self, progress_url: str, callback_token: Optional[str] = None):
+        self._url = progress_url
+        self._headers = {"x-inference-token": callback_token} if callback_token else {}
+        self._cond = threading.Condition()
+        # (processed, total, reported_at) waiting to be sent.
+        self._pending: Optional[Tuple[int, Optional[int], float]] = None
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._stats = dict.fromkeys(_STAT_NAMES[:-1], 0)
+
+    def report(self, processed_frames: int, total_frames: Optional[int]) -> None:
+        """Queue the latest count. Never blocks on the network."""
+        with self._cond:
+            if self._closed:
+                return
+            self._count("reported")
+            if self._pending is not None:
+                # Superseded before it was sent.
+                self._count("dropped")
+            self._pending = (processed_frames, total_frames, time.monotonic())
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="video-progress", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+
+    def close(self, timeout: float = CLOSE_TIMEOUT_SECONDS) -> None:
+        """Send the last pending count, waiting at most `timeout` seconds."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        unsent = int(thread is not None and thread.is_alive())
+        if unsent:
+            _count_total("unsent")
+        logger.info(
+            "video_progress_stats",
+            extra={"event": "video_progress_stats", "unsent": unsent, **self.stats()},
+        )
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return dict(self._stats)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                processed, total, reported_at = self._pending
+                self._pending = None
+            sent = self._post(processed, total)
+            with self._cond:
+                if sent:
+                    self._count("sent")
+                    if time.monotonic() - reported_at > DELAYED_AFTER_SECONDS:
+                        self._count("delayed")
+                else:
+                    self._count("failed")
+
+    def _count(self, name: str) -> None:
+        # Called with the condition held.
+        self._stats[name] += 1
+        _count_total(name)
+
+    def _post(self, processed: int, total: Optional[int]) -> bool:
+        try:
+            response = _get_session().post(
+                self._url,
+                headers=self._headers,
+                data=progress_form(processed, total),
+                timeout=POST_TIMEOUT_SECONDS,
+            )
+        except Exception as exc:
+            logger.warning(
+                "progress_post_error",
+                extra={"event": "progress_post_error", "error": str(exc)},
+            )
+            return False
+        with response:
+            if response.status_code >= 400:
+                logger.warning(
+                    "progress_post_failed",
+                    extra={
+                        "event": "progress_post_failed",
+                        "status_code": response.status_code,
+                        "response_tail": (response.text or "")[-500:],
+                    },
+                )
+                return False
+        return True
@@ -0,0 +1,232 @@
+"""Segment-sharded video swaps across several inference nodes.
+
+A long video otherwise runs start to finish in one process, so wall time
+grows with clip length. When `VIDEO_SHARD_WORKERS` lists other inference
+nodes, the coordinator instead:
+
+1. splits the input with ffmpeg's segment muxer (`-c copy`), which only cuts
+   on keyframes, so every segment is a run of whole GOPs that decodes on its
+   own;
+2. sends each segment to a worker's `/swap-video-segment`, one segment per
+   worker at a time, and gets back an encoded H.264 segment;
+3. joins the results with ffmpeg's concat demuxer, again `-c copy`.
+
+Every node encodes with the same settings at the same size and frame rate,
+so the segments concatenate without a re-encode. A segment whose worker
+fails is swapped locally instead, so one bad node slows a job down rather
+than failing it.
+
+Workers are plain HTTP base URLs (`http://127.0.0.1:7861`), so several
+processes on one machine on different ports make a working cluster. The
+coordinator must not list itself: it is busy running the job.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from typing import List, Optional
+
+import requests
+
+from .face_swap import FaceSwapService
+from .observability import get_logger, timed_log
+from .video_encoder import concat_videos, run_ffmpeg
+from .video_job import (
+    ProgressCallback,
+    VideoSwapParams,
+    VideoSwapResult,
+    read_video_info,
+    swap_video_file,
+)
+from .video_swap import VideoCancelled
+
+logger = get_logger("inference.video_shards")
+
+SEGMENT_ENDPOINT = "/swap-video-segment"
+PROCESSED_FRAMES_HEADER = "x-processed-frames"
+
+
+def parse_shard_workers(value: str) -> List[str]:
+    """Comma-separated base URLs, trailing slashes dropped."""
+    return [url.strip().rstrip("/") for url in value.split(",") if url.strip()]
+
+
+def split_video(ffmpeg_bin: str, input_path: str, out_dir: str, segment_seconds: float) -> List[str]:
+    """Cut the video stream into keyframe-aligned segments, in order."""
+    pattern = os.path.join(out_dir, "segment_%05d.mp4")
+    run_ffmpeg(
+        [
+            ffmpeg_bin,
+            "-y",
+            "-loglevel",
+            "error",
+            "-i",
+            input_path,
+            "-map",
+            "0:v:0",
+            "-an",
+            "-c",
+            "copy",
+            "-f",
+            "segment",
+            "-segment_time",
+            f"{segment_seconds:g}",
+            "-reset_timestamps",
+            "1",
+            pattern,
+        ],
+        "split",
+    )
+    return sorted(
+        os.path.join(out_dir, name)
+        for name in os.listdir(out_dir)
+        if name.startswith("segment_")
+    )
+
+
+def post_segment(
+    worker_url: str,
+    segment_path: str,
+    output_path: str,
+    model_bytes: bytes,
+    params: VideoSwapParams,
+    timeout: float,
+) -> int:
+    """Swap one segment on a remote worker. Returns its frame count."""
+    data = {
+        "enable_restore": "1" if params.restore else "0",
+        "swap_model": params.swap_model,
+    }
+    if params.source_gender:
+        data["manual_gender"] = params.source_gender
+    with open(segment_path, "rb") as segment_file:
+        response = requests.post(
+            worker_url + SEGMENT_ENDPOINT,
+            data=data,
+            files={
+                "model_file": ("model.safetensors", model_bytes, "application/octet-stream"),
+                "target_video": (os.path.basename(segment_path), segment_file, "video/mp4"),
+            },
+            timeout=timeout,
+            stream=True,
+        )
+    with response:
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f"{worker_url} returned {response.status_code}: {(response.text or '')[-500:]}"
+            )
+        with open(output_path, "wb") as output_file:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                output_file.write(chunk)
+        return int(response.headers.get(PROCESSED_FRAMES_HEADER, "0"))
+
+
+def swap_video_sharded(
+    swap_service: FaceSwapService,
+    input_path: str,
+    output_path: str,
+    params: VideoSwapParams,
+    model_bytes: bytes,
+    workers: List[str],
+    segment_seconds: float,
+    request_timeout: float,
+    on_progress: Optional[ProgressCallback] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> VideoSwapResult:
+    """Swap `input_path` across `workers`, falling back to a local run.
+
+    Runs locally when ffmpeg is missing or the clip fits in one segment.
+    Progress is reported per finished segment. Cancelling stops segments
+    from being sent; ones already on a worker run to completion there.
+    """
+    ffmpeg_bin = shutil.which("ffmpeg")
+    if not ffmpeg_bin:
+        logger.warning(
+            "video_shard_unavailable",
+            extra={"event": "video_shard_unavailable", "reason": "ffmpeg_not_found"},
+        )
+        return swap_video_file(
+            swap_service, input_path, output_path, params, on_progress, cancel_event
+        )
+
+    _, _, _, total_frames = read_video_info(input_path)
+    work_dir = tempfile.mkdtemp(prefix="video_shards_")
+    try:
+        split_dir = os.path.join(work_dir, "in")
+        os.mkdir(split_dir)
+        with timed_log(logger, "split_target_video", segment_seconds=segment_seconds):
+            segments = split_video(ffmpeg_bin, input_path, split_dir, segment_seconds)
+        if len(segments) <= 1:
+            return swap_video_file(
+                swap_service, input_path, output_path, params, on_progress, cancel_event
+            )
+
+        outputs = [os.path.join(work_dir, f"out_{i:05d}.mp4") for i in range(len(segments))]
+        frame_counts = [0] * len(segments)
+        progress_lock = threading.Lock()
+        # Local fallbacks run one at a time: each already uses the whole
+        # local worker pool.
+        local_lock = threading.Lock()
+        idle_workers: "Queue[str]" = Queue()
+        for url in workers:
+            idle_workers.put(url)
+
+        if on_progress:
+            on_progress(0, total_frames)
+
+        def swap_segment(index: int) -> None:
+            worker_url = idle_workers.get()
+            if cancel_event is not None and cancel_event.is_set():
+                idle_workers.put(worker_url)
+                raise VideoCancelled()
+            try:
+                with timed_log(logger, "video_shard_remote", segment=index, worker=worker_url):
+                    frames = post_segment(
+                        worker_url,
+                        segments[index],
+                        outputs[index],
+                        model_bytes,
+                        params,
+                        request_timeout,
+                    )
+            except Exception as exc:
+                logger.warning(
+                    "video_shard_fallback",
+                    extra={
+                        "event": "video_shard_fallback",
+                        "segment": index,
+                        "worker": worker_url,
+                        "error": str(exc),
+                    },
+                )
+                with local_lock, timed_log(logger, "video_shard_local", segment=index):
+                    frames = swap_video_file(
+                        swap_service, segments[index], outputs[index], params,
+                        cancel_event=cancel_event,
+                    ).frame_count
+            finally:
+                idle_workers.put(worker_url)
+            with progress_lock:
+                frame_counts[index] = frames
+                done = sum(frame_counts)
+            if on_progress:
+                on_progress(done, total_frames)
+
+        with timed_log(
+            logger,
+            "video_shard_swap",
+            segment_count=len(segments),
+            worker_count=len(workers),
+        ):
+            with ThreadPoolExecutor(max_workers=len(workers)) as pool:
+                # list() re-raises the first segment that failed even locally.
+                list(pool.map(swap_segment, range(len(segments))))
+
+        with timed_log(logger, "concat_output_video", segment_count=len(segments)):
+            concat_videos(ffmpeg_bin, outputs, output_path)
+        return VideoSwapResult(frame_count=sum(frame_counts), total_frames=total_frames)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -1,22 +1,44 @@
-"""Frame-parallel driver for video swaps.
+"""Staged, frame-parallel driver for video swaps.
 
-Swapping a frame is dominated by ONNX Runtime and OpenCV calls, both of which
-release the GIL, so worker *threads* genuinely run in parallel here. Threads
-also let every worker share one copy of the models - processes would need their
-own, and the model set is roughly a gigabyte.
+A video job runs as four stages joined by byte-bounded queues:
 
-Decoding and encoding stay on the calling thread: neither `cv2.VideoCapture`
-nor `cv2.VideoWriter` is thread-safe, and sequential decode is cheap next to a
-swap. Only the swap itself fans out.
+    decode -> detect -> swap -> encode
 
-Output order is preserved. Futures are held in a FIFO queue and written in
-submission order, so a frame that finishes early waits its turn.
+* decode - one thread reading `cv2.VideoCapture`, which is not thread-safe.
+* detect - a pool running the per-frame analysis (`analyze_frame`). A stateful
+  face tracker must see frames in order, so it gets a single worker; plain
+  detection fans out.
+* swap   - a pool running the swap itself.
+* encode - one thread writing, in decode order, to the writer, which is not
+  thread-safe either.
+
+Giving decode and encode their own threads means a slow head-of-line frame no
+longer stalls decoding, and the writer blocking on I/O no longer starves the
+pools. Swapping and detection are dominated by ONNX Runtime and OpenCV calls,
+both of which release the GIL, so the pool threads genuinely run in parallel.
+Threads also let every worker share one copy of the models - processes would
+need their own, and the model set is roughly a gigabyte.
+
+Every queue is bounded by the bytes of frame data it holds rather than an item
+count, so a 1080p job and a 480p job both keep a predictable amount of memory
+in flight.
+
+Output order is preserved. Pools finish out of order, so every queue takes
+frames in any order and releases them strictly in sequence. A queue always
+admits the frame its consumer is waiting for, whatever the budget, so later
+frames can never lock out the head of the line - and a frame larger than the
+whole budget still gets through.
+
+Each queue reports its occupancy and how long producers waited for space and
+consumers for work, and each stage its busy time. A queue that stays full
+points at a slow stage after it; one that stays empty at a slow stage before
+it.
 """
 
 import os
-from collections import deque
-from concurrent.futures import ThreadPoolExecutor
-from typing import Callable, Optional
+from threading import Condition, Event, Lock, Thread
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 
@@ -24,10 +46,10 @@ from .observability import get_logger
 
 logger = get_logger("inference.video_swap")
 
-# Frames held in flight per worker. Enough to keep workers fed while the
-# writer drains the head of the queue, low enough that a 1080p job holds
-# tens of megabytes of decoded frames rather than the whole video.
-INFLIGHT_PER_WORKER = 2
+# Default budget per queue. Roughly ten 1080p frames: enough to keep the pools
+# fed while the encoder drains the head of the line, low enough that a job
+# holds tens of megabytes of decoded frames rather than the whole video.
+DEFAULT_QUEUE_MAX_BYTES = 64 * 1024 * 1024
 
 # Auto-sizing cap. Scaling is sub-linear because ONNX Runtime already spreads a
 # single inference across every core, so workers compete for the same threads.
@@ -37,10 +59,18 @@ INFLIGHT_PER_WORKER = 2
 #   speedup   1.00x  1.24x  1.48x  1.60x  1.78x  1.82x
 #
 # Most of the win is in by 4, and this service also serves image swaps - a
-# video job that grabs every core would starve them. Operators with a dedicated
+# video job that grabs every core would starve them. Sessions are now sized
+# by the shared CPU budget (cpu_budget.py), which also caps a job's workers at
+# the video slots it can lease. Operators with a dedicated
 # box can set VIDEO_WORKER_COUNT higher; 6-8 buys another ~10-14% there.
 MAX_AUTO_WORKERS = 4
 
+# Cross-frame batching (VIDEO_BATCH_SIZE) is measured against the table above
+# with eval/bench_video.py, which prints the same workers x speedup grid with a
+# row per batch size.
+
+SwapBatch = Callable[[List[np.ndarray], List[Any]], List[np.ndarray]]
+
 
 def resolve_worker_count(configured: int, cpu_count: Optional[int] = None) -> int:
     """Worker count to use; `configured` <= 0 means auto.
@@ -56,85 +86,357 @@ def resolve_worker_count(configured: int, cpu_count: Optional[int] = None) -> in
     return max(1, min(MAX_AUTO_WORKERS, cores // 2, ceiling))
 
 
+def resolve_detect_worker_count(configured: int, swap_workers: int) -> int:
+    """Detect-pool size; `configured` <= 0 means half the swap pool."""
+    if configured > 0:
+        return configured
+    return max(1, swap_workers // 2)
+
+
+class PipelineAborted(Exception):
+    """Raised in a stage blocked on a queue once another stage has failed."""
+
+
+class VideoCancelled(Exception):
+    """Raised by `swap_video_frames` once its cancel event is set."""
+
+
+class OrderedFrameQueue:
+    """Queue between two stages, bounded by bytes and released in sequence.
+
+    Producers tag each item with its sequence index and may put in any
+    order; `get` hands items out strictly by index. The item `get` is waiting
+    for is always admitted, whatever the budget, so later items can never
+    lock out the head of the line.
+    """
+
+    def __init__(self, name: str, max_bytes: int):
+        self.name = name
+        self._max_bytes = max(1, max_bytes)
+        self._pending: Dict[int, Tuple[Any, int]] = {}
+        self._next = 0
+        self._bytes = 0
+        self._peak_bytes = 0
+        self._put_wait = 0.0
+        self._get_wait = 0.0
+        self._closed = False
+        self._aborted = False
+        self._cond = Condition()
+
+    def put(self, index: int, item: Any, nbytes: int) -> None:
+        with self._cond:
+            start = perf_counter()
+            while (
+                index != self._next
+                and self._pending
+                and self._bytes + nbytes > self._max_bytes
+                and not self._aborted
+            ):
+                self._cond.wait()
+            self._put_wait += perf_counter() - start
+            if self._aborted:
+                raise PipelineAborted()
+            self._pending[index] = (item, nbytes)
+            self._bytes += nbytes
+            self._peak_bytes = max(self._peak_bytes, self._bytes)
+            self._cond.notify_all()
+
+    def get(self) -> Any:
+        """Next item in sequence, or None once closed with nothing left due."""
+        with self._cond:
+            start = perf_counter()
+            while self._next not in self._pending and not self._closed and not self._aborted:
+                self._cond.wait()
+            self._get_wait += perf_counter() - start
+            if self._aborted:
+                raise PipelineAborted()
+            if self._next not in self._pending:
+                return None
+            item, nbytes = self._pending.pop(self._next)
+            self._next += 1
+            self._bytes -= nbytes
+            self._cond.notify_all()
+            return item
+
+    def close(self) -> None:
+        """No more puts; consumers drain what is left and then get None."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def abort(self) -> None:
+        """Wake every waiter with PipelineAborted."""
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "items": len(self._pending),
+                "bytes": self._bytes,
+                "peak_bytes": self._peak_bytes,
+                "max_bytes": self._max_bytes,
+                "put_wait_ms": round(self._put_wait * 1000, 2),
+                "get_wait_ms": round(self._get_wait * 1000, 2),
+            }
+
+
 def swap_video_frames(
     cap,
     writer,
-    swap_frame: Callable[[np.ndarray], np.ndarray],
+    swap_frame: Callable[[np.ndarray, Any], np.ndarray],
     worker_count: int = 1,
     on_progress: Optional[Callable[[int], None]] = None,
     progress_every: int = 30,
+    analyze_frame: Optional[Callable[[np.ndarray], Any]] = None,
+    swap_batch: Optional[SwapBatch] = None,
+    batch_size: int = 1,
+    analyze_workers: int = 1,
+    queue_max_bytes: int = DEFAULT_QUEUE_MAX_BYTES,
+    cancel_event: Optional[Event] = None,
 ) -> int:
     """Swap every frame of `cap` into `writer`. Returns the frame count.
 
-    `on_progress` is called with the number of frames *written*, not submitted,
-    so progress never runs ahead of finished work.
+    `swap_frame` is called as `swap_frame(frame, analysis)`, where `analysis`
+    is whatever `analyze_frame` returned for that frame, or None without one.
+    `analyze_frame` runs on `analyze_workers` threads; keep that at 1 when it
+    is stateful and needs frames in order.
+
+    With `swap_batch` and a `batch_size` above 1, consecutive frames are
+    grouped and each group goes to one `swap_batch(frames, analyses)` call
+    instead, which returns the swapped frames in the same order. That lets
+    the swap run one batched model call across several frames.
+
+    `on_progress` is called from the encode thread with the number of frames
+    *written*, not submitted, so progress never runs ahead of finished work.
+
+    Setting `cancel_event` stops decoding at the next frame and unwinds every
+    stage the same way an error does; the call then raises VideoCancelled.
     """
-    worker_count = max(1, worker_count)
-    cpu_total = os.cpu_count() or 1
-    logger.info(
-        "video_workers",
-        extra={"event": "video_workers", "worker_count": worker_count, "cpu_total": cpu_total},
+    pipeline = _VideoPipeline(
+        cap,
+        writer,
+        swap_frame,
+        worker_count=max(1, worker_count),
+        on_progress=on_progress,
+        progress_every=progress_every,
+        analyze_frame=analyze_frame,
+        swap_batch=swap_batch,
+        batch_size=max(1, batch_size) if swap_batch is not None else 1,
+        analyze_workers=max(1, analyze_workers) if analyze_frame is not None else 0,
+        queue_max_bytes=queue_max_bytes,
+        cancel_event=cancel_event,
     )
-    if worker_count == 1:
-        return _swap_serial(cap, writer, swap_frame, on_progress, progress_every)
-
-    written = 0
-    last_reported = 0
-    pending: deque = deque()
-    max_inflight = worker_count * INFLIGHT_PER_WORKER
-
-    def drain_one() -> None:
-        nonlocal written, last_reported
-        writer.write(pending.popleft().result())
-        written += 1
-        if on_progress and written - last_reported >= progress_every:
-            on_progress(written)
-            last_reported = written
-
-    with ThreadPoolExecutor(
-        max_workers=worker_count, thread_name_prefix="swap"
-    ) as pool:
+    return pipeline.run()
+
+
+def _frames_nbytes(frames: List[np.ndarray]) -> int:
+    return sum(frame.nbytes for frame in frames)
+
+
+class _VideoPipeline:
+    """One run of the decode -> detect -> swap -> encode stages."""
+
+    def __init__(
+        self,
+        cap,
+        writer,
+        swap_frame: Callable[[np.ndarray, Any], np.ndarray],
+        worker_count: int,
+        on_progress: Optional[Callable[[int], None]],
+        progress_every: int,
+        analyze_frame: Optional[Callable[[np.ndarray], Any]],
+        swap_batch: Optional[SwapBatch],
+        batch_size: int,
+        analyze_workers: int,
+        queue_max_bytes: int,
+        cancel_event: Optional[Event] = None,
+    ):
+        self._cap = cap
+        self._cancel_event = cancel_event
+        self._writer = writer
+        self._swap_frame = swap_frame
+        self._swap_batch = swap_batch
+        self._analyze_frame = analyze_frame
+        self._batch_size = batch_size
+        self._on_progress = on_progress
+        self._progress_every = progress_every
+
+        # Every queue releases in order, not just the encoder's: a swap worker
+        # that picked up frames ahead of one still in detection could fill the
+        # encode budget and deadlock against it.
+        self._detect_q = OrderedFrameQueue("detect", queue_max_bytes) if analyze_frame else None
+        self._swap_q = OrderedFrameQueue("swap", queue_max_bytes)
+        self._encode_q = OrderedFrameQueue("encode", queue_max_bytes)
+        self._queues = [q for q in (self._detect_q, self._swap_q, self._encode_q) if q]
+
+        self._workers = {"decode": 1, "detect": analyze_workers, "swap": worker_count, "encode": 1}
+        self._remaining = dict(self._workers)
+        self._busy = {stage: 0.0 for stage in self._workers}
+        self._lock = Lock()
+        self._error: Optional[BaseException] = None
+        self._written = 0
+
+    def run(self) -> int:
+        logger.info(
+            "video_workers",
+            extra={
+                "event": "video_workers",
+                "worker_count": self._workers["swap"],
+                "detect_worker_count": self._workers["detect"],
+                "batch_size": self._batch_size,
+                "cpu_total": os.cpu_count() or 1,
+            },
+        )
+        targets = {
+            "decode": self._decode,
+            "detect": self._detect,
+            "swap": self._swap,
+            "encode": self._encode,
+        }
+        threads = [
+            Thread(
+                target=self._run_stage,
+                args=(stage, targets[stage]),
+                name=f"video-{stage}-{i}",
+                daemon=True,
+            )
+            for stage, count in self._workers.items()
+            for i in range(count)
+        ]
+        for thread in threads:
+            thread.start()
         try:
-            while True:
-                ok, frame = cap.read()
-                if not ok:
-                    break
-                pending.append(pool.submit(swap_frame, frame))
-                if len(pending) >= max_inflight:
-                    drain_one()
-            while pending:
-                drain_one()
-        except BaseException:
-            # Drop whatever hasn't started; the pool's shutdown then only has
-            # to wait for the handful of frames already in flight.
-            for future in pending:
-                future.cancel()
+            for thread in threads:
+                thread.join()
+        except BaseException as exc:
+            self._fail(exc)
+            for thread in threads:
+                thread.join()
             raise
 
-    if on_progress and written != last_reported:
-        on_progress(written)
-    return written
+        self._log_stats("video_pipeline_complete")
+        if self._error is not None:
+            raise self._error
+        return self._written
 
+    def stats(self) -> Dict[str, Any]:
+        """Queue occupancy and per-stage busy time, for logging."""
+        with self._lock:
+            busy = {stage: round(seconds * 1000, 2) for stage, seconds in self._busy.items()}
+        return {
+            "queues": {q.name: q.stats() for q in self._queues},
+            "stage_busy_ms": busy,
+            "frames_written": self._written,
+        }
 
-def _swap_serial(
-    cap,
-    writer,
-    swap_frame: Callable[[np.ndarray], np.ndarray],
-    on_progress: Optional[Callable[[int], None]],
-    progress_every: int,
-) -> int:
-    """Single-threaded path, kept free of pool overhead."""
-    written = 0
-    last_reported = 0
-    while True:
-        ok, frame = cap.read()
-        if not ok:
-            break
-        writer.write(swap_frame(frame))
-        written += 1
-        if on_progress and written - last_reported >= progress_every:
-            on_progress(written)
-            last_reported = written
-    if on_progress and written != last_reported:
-        on_progress(written)
-    return written
+    def _run_stage(self, stage: str, target: Callable[[], None]) -> None:
+        try:
+            target()
+        except PipelineAborted:
+            pass
+        except BaseException as exc:
+            self._fail(exc)
+        finally:
+            self._stage_done(stage)
+
+    def _stage_done(self, stage: str) -> None:
+        with self._lock:
+            self._remaining[stage] -= 1
+            if self._remaining[stage] > 0:
+                return
+        # The last worker of a stage closes the queue it feeds.
+        downstream = {
+            "decode": self._detect_q or self._swap_q,
+            "detect": self._swap_q,
+            "swap": self._encode_q,
+        }.get(stage)
+        if downstream is not None:
+            downstream.close()
+
+    def _fail(self, exc: BaseException) -> None:
+        with self._lock:
+            if self._error is None:
+                self._error = exc
+        for queue in self._queues:
+            queue.abort()
+
+    def _add_busy(self, stage: str, start: float) -> None:
+        elapsed = perf_counter() - start
+        with self._lock:
+            self._busy[stage] += elapsed
+
+    def _decode(self) -> None:
+        first_q = self._detect_q or self._swap_q
+        index = 0
+        frames: List[np.ndarray] = []
+        while True:
+            if self._cancel_event is not None and self._cancel_event.is_set():
+                raise VideoCancelled()
+            start = perf_counter()
+            ok, frame = self._cap.read()
+            self._add_busy("decode", start)
+            if not ok:
+                break
+            frames.append(frame)
+            if len(frames) >= self._batch_size:
+                self._submit(first_q, index, frames)
+                index += 1
+                frames = []
+        if frames:
+            self._submit(first_q, index, frames)
+
+    @staticmethod
+    def _submit(queue: OrderedFrameQueue, index: int, frames: List[np.ndarray]) -> None:
+        queue.put(index, (index, frames, [None] * len(frames)), _frames_nbytes(frames))
+
+    def _detect(self) -> None:
+        while True:
+            job = self._detect_q.get()
+            if job is None:
+                return
+            index, frames, _ = job
+            start = perf_counter()
+            analyses = [self._analyze_frame(frame) for frame in frames]
+            self._add_busy("detect", start)
+            self._swap_q.put(index, (index, frames, analyses), _frames_nbytes(frames))
+
+    def _swap(self) -> None:
+        while True:
+            job = self._swap_q.get()
+            if job is None:
+                return
+            index, frames, analyses = job
+            start = perf_counter()
+            if self._batch_size > 1:
+                swapped = self._swap_batch(frames, analyses)
+            else:
+                swapped = [self._swap_frame(frames[0], analyses[0])]
+            self._add_busy("swap", start)
+            self._encode_q.put(index, swapped, _frames_nbytes(swapped))
+
+    def _encode(self) -> None:
+        last_reported = 0
+        while True:
+            swapped = self._encode_q.get()
+            if swapped is None:
+                break
+            for frame in swapped:
+                start = perf_counter()
+                self._writer.write(frame)
+                self._add_busy("encode", start)
+                self._written += 1
+                if self._written - last_reported >= self._progress_every:
+                    last_reported = self._written
+                    self._report(last_reported)
+        if self._written != last_reported:
+            self._report(self._written)
+
+    def _report(self, written: int) -> None:
+        self._log_stats("video_pipeline_stats")
+        if self._on_progress:
+            self._on_progress(written)
+
+    def _log_stats(self, event: str) -> None:
+        logger.info(event, extra={"event": event, **self.stats()})
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The service is imported as the `service` package from the inference root,
+# as app.py and serve.py do.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,131 @@
+import os
+import time
+
+import numpy as np
+from insightface.app.common import Face
+
+from service import cache_dir
+from service.cache_dir import scan_entries, touch
+from service.face_cache import FaceAnalysisCache
+from service.result_cache import ResultCache
+
+
+def _age(path, seconds):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def _write(path, data=b"x"):
+    with open(path, "wb") as file_obj:
+        file_obj.write(data)
+
+
+def test_scan_entries_orders_by_mtime_and_needs_companion(tmp_path):
+    for key in ("a", "b", "c"):
+        _write(tmp_path / f"{key}.bin", key.encode() * 3)
+        _write(tmp_path / f"{key}.json")
+    _write(tmp_path / "orphan.bin")
+    touch(str(tmp_path / "a.bin"))
+
+    entries = scan_entries(str(tmp_path), ".bin", companion_suffix=".json")
+
+    assert [key for _, key, _ in entries] == ["b", "c", "a"]
+    assert all(size == 3 for _, _, size in entries)
+    # Young enough to be another worker's write in progress.
+    assert (tmp_path / "orphan.bin").exists()
+
+
+def test_scan_entries_removes_only_stale_leftovers(tmp_path):
+    _write(tmp_path / "young.tmp")
+    _write(tmp_path / "old.tmp")
+    _write(tmp_path / "old.bin")
+    _age(tmp_path / "old.tmp", cache_dir.STALE_AGE_S + 60)
+    _age(tmp_path / "old.bin", cache_dir.STALE_AGE_S + 60)
+
+    assert scan_entries(str(tmp_path), ".bin", companion_suffix=".json") == []
+    assert sorted(os.listdir(tmp_path)) == ["young.tmp"]
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=250)
+    cache.put("a", b"a" * 100, "image/png")
+    cache.put("b", b"b" * 100, "image/png")
+    assert cache.get("a").data == b"a" * 100
+
+    cache.put("c", b"c" * 100, "image/png")
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_result_cache_shares_entries_and_budget_across_instances(tmp_path):
+    first = ResultCache(str(tmp_path), max_bytes=250)
+    second = ResultCache(str(tmp_path), max_bytes=250)
+    first.put("a", b"a" * 100, "image/jpeg")
+    first.record_upload("a", ["dataset", "repo", "main", "out.jpg"])
+
+    cached = second.get("a")
+    assert cached.mime_type == "image/jpeg"
+    assert cached.uploads == [["dataset", "repo", "main", "out.jpg"]]
+
+    second.put("b", b"b" * 100, "image/jpeg")
+    # Over budget as a whole: the rescan sees first's entry and evicts it,
+    # the least recently used.
+    second.put("c", b"c" * 100, "image/jpeg")
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".bin")) == [
+        "b.bin",
+        "c.bin",
+    ]
+    assert first.get("a") is None
+
+
+def test_result_cache_expires_unused_entries(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1000, ttl_s=60)
+    cache.put("old", b"o", "image/png")
+    cache.put("new", b"n", "image/png")
+    _age(tmp_path / "old.bin", 120)
+
+    assert cache.get("old") is None
+    assert cache.get("new") is not None
+    assert not (tmp_path / "old.bin").exists()
+    assert cache.stats()["expirations"] == 1
+
+
+def test_result_cache_rescan_drops_expired_entries(tmp_path):
+    ResultCache(str(tmp_path), max_bytes=1000).put("old", b"o", "image/png")
+    _age(tmp_path / "old.bin", 120)
+
+    cache = ResultCache(str(tmp_path), max_bytes=1000, ttl_s=60)
+
+    assert cache.stats()["entries"] == 0
+    assert not (tmp_path / "old.json").exists()
+
+
+def _face(score):
+    return Face(bbox=np.array([0, 0, 10, 10], dtype=np.float32), det_score=score)
+
+
+def test_face_cache_round_trips_through_disk(tmp_path):
+    FaceAnalysisCache(4, disk_dir=str(tmp_path), disk_max_bytes=1 << 20).put("k", [_face(0.5)])
+
+    faces = FaceAnalysisCache(4, disk_dir=str(tmp_path), disk_max_bytes=1 << 20).get("k")
+
+    assert len(faces) == 1
+    assert faces[0].det_score == 0.5
+    np.testing.assert_array_equal(faces[0].bbox, [0, 0, 10, 10])
+
+
+def test_face_cache_disk_tier_evicts_least_recently_used(tmp_path):
+    writer = FaceAnalysisCache(4, disk_dir=str(tmp_path), disk_max_bytes=1 << 20)
+    writer.put("a", [_face(0.1)])
+    entry_bytes = os.path.getsize(tmp_path / "a.npz")
+    writer.put("b", [_face(0.2)])
+
+    # A fresh memory tier, so the hit comes from disk and refreshes "a".
+    reader = FaceAnalysisCache(1, disk_dir=str(tmp_path), disk_max_bytes=2 * entry_bytes + 10)
+    assert reader.get("a") is not None
+    reader.put("c", [_face(0.3)])
+
+    assert sorted(os.listdir(tmp_path)) == [".lock", "a.npz", "c.npz"]
@@ -0,0 +1,63 @@
+import dataclasses
+
+from service import cpu_budget
+from service.cpu_budget import CpuBudget
+from service.settings import get_settings
+
+
+def test_bounded_budget_splits_cores_into_slots():
+    budget = CpuBudget(list(range(8)), threads_per_call=2, image_slots=1)
+
+    assert budget.bounded
+    assert (budget.slots, budget.image_slots, budget.video_slots) == (4, 1, 3)
+    # Image requests keep the first slot's cores.
+    assert budget.worker_cpu_sets(2) == [[2, 3], [4, 5]]
+
+
+def test_bounded_leases_narrow_when_slots_run_out_and_return_on_release():
+    budget = CpuBudget(list(range(8)), threads_per_call=2, image_slots=1)
+
+    first = budget.lease_video_workers(2)
+    second = budget.lease_video_workers(2)
+    # Every slot taken: still one worker, never a wait.
+    third = budget.lease_video_workers(2)
+
+    assert (first.workers, second.workers, third.workers) == (2, 1, 1)
+    assert budget.stats()["video_leases_narrowed"] == 2
+    for lease in (first, second, third):
+        lease.release()
+    first.release()
+    assert budget.stats()["video_slots_in_use"] == 0
+    with budget.lease_video_workers(3) as lease:
+        assert lease.workers == 3
+    assert budget.stats()["video_slots_in_use"] == 0
+
+
+def test_unbounded_budget_grants_every_request_in_full():
+    budget = CpuBudget(list(range(4)), threads_per_call=0, image_slots=2)
+
+    leases = [budget.lease_video_workers(4) for _ in range(3)]
+
+    assert not budget.bounded
+    assert [lease.workers for lease in leases] == [4, 4, 4]
+    assert budget.stats()["video_leases_narrowed"] == 0
+    assert budget.worker_cpu_sets(2) == [[0, 1], [2, 3]]
+
+
+def test_from_settings_is_opt_in(monkeypatch):
+    monkeypatch.setattr(cpu_budget, "available_cores", lambda: list(range(8)))
+    settings = dataclasses.replace(
+        get_settings(), cpu_budget_cores=0, cpu_threads_per_call=0, inference_concurrency=2
+    )
+
+    assert not CpuBudget.from_settings(settings).bounded
+
+    budget = CpuBudget.from_settings(dataclasses.replace(settings, cpu_threads_per_call=2))
+    assert budget.bounded
+    # One core stays out for the event loop.
+    assert budget.cores == list(range(1, 8))
+    assert budget.threads_per_call == 2
+
+    budget = CpuBudget.from_settings(dataclasses.replace(settings, cpu_budget_cores=4))
+    assert budget.cores == [0, 1, 2, 3]
+    assert budget.bounded
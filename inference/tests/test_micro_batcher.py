@@ -0,0 +1,90 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+
+from service.micro_batcher import ModelBatcher
+
+
+class FakeSession:
+    """Doubles its "x" input and records the batch size of every call."""
+
+    def __init__(self, batch_dim="N"):
+        self._batch_dim = batch_dim
+        self._lock = threading.Lock()
+        self.batch_sizes = []
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="x", shape=[self._batch_dim, 3])]
+
+    def run(self, output_names, feed):
+        with self._lock:
+            self.batch_sizes.append(len(feed["x"]))
+        return [feed["x"] * 2]
+
+
+def _feed(value, width=3):
+    return {"x": np.full((1, width), value, dtype=np.float32)}
+
+
+def _run_concurrently(batcher, session, feeds):
+    start = threading.Barrier(len(feeds))
+
+    def call(feed):
+        start.wait()
+        return batcher.run(session, [feed], "y")[0]
+
+    with ThreadPoolExecutor(len(feeds)) as pool:
+        return list(pool.map(call, feeds))
+
+
+def test_concurrent_calls_share_one_batch():
+    batcher = ModelBatcher(max_batch_size=4, max_wait_ms=500)
+    session = FakeSession()
+
+    outputs = _run_concurrently(batcher, session, [_feed(i) for i in range(4)])
+
+    assert session.batch_sizes == [4]
+    for i, output in enumerate(outputs):
+        np.testing.assert_array_equal(output, _feed(i * 2)["x"])
+    assert batcher.stats()["max_batch_size_seen"] == 4
+
+
+def test_calls_of_different_shapes_are_not_batched_together():
+    batcher = ModelBatcher(max_batch_size=2, max_wait_ms=500)
+    session = FakeSession()
+
+    feeds = [_feed(1), _feed(1), _feed(2, width=4), _feed(2, width=4)]
+
+    outputs = _run_concurrently(batcher, session, feeds)
+
+    assert session.batch_sizes == [2, 2]
+    assert [output.shape for output in outputs] == [(1, 3), (1, 3), (1, 4), (1, 4)]
+
+
+def test_fixed_batch_models_and_batch_size_one_bypass_the_queues():
+    session = FakeSession(batch_dim=1)
+    fixed = ModelBatcher(max_batch_size=4, max_wait_ms=500)
+    fixed.run(session, [_feed(1), _feed(2)], "y")
+    disabled = ModelBatcher(max_batch_size=1, max_wait_ms=500)
+    disabled.run(FakeSession(), [_feed(1)], "y")
+
+    assert session.batch_sizes == [1, 1]
+    assert fixed.stats()["batches"] == 0
+    assert disabled.stats()["batches"] == 0
+
+
+def test_forget_session_closes_its_queues():
+    batcher = ModelBatcher(max_batch_size=2, max_wait_ms=0)
+    kept, evicted = FakeSession(), FakeSession()
+    batcher.run(kept, [_feed(1)], "y")
+    batcher.run(evicted, [_feed(1)], "y")
+    evicted_queue = next(q for key, q in batcher._queues.items() if key[0] == id(evicted))
+
+    batcher.forget_session(evicted)
+
+    assert [key[0] for key in batcher._queues] == [id(kept)]
+    assert evicted_queue._closed
+    # A later call simply opens a fresh queue.
+    np.testing.assert_array_equal(batcher.run(evicted, [_feed(3)], "y")[0], _feed(6)["x"])
@@ -0,0 +1,131 @@
+import dataclasses
+import os
+import threading
+
+import pytest
+
+from service import model_registry
+from service.model_registry import (
+    LOAD_EVICTED,
+    MODEL_GPEN,
+    MODEL_HYPERSWAP,
+    MODEL_OCCLUDER,
+    ModelRegistry,
+)
+from service.settings import get_settings
+
+MB = 1024 * 1024
+
+
+class FakeSession:
+    def __init__(self, path):
+        self.path = path
+
+
+@pytest.fixture
+def make_registry(tmp_path, monkeypatch):
+    """A registry whose models are 1 MB files and whose sessions are stubs."""
+    monkeypatch.setattr(
+        model_registry, "create_session", lambda path, *args, **kwargs: FakeSession(path)
+    )
+
+    def make(**overrides):
+        settings = dataclasses.replace(
+            get_settings(),
+            local_model_dir=str(tmp_path),
+            model_manifest_path=str(tmp_path / "manifest.json"),
+            model_precision="fp32",
+            occlusion_mask_enabled=True,
+            **overrides,
+        )
+        registry = ModelRegistry(settings)
+
+        def download(filename):
+            path = os.path.join(str(tmp_path), filename)
+            with open(path, "wb") as file_obj:
+                file_obj.truncate(MB)
+            return path
+
+        registry._download_model = download
+        return registry
+
+    return make
+
+
+def test_memory_budget_evicts_the_least_recently_used_model(make_registry):
+    registry = make_registry(model_memory_budget_mb=2)
+    evicted = []
+    registry.add_eviction_listener(evicted.append)
+    with registry.lease(MODEL_GPEN) as gpen:
+        pass
+    with registry.lease(MODEL_HYPERSWAP):
+        pass
+
+    with registry.lease(MODEL_OCCLUDER) as occluder:
+        assert occluder is not None
+
+    assert evicted == [gpen]
+    memory = registry.resident_memory()
+    assert sorted(memory["models"]) == [MODEL_HYPERSWAP, MODEL_OCCLUDER]
+    assert memory["evictions"][MODEL_GPEN] == 1
+    assert registry.load_states()["models"][MODEL_GPEN]["state"] == LOAD_EVICTED
+
+
+def test_a_leased_model_is_never_evicted(make_registry):
+    registry = make_registry(model_memory_budget_mb=2)
+    with registry.lease(MODEL_GPEN) as gpen:
+        with registry.lease(MODEL_HYPERSWAP):
+            pass
+        # GPEN is the older, but still leased: hyperswap goes instead.
+        registry.get_occluder_session()
+
+        assert registry.get_gpen_session() is gpen
+    assert registry.resident_memory()["evictions"][MODEL_HYPERSWAP] == 1
+
+
+def test_over_budget_load_goes_ahead_when_nothing_can_be_evicted(make_registry):
+    registry = make_registry(model_memory_budget_mb=1)
+    with registry.lease(MODEL_GPEN), registry.lease(MODEL_HYPERSWAP) as hyperswap:
+        assert hyperswap is not None
+
+    assert registry.resident_memory()["resident_model_mb"] == 2.0
+
+
+def test_pinned_models_are_not_evicted(make_registry):
+    registry = make_registry(model_memory_budget_mb=1, model_idle_timeout_s=1)
+    registry.get_gpen_session()
+    registry.pin_resident()
+    registry._last_used[MODEL_GPEN] -= 60
+
+    registry.get_hyperswap_session()
+
+    assert registry.evict_idle() == []
+    assert registry.resident_memory()["evictions"][MODEL_GPEN] == 0
+
+
+def test_idle_eviction_waits_for_the_last_lease_and_reloads_on_demand(make_registry):
+    registry = make_registry(model_idle_timeout_s=30)
+    leased = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with registry.lease(MODEL_GPEN):
+            leased.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    assert leased.wait(5)
+    registry._last_used[MODEL_GPEN] -= 60
+    assert registry.evict_idle() == []
+
+    release.set()
+    holder.join()
+    # The idle time restarts when the lease closes.
+    assert registry.evict_idle() == []
+    first = registry.get_gpen_session()
+    registry._last_used[MODEL_GPEN] -= 60
+    assert registry.evict_idle() == [MODEL_GPEN]
+
+    with registry.lease(MODEL_GPEN) as reloaded:
+        assert reloaded is not None and reloaded is not first
@@ -0,0 +1,170 @@
+import os
+import threading
+
+import pytest
+
+from service.video_jobs import (
+    JOB_CANCELLED,
+    JOB_COMPLETED,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    JobQueueFull,
+    JobStore,
+    VideoJobManager,
+    job_view,
+)
+from service.video_swap import VideoCancelled
+
+WAIT_S = 5
+
+
+class Runner:
+    """Job runner that holds each job until `release` is set."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.ran = []
+
+    def __call__(self, job_id, spec, job_dir, on_progress, cancel_event):
+        self.ran.append(job_id)
+        self.started.set()
+        while not self.release.wait(0.01):
+            on_progress(1, 10)
+            if cancel_event.is_set():
+                raise VideoCancelled()
+        return {"processed_frames": 10}
+
+
+def _record(job_dir, job_id, owner, status=JOB_QUEUED):
+    store = JobStore(os.path.join(job_dir, "jobs.sqlite3"))
+    os.makedirs(os.path.join(job_dir, job_id))
+    store.create(job_id, {}, owner)
+    if status != JOB_QUEUED:
+        store.transition(job_id, JOB_QUEUED, status)
+
+
+def _submit(manager):
+    job_id = manager.new_job_id()
+    manager.submit(job_id, {})
+    return job_id
+
+
+def _wait_for(manager, job_id, status):
+    for _ in range(WAIT_S * 100):
+        if manager.get(job_id)["status"] == status:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError(f"{job_id} is {manager.get(job_id)['status']}, not {status}")
+
+
+def test_recovers_only_its_own_jobs(tmp_path):
+    _record(str(tmp_path), "mine", "worker-0", JOB_RUNNING)
+    _record(str(tmp_path), "theirs", "worker-1")
+    runner = Runner()
+    runner.release.set()
+
+    manager = VideoJobManager(str(tmp_path), runner, 1, 4, owner="worker-0")
+    _wait_for(manager, "mine", JOB_COMPLETED)
+    manager.drain(WAIT_S)
+
+    assert runner.ran == ["mine"]
+    assert manager.get("theirs")["status"] == JOB_QUEUED
+    assert (tmp_path / "theirs").is_dir()
+
+
+def test_job_without_inputs_fails_on_recovery(tmp_path):
+    _record(str(tmp_path), "gone", "worker-0")
+    os.rmdir(tmp_path / "gone")
+
+    manager = VideoJobManager(str(tmp_path), Runner(), 1, 4, owner="worker-0")
+    manager.drain(WAIT_S)
+
+    assert manager.get("gone")["status"] == JOB_FAILED
+
+
+def test_adopts_jobs_of_owners_that_no_longer_exist(tmp_path):
+    _record(str(tmp_path), "removed-slot", "worker-3")
+    _record(str(tmp_path), "live-slot", "worker-1")
+    runner = Runner()
+    runner.release.set()
+
+    manager = VideoJobManager(
+        str(tmp_path), runner, 1, 4, owner="worker-0", live_owners=["worker-0", "worker-1"]
+    )
+    _wait_for(manager, "removed-slot", JOB_COMPLETED)
+    manager.drain(WAIT_S)
+
+    assert runner.ran == ["removed-slot"]
+    assert manager.get("removed-slot")["owner"] == "worker-0"
+    assert manager.get("live-slot")["status"] == JOB_QUEUED
+
+
+def test_cancel_from_another_worker_reaches_a_running_job(tmp_path):
+    runner = Runner()
+    owner = VideoJobManager(str(tmp_path), runner, 1, 4, owner="worker-0")
+    other = VideoJobManager(str(tmp_path), Runner(), 1, 4, owner="worker-1")
+    job_id = _submit(owner)
+    assert runner.started.wait(WAIT_S)
+
+    view = job_view(other.cancel(job_id))
+
+    assert view["status"] == JOB_RUNNING
+    assert view["cancel_pending"] is True
+    _wait_for(owner, job_id, JOB_CANCELLED)
+    assert job_view(owner.get(job_id))["cancel_pending"] is False
+    owner.drain(WAIT_S)
+    other.drain(WAIT_S)
+
+
+def test_cancel_from_another_worker_drops_a_queued_job(tmp_path):
+    runner = Runner()
+    owner = VideoJobManager(str(tmp_path), runner, 1, 4, owner="worker-0")
+    other = VideoJobManager(str(tmp_path), Runner(), 1, 4, owner="worker-1")
+    first = _submit(owner)
+    assert runner.started.wait(WAIT_S)
+    queued = _submit(owner)
+
+    assert other.cancel(queued)["status"] == JOB_CANCELLED
+    runner.release.set()
+    _wait_for(owner, first, JOB_COMPLETED)
+    owner.drain(WAIT_S)
+    other.drain(WAIT_S)
+
+    assert runner.ran == [first]
+
+
+def test_drain_finishes_running_jobs_and_leaves_queued_ones(tmp_path):
+    runner = Runner()
+    manager = VideoJobManager(str(tmp_path), runner, 1, 4, owner="worker-0")
+    running = _submit(manager)
+    assert runner.started.wait(WAIT_S)
+    queued = _submit(manager)
+
+    threading.Timer(0.1, runner.release.set).start()
+    manager.drain(WAIT_S)
+
+    assert manager.get(running)["status"] == JOB_COMPLETED
+    assert manager.get(queued)["status"] == JOB_QUEUED
+    assert (tmp_path / queued).is_dir()
+    with pytest.raises(JobQueueFull):
+        manager.submit(manager.new_job_id(), {})
+
+    # The slot's next worker picks it up.
+    successor = VideoJobManager(str(tmp_path), runner, 1, 4, owner="worker-0")
+    _wait_for(successor, queued, JOB_COMPLETED)
+    successor.drain(WAIT_S)
+
+
+def test_full_queue_asks_for_a_retry(tmp_path):
+    runner = Runner()
+    manager = VideoJobManager(str(tmp_path), runner, 1, 0, owner="worker-0")
+    _submit(manager)
+
+    with pytest.raises(JobQueueFull) as exc_info:
+        manager.submit(manager.new_job_id(), {})
+
+    assert exc_info.value.retry_after > 0
+    runner.release.set()
+    manager.drain(WAIT_S)